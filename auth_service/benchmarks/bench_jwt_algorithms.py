@@ -0,0 +1,65 @@
+"""
+Sign/verify throughput per core for each supported JWT algorithm.
+
+Uses the same code path as the service (`core.keyring.load_key` + `utils.jwt.sign_claims`
+for signing, PyJWT with a pre-parsed key for verification) on a single thread, so the
+numbers are "operations per second per core".
+
+Run from `auth_service/`:
+    TESTING=1 PYTHONPATH=src python benchmarks/bench_jwt_algorithms.py [--seconds 2]
+"""
+
+import argparse
+import time
+import uuid
+
+import jwt
+from core.config import JWT_KEY_TYPES
+from core.keyring import generate_key_pem, load_key
+from utils.jwt import sign_claims
+
+
+def _rate(fn, seconds: float) -> float:
+    n = 0
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    while time.perf_counter() < deadline:
+        for _ in range(20):
+            fn()
+        n += 20
+    return n / (time.perf_counter() - start)
+
+
+def bench(algorithm: str, seconds: float) -> tuple[float, float, int]:
+    private_pem, public_pem = generate_key_pem(algorithm)
+    key = load_key(public_pem, private_pem, algorithm)
+    claims = {
+        "sub": str(uuid.uuid4()),
+        "email": "user@example.com",
+        "exp": int(time.time()) + 900,
+        "type": "access",
+        "jti": str(uuid.uuid4()),
+    }
+    token = sign_claims(claims, key)
+
+    sign_rate = _rate(lambda: sign_claims(claims, key), seconds)
+    verify_rate = _rate(
+        lambda: jwt.decode(token, key.public_key, algorithms=[algorithm]),
+        seconds,
+    )
+    return sign_rate, verify_rate, len(token)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--seconds", type=float, default=2.0, help="Duration per measurement")
+    args = parser.parse_args()
+
+    print(f"{'alg':<8}{'sign/s':>12}{'verify/s':>12}{'token bytes':>14}")
+    for algorithm in JWT_KEY_TYPES:
+        sign_rate, verify_rate, size = bench(algorithm, args.seconds)
+        print(f"{algorithm:<8}{sign_rate:>12,.0f}{verify_rate:>12,.0f}{size:>14}")
+
+
+if __name__ == "__main__":
+    main()
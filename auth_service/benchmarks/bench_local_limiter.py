@@ -0,0 +1,122 @@
+"""
+Rate-limit checks with and without the local tier (RATE_LIMIT_LOCAL_BATCH).
+
+Simulates `--workers` worker processes in one process: each has its own LocalRateLimiter
+(with its background sync running) and calls `check_rate_limit`, the middleware's check,
+against a shared Redis (`--redis-url`):
+
+1. Throughput: `--n` checks over `--subjects` clients that stay under their limit
+   (default 1000/60 s). Reports checks/s, p99 and Redis calls per 100 requests (the
+   background sync included).
+2. Overshoot: one request from one client on every worker, then `--burst` concurrent
+   requests from it spread over the workers, with a limit of `--limit`. Reports how many got
+   through in total vs the bound, limit + workers x batch.
+
+Run from `auth_service/`:
+    TESTING=1 PYTHONPATH=src python benchmarks/bench_local_limiter.py \\
+        --redis-url redis://localhost:6379/15 [--batch 20] [--workers 4] [--algorithm gcra]
+"""
+
+import argparse
+import asyncio
+import time
+
+import redis.asyncio as redis
+from middleware.local_limiter import LocalRateLimiter, admitted_locally
+from middleware.rate_limit import (
+    RateRule,
+    check_rate_limit,
+    load_rate_limit_scripts,
+    sync_rate_limits,
+)
+
+calls = 0
+
+
+async def counted_sync(r, batch, now_ms):
+    global calls
+    calls += 1
+    return await sync_rate_limits(r, batch, now_ms)
+
+
+async def run(r, workers, rule, n: int, subjects: int, concurrency: int):
+    global calls
+    latencies: list[float] = []
+    calls, local_before = 0, admitted_locally.value
+
+    async def client(offset: int) -> None:
+        for i in range(offset, n, concurrency):
+            start = time.perf_counter()
+            key = f"rl:bench:local:{i % subjects}"
+            await check_rate_limit(r, rule, key, int(time.time() * 1000), workers[i % len(workers)])
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    redis_checks = n - (admitted_locally.value - local_before)
+    return n / elapsed, latencies[int(n * 0.99)], (redis_checks + calls) * 100 / n
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--redis-url", default="redis://localhost:6379/15")
+    parser.add_argument("--n", type=int, default=20000)
+    parser.add_argument("--subjects", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch", type=int, default=20)
+    parser.add_argument("--sync-ms", type=int, default=250)
+    parser.add_argument("--algorithm", default="gcra", choices=["log", "gcra"])
+    parser.add_argument("--burst", type=int, default=400)
+    parser.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args()
+
+    r = redis.from_url(args.redis_url, decode_responses=True)
+    await load_rate_limit_scripts(r)
+    rule = RateRule(".*", 1000, 60, args.algorithm)
+    burst_rule = RateRule(".*", args.limit, 60, args.algorithm)
+    print(
+        f"workers={args.workers} sync={args.sync_ms}ms algorithm={args.algorithm} "
+        f"subjects={args.subjects} concurrency={args.concurrency}"
+    )
+    print(f"{'batch':<8}{'checks/s':>10}{'p99':>10}{'redis/100':>11}{'burst ok':>10}{'bound':>7}")
+    try:
+        for batch in (0, args.batch):
+            workers = [
+                LocalRateLimiter(batch, args.sync_ms, counted_sync) for _ in range(args.workers)
+            ]
+            for worker in workers:
+                await worker.start(r)
+            await r.delete(*[f"rl:bench:local:{i}" for i in range(args.subjects)])
+            rate, p99, per_100 = await run(
+                r, workers, rule, args.n, args.subjects, args.concurrency
+            )
+
+            key = "rl:bench:local:burst"
+            await r.delete(key)
+            for worker in workers:  # every worker has seen the client: worst case
+                await check_rate_limit(r, burst_rule, key, int(time.time() * 1000), worker)
+            results = await asyncio.gather(
+                *(
+                    check_rate_limit(
+                        r, burst_rule, key, int(time.time() * 1000), workers[i % args.workers]
+                    )
+                    for i in range(args.burst)
+                )
+            )
+            for worker in workers:
+                await worker.stop(r)
+            allowed = args.workers + sum(a for a, _, _ in results)
+            bound = args.limit + args.workers * batch
+            print(
+                f"{batch:<8}{rate:>10,.0f}{p99 * 1000:>8.2f}ms{per_100:>11.1f}"
+                f"{allowed:>10}{bound:>7}"
+            )
+    finally:
+        await r.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
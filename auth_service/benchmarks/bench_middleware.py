@@ -0,0 +1,189 @@
+"""
+Middleware overhead: BaseHTTPMiddleware (before) vs the pure ASGI RequestIDMiddleware and
+RateLimiterMiddleware (after).
+
+Drives the ASGI app directly (no HTTP client or server in the way), `--concurrency`
+requests at a time, on:
+
+- /api/v1/healthz       whitelisted by the rate limiter: only the middleware hops
+- /api/v1/user_roles/me one rate-limit check per request; the principal and DB session
+                        dependencies are stubbed so both variants run the same handler
+
+The rate-limit check runs against `--redis-url` behind a local tier with a large batch, so
+almost every check is answered in-process and the numbers reflect the middleware, not Redis.
+
+Run from `auth_service/`:
+    TESTING=1 PYTHONPATH=src python benchmarks/bench_middleware.py \\
+        --redis-url redis://localhost:6379/15 [--n 20000] [--concurrency 1 32]
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+import uuid
+
+import middleware.rate_limit as rate_limit
+import redis.asyncio as redis
+from api.v1 import health, user_roles
+from core.config import settings
+from core.logging import request_id_ctx
+from db.postgres import get_session
+from fastapi import FastAPI
+from middleware.local_limiter import LocalRateLimiter
+from middleware.rate_limit import (
+    RateLimiterMiddleware,
+    RateRule,
+    check_rate_limit,
+    client_ip,
+    load_rate_limit_scripts,
+    sync_rate_limits,
+)
+from middleware.request_id import RequestIDMiddleware
+from schemas.user import CurrentUserResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import JSONResponse
+from utils.dependencies import get_current_principal
+
+logger = logging.getLogger("app")
+
+
+class LegacyRequestIDMiddleware(BaseHTTPMiddleware):
+    """RequestIDMiddleware as it was."""
+
+    async def dispatch(self, request, call_next):
+        request_id = request.headers.get("x-request-id", str(uuid.uuid4()))
+        request_id_ctx.set(request_id)
+
+        logger.info(f"Request {request.method} {request.url.path}")
+        response = await call_next(request)
+        logger.info(f"Response {response.status_code}")
+
+        response.headers["x-request-id"] = request_id
+        return response
+
+
+class LegacyRateLimiterMiddleware(BaseHTTPMiddleware):
+    """RateLimiterMiddleware as it was, with today's Redis check."""
+
+    def __init__(self, app, rules, whitelist_paths):
+        super().__init__(app)
+        self.rules = rules
+        self.whitelist = set(whitelist_paths)
+
+    async def dispatch(self, request, call_next):
+        if request.url.path in self.whitelist:
+            return await call_next(request)
+        rule = next(r for r in self.rules if r.pattern.match(request.url.path))
+        ident = f"ip:{client_ip(request.scope)}"
+        key = f"rl:{rule.algorithm}:{rule.limit}:{rule.window}:{ident}:{request.url.path}"
+        now_ms = int(time.time() * 1000)
+        allowed, remaining, reset_ms = await check_rate_limit(
+            request.app.state.redis, rule, key, now_ms
+        )
+        headers = {
+            "X-RateLimit-Limit": str(rule.limit),
+            "X-RateLimit-Remaining": str(remaining),
+            "X-RateLimit-Reset": str(reset_ms // 1000),
+        }
+        if not allowed:
+            return JSONResponse(status_code=429, content={}, headers=headers)
+        response = await call_next(request)
+        response.headers.update(headers)
+        return response
+
+
+def make_app(r, legacy: bool) -> FastAPI:
+    app = FastAPI()
+    app.include_router(health.router, prefix="/api/v1")
+    app.include_router(user_roles.router, prefix="/api/v1/user_roles")
+    principal = CurrentUserResponse(user_id=uuid.uuid4(), username="bench", email=None, roles=[])
+    app.dependency_overrides[get_current_principal] = lambda: principal
+    app.dependency_overrides[get_session] = lambda: None
+    app.state.redis = r
+
+    rules = [RateRule(r"^/api/v1/.*", 10**6, 60, "gcra")]
+    whitelist = ["/api/v1/healthz"]
+    if legacy:
+        app.add_middleware(LegacyRateLimiterMiddleware, rules=rules, whitelist_paths=whitelist)
+        app.add_middleware(LegacyRequestIDMiddleware)
+    else:
+        app.add_middleware(RateLimiterMiddleware, rules=rules, whitelist_paths=whitelist)
+        app.add_middleware(RequestIDMiddleware)
+    return app
+
+
+async def call(app, path: str) -> int:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"bench")],
+        "client": ("10.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+    status = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def run(app, path: str, n: int, concurrency: int) -> tuple[float, float]:
+    latencies: list[float] = []
+
+    async def worker(offset: int) -> None:
+        for _ in range(offset, n, concurrency):
+            start = time.perf_counter()
+            assert await call(app, path) == 200
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return n / elapsed, latencies[int(n * 0.99)]
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--redis-url", default="redis://localhost:6379/15")
+    parser.add_argument("--n", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 32])
+    args = parser.parse_args()
+
+    settings.testing = False  # the rate limiter is bypassed in test mode
+    logging.getLogger("app").setLevel(logging.WARNING)
+    r = redis.from_url(args.redis_url, decode_responses=True)
+    await load_rate_limit_scripts(r)
+    rate_limit.local_limiter = LocalRateLimiter(1000, 250, sync_rate_limits)
+    await rate_limit.local_limiter.start(r)
+    apps = {"before": make_app(r, legacy=True), "after": make_app(r, legacy=False)}
+    try:
+        print(f"{'path':<24}{'variant':<9}{'conc':>5}{'req/s':>10}{'p99':>10}")
+        for path in ("/api/v1/healthz", "/api/v1/user_roles/me"):
+            for concurrency in args.concurrency:
+                for name, app in apps.items():
+                    await run(app, path, min(args.n, 1000), concurrency)  # warm up
+                    rps, p99 = await run(app, path, args.n, concurrency)
+                    print(f"{path:<24}{name:<9}{concurrency:>5}{rps:>10,.0f}{p99 * 1000:>8.2f}ms")
+    finally:
+        await rate_limit.local_limiter.stop(r)
+        await r.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,109 @@
+"""
+Login password checks (bcrypt) on the event loop vs the password executor.
+
+Runs `--n` concurrent verify_password_async calls per PASSWORD_HASH_MODE while a probe task
+sleeps 5 ms in a loop, standing in for every other request on the worker:
+
+- inline:  bcrypt runs on the event loop; the probe (i.e. every other request) stalls
+- thread:  a thread pool; bcrypt releases the GIL, so verifies run on all cores
+- process: a process pool; same, without sharing the GIL at all
+
+Reports verifies/s and the probe's worst wake-up delay (how long other requests waited).
+
+Then a burst of `--burst` logins against the thread pool, without and with admission control
+(`--max-queue`, `--max-wait`): how many were served, how many got an immediate 503, and the
+p50/p99 latency of the served ones.
+
+Run from `auth_service/` (no Postgres or Redis needed):
+    TESTING=1 PYTHONPATH=src python benchmarks/bench_password_hash.py [--n 64] [--workers 0] \\
+        [--burst 200] [--max-queue 8] [--max-wait 1.0]
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+import utils.security as security
+from fastapi import HTTPException
+from utils.executor import BoundedExecutor
+
+
+async def measure(n: int, hashed: str) -> tuple[float, float]:
+    worst = 0.0
+    done = False
+
+    async def probe():
+        nonlocal worst
+        while not done:
+            start = time.perf_counter()
+            await asyncio.sleep(0.005)
+            worst = max(worst, time.perf_counter() - start - 0.005)
+
+    probe_task = asyncio.create_task(probe())
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    await asyncio.gather(*(security.verify_password_async("s3cret", hashed) for _ in range(n)))
+    elapsed = time.perf_counter() - start
+    done = True
+    await probe_task
+    return n / elapsed, worst
+
+
+async def burst(n: int, hashed: str) -> tuple[int, int, float, float]:
+    async def login() -> float | None:
+        start = time.perf_counter()
+        try:
+            await security.verify_password_async("s3cret", hashed)
+        except HTTPException:
+            return None
+        return time.perf_counter() - start
+
+    results = await asyncio.gather(*(login() for _ in range(n)))
+    served = sorted(r for r in results if r is not None)
+    if not served:
+        return 0, n, 0.0, 0.0
+    return len(served), n - len(served), served[len(served) // 2], served[int(len(served) * 0.99)]
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--n", type=int, default=64, help="Concurrent verifies per mode")
+    parser.add_argument("--workers", type=int, default=0, help="Pool size (0 = CPU count)")
+    parser.add_argument("--burst", type=int, default=200, help="Concurrent logins in the burst")
+    parser.add_argument("--max-queue", type=int, default=8)
+    parser.add_argument("--max-wait", type=float, default=1.0)
+    args = parser.parse_args()
+
+    hashed = security.hash_password("s3cret")
+    print(f"cpus={os.cpu_count()} n={args.n} rounds={hashed.split('$')[2]}")
+    print(f"{'mode':<10}{'verifies/s':>12}{'worst stall':>14}")
+    for mode in ("inline", "thread", "process"):
+        security.password_executor = BoundedExecutor(
+            f"bench_pw_{mode}", mode, max_workers=args.workers
+        )
+        await security.verify_password_async("s3cret", hashed)  # start the pool
+        rate, worst = await measure(args.n, hashed)
+        security.password_executor.shutdown()
+        print(f"{mode:<10}{rate:>12,.1f}{worst * 1000:>11,.0f} ms")
+
+    print(f"\nburst={args.burst} (thread pool)")
+    print(f"{'gate':<26}{'served':>8}{'503':>6}{'p50':>10}{'p99':>10}")
+    for label, max_queue, max_wait in (
+        ("unbounded", 0, 0.0),
+        (f"queue={args.max_queue} wait={args.max_wait}s", args.max_queue, args.max_wait),
+    ):
+        security.password_executor = BoundedExecutor(
+            f"bench_pw_gate_{max_queue}",
+            "thread",
+            max_workers=args.workers,
+            max_queue=max_queue,
+            max_wait_sec=max_wait,
+        )
+        served, shed, p50, p99 = await burst(args.burst, hashed)
+        security.password_executor.shutdown()
+        print(f"{label:<26}{served:>8}{shed:>6}{p50:>9.2f}s{p99:>9.2f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,148 @@
+"""
+Rate-limit checks: the previous pipeline flow vs the per-algorithm Lua scripts.
+
+All variants run against a real Redis server (`--redis-url`) with the middleware's key and
+member format; only the Redis work of one request is timed:
+
+- before: pipeline(ZREMRANGEBYSCORE, ZCARD) -> pipeline(ZADD, EXPIRE, ZCARD)
+          -> ZRANGE for X-RateLimit-Reset              3 round trips (2 when limited)
+- log:    EVALSHA SLIDING_LOG_LUA                      1 round trip, ZSET of requests
+- gcra:   EVALSHA GCRA_LUA                             1 round trip, one value
+
+Reports checks/s and p50/p99 latency at each `--concurrency`, with `--subjects` clients
+spread over the requests. Then a burst of `--burst` concurrent requests from one client
+with a limit of `--limit`: how many got through (the old check-then-add lets them overshoot).
+Last, the state one client leaves after a full window (100 requests): stored payload and
+MEMORY USAGE (skip the latter with `--no-memory-usage` where the server lacks the command).
+
+Run from `auth_service/`:
+    TESTING=1 PYTHONPATH=src python benchmarks/bench_rate_limit.py \\
+        --redis-url redis://localhost:6379/15 [--n 5000] [--concurrency 1 32]
+"""
+
+import argparse
+import asyncio
+import time
+import uuid
+
+import redis.asyncio as redis
+from middleware.rate_limit import (
+    GCRA_LUA,
+    SLIDING_LOG_LUA,
+    RateRule,
+    _script_args,
+    load_rate_limit_scripts,
+)
+
+WINDOW_MS = 60_000
+
+
+async def legacy_check(r, key: str, limit: int) -> bool:
+    """The middleware's Redis calls as they were before the script."""
+    now_ms = int(time.time() * 1000)
+    pipe = r.pipeline(transaction=False)
+    pipe.zremrangebyscore(key, 0, now_ms - WINDOW_MS)
+    pipe.zcard(key)
+    _, count = await pipe.execute()
+    if count >= limit:
+        await r.zrange(key, 0, 0, withscores=True)
+        return False
+    pipe = r.pipeline(transaction=False)
+    pipe.zadd(key, {f"{now_ms}-{uuid.uuid4().hex}": now_ms})
+    pipe.expire(key, WINDOW_MS // 1000)
+    pipe.zcard(key)
+    await pipe.execute()
+    await r.zrange(key, 0, 0, withscores=True)
+    return True
+
+
+async def script_check(r, key: str, limit: int) -> bool:
+    rule = RateRule(".*", limit, WINDOW_MS // 1000, "log")
+    allowed, _, _ = await r.register_script(SLIDING_LOG_LUA)(
+        keys=[key], args=_script_args(rule, int(time.time() * 1000), 1)
+    )
+    return bool(allowed)
+
+
+async def gcra_check(r, key: str, limit: int) -> bool:
+    rule = RateRule(".*", limit, WINDOW_MS // 1000, "gcra")
+    allowed, _, _ = await r.register_script(GCRA_LUA)(
+        keys=[key], args=_script_args(rule, int(time.time() * 1000), 1)
+    )
+    return bool(allowed)
+
+
+async def state_size(r, key: str, memory_usage: bool) -> tuple[int, int | None]:
+    """Stored payload (members + 8 bytes per score, or the string) and MEMORY USAGE."""
+    if await r.type(key) == "zset":
+        payload = sum(len(m) + 8 for m in await r.zrange(key, 0, -1))
+    else:
+        payload = len(await r.get(key))
+    return payload, await r.memory_usage(key) if memory_usage else None
+
+
+async def run(r, check, n: int, concurrency: int, subjects: int) -> tuple[float, float, float]:
+    latencies: list[float] = []
+
+    async def worker(offset: int) -> None:
+        for i in range(offset, n, concurrency):
+            start = time.perf_counter()
+            await check(r, f"rl:bench:ip:10.0.{i % subjects}:/api/v1/x", 100)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return n / elapsed, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--redis-url", default="redis://localhost:6379/15")
+    parser.add_argument("--n", type=int, default=5000, help="Checks per variant")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 32])
+    parser.add_argument("--subjects", type=int, default=1000, help="Distinct clients")
+    parser.add_argument("--burst", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--no-memory-usage", action="store_true", help="Skip MEMORY USAGE")
+    args = parser.parse_args()
+
+    r = redis.from_url(args.redis_url, decode_responses=True)
+    await load_rate_limit_scripts(r)
+    variants = {"before": legacy_check, "log": script_check, "gcra": gcra_check}
+    try:
+        print(f"{'variant':<10}{'conc':>6}{'checks/s':>12}{'p50':>10}{'p99':>10}")
+        for concurrency in args.concurrency:
+            for name, check in variants.items():
+                await r.delete(*[f"rl:bench:ip:10.0.{i}:/api/v1/x" for i in range(args.subjects)])
+                rate, p50, p99 = await run(r, check, args.n, concurrency, args.subjects)
+                print(
+                    f"{name:<10}{concurrency:>6}{rate:>12,.0f}"
+                    f"{p50 * 1000:>8.2f}ms{p99 * 1000:>8.2f}ms"
+                )
+
+        print(f"\nburst={args.burst} limit={args.limit} (one client)")
+        for name, check in variants.items():
+            key = f"rl:bench:burst:{name}"
+            await r.delete(key)
+            results = await asyncio.gather(*(check(r, key, args.limit) for _ in range(args.burst)))
+            print(f"{name:<10}{sum(results):>4} allowed")
+            await r.delete(key)
+
+        print("\nstate per client after 100 requests (limit 100)")
+        print(f"{'variant':<10}{'payload':>10}{'memory':>10}")
+        for name in ("log", "gcra"):
+            key = f"rl:bench:state:{name}"
+            await r.delete(key)
+            for _ in range(100):
+                await variants[name](r, key, 100)
+            payload, memory = await state_size(r, key, not args.no_memory_usage)
+            print(f"{name:<10}{payload:>8} B{memory if memory is not None else '-':>8} B")
+            await r.delete(key)
+    finally:
+        await r.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
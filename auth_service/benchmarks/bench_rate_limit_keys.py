@@ -0,0 +1,97 @@
+"""
+Rate-limit rule lookup and key cardinality: raw paths (before) vs route templates (after).
+
+Uses the service's routers and rate-limit rules, without Redis or handlers:
+
+1. Lookup: time to pick the rule and key for one request, `--n` times, over
+   - repeated paths   a fixed mix of login, /users/{id}, OAuth and unmatched paths
+   - distinct paths   DELETE /api/v1/users/{random uuid} (every path is new)
+   "before" is the old `_pick_rule` (regexes in order, a new default RateRule when none
+   matches); "after" is `RateLimiterMiddleware._resolve`, memoized per method and path.
+2. Keys: Redis keys one client creates with `--n` requests to /api/v1/users/{random uuid}.
+
+Run from `auth_service/`:
+    TESTING=1 PYTHONPATH=src python benchmarks/bench_rate_limit_keys.py [--n 100000]
+"""
+
+import argparse
+import time
+import uuid
+
+from api.v1 import auth, health, oauth, roles, user_roles, users
+from fastapi import FastAPI
+from middleware.rate_limit import RateLimiterMiddleware, RateRule
+
+RULES = [
+    RateRule(r"^/api/v1/users/signup$", limit=5, window=60),
+    RateRule(r"^/api/v1/auth/login$", limit=10, window=60),
+    RateRule(r"^/api/v1/.*", limit=100, window=60),
+]
+
+REPEATED = [
+    ("POST", "/api/v1/auth/login"),
+    ("DELETE", f"/api/v1/users/{uuid.UUID(int=1)}"),
+    ("GET", "/api/v1/oauth/yandex/login"),
+    ("GET", "/api/v1/user_roles/me"),
+    ("GET", "/favicon.ico"),
+]
+
+
+def make_app() -> FastAPI:
+    app = FastAPI()
+    app.include_router(health.router, prefix="/api/v1")
+    app.include_router(auth.router, prefix="/api/v1/auth")
+    app.include_router(users.router, prefix="/api/v1/users")
+    app.include_router(roles.router, prefix="/api/v1/roles")
+    app.include_router(user_roles.router, prefix="/api/v1/user_roles")
+    app.include_router(oauth.router, prefix="/api/v1/oauth")
+    return app
+
+
+def legacy_resolve(scope) -> tuple[str, RateRule]:
+    """Rule and key suffix as the middleware picked them before."""
+    path = scope["path"]
+    for rule in RULES:
+        if rule.pattern.match(path):
+            return path, rule
+    return path, RateRule(pattern=r".*", limit=100, window=60)
+
+
+def scopes(app, requests):
+    return [
+        {"type": "http", "app": app, "method": method, "path": path, "root_path": ""}
+        for method, path in requests
+    ]
+
+
+def timed(resolve, batch) -> float:
+    start = time.perf_counter()
+    for scope in batch:
+        resolve(scope)
+    return (time.perf_counter() - start) / len(batch) * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--n", type=int, default=100_000)
+    args = parser.parse_args()
+
+    app = make_app()
+    repeated = scopes(app, REPEATED * (args.n // len(REPEATED)))
+    distinct = scopes(app, [("DELETE", f"/api/v1/users/{uuid.uuid4()}") for _ in range(args.n)])
+
+    print(f"{'paths':<16}{'variant':<9}{'us/request':>11}")
+    for name, batch in (("repeated", repeated), ("distinct", distinct)):
+        middleware = RateLimiterMiddleware(app.router, rules=RULES, whitelist_paths=[])
+        for variant, resolve in (("before", legacy_resolve), ("after", middleware._resolve)):
+            print(f"{name:<16}{variant:<9}{timed(resolve, batch):>11.2f}")
+
+    middleware = RateLimiterMiddleware(app.router, rules=RULES, whitelist_paths=[])
+    print(f"\nRedis keys for one client after {args.n:,} requests to /api/v1/users/{{uuid}}")
+    for variant, resolve in (("before", legacy_resolve), ("after", middleware._resolve)):
+        keys = {f"rl:100:60:ip:10.0.0.1:{resolve(scope)[0]}" for scope in distinct}
+        print(f"{variant:<9}{len(keys):>9,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Refresh-token rotation throughput: the previous multi-step flow vs the single-pass primitive.
+
+Both variants use the service's own signing/verification code and a real Redis server
+(`--redis-url`); the user lookup is stubbed and identical in both, so the difference is
+the number of signature checks and Redis round trips per refresh:
+
+- before: validate_refresh (verify + EXISTS) -> blacklist_token (2 more verifies + SETEX)
+          -> SREM -> sign pair -> SADD                      3 verifies, 4 round trips
+- after:  AuthService.refresh_by_cookie                      1 verify,   1 round trip (EVALSHA)
+- opaque: same, with REFRESH_TOKEN_MODE=opaque              0 verifies, 2 round trips (GET, EVALSHA)
+          and one signature (the access token) instead of two
+
+Run from `auth_service/` (Postgres is not needed):
+    TESTING=1 PYTHONPATH=src python benchmarks/bench_refresh_rotation.py \\
+        --redis-url redis://localhost:6379/15 [--n 2000] [--concurrency 1 16]
+"""
+
+import argparse
+import asyncio
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from types import SimpleNamespace
+
+import redis.asyncio as redis
+import utils.jwt as jwt_utils
+from core.keyring import KeyRing, generate_key_pem
+from helpers import auth_helpers
+from helpers.auth_helpers import (
+    ROTATE_OPAQUE_REFRESH_LUA,
+    ROTATE_REFRESH_LUA,
+    TRACK_SESSION_LUA,
+    issue_tokens,
+    new_opaque_refresh_token,
+    session_member,
+    track_refresh_token,
+)
+from services.auth import AuthService
+
+
+class StubUserRepo:
+    def __init__(self, user):
+        self.user = user
+        self.session = None
+
+    async def get_by_id(self, _user_id):
+        return self.user
+
+
+async def legacy_refresh(svc: AuthService, refresh_token: str):
+    """The rotation flow as it was before the single-pass primitive."""
+    r = svc.redis
+    payload = await jwt_utils.decode_token(refresh_token, r)  # verify #1 + EXISTS
+    if payload.get("type") != "refresh" or not payload.get("sub"):
+        raise RuntimeError("bad token")
+    user = await svc.repo.get_by_id(payload["sub"])
+
+    ttl = jwt_utils.claims_ttl(await jwt_utils.verify(refresh_token, verify_exp=False))  # verify #2
+    claims = await jwt_utils.verify(refresh_token, verify_exp=False)  # verify #3
+    await r.setex(f"blacklist:{claims['jti']}", ttl, "1")
+    await r.srem(f"user_refresh:{user.user_id}", refresh_token)
+
+    tokens = await issue_tokens(user)
+    await r.sadd(f"user_refresh:{user.user_id}", tokens.refresh_token)
+    return tokens
+
+
+async def run_variant(refresh, svc, user, n: int, concurrency: int, opaque: bool) -> float:
+    legacy = refresh is legacy_refresh
+    key = f"user_{'refresh' if legacy else 'sessions'}:{user.user_id}"
+    auth_helpers.settings.refresh_token_mode = "opaque" if opaque else "jwt"
+    if opaque:
+        tokens = [new_opaque_refresh_token() for _ in range(n)]
+        for token in tokens:
+            await track_refresh_token(svc.redis, user.user_id, token, max_sessions=0)
+    else:
+        tokens = [
+            jwt_utils.create_refresh_token({"sub": str(user.user_id), "email": user.email})
+            for _ in range(n)
+        ]
+        if legacy:
+            await svc.redis.sadd(key, *tokens)
+        else:
+            await svc.redis.zadd(key, dict(session_member(t) for t in tokens))
+
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(token):
+        async with sem:
+            await refresh(svc, token)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(t) for t in tokens))
+    elapsed = time.perf_counter() - start
+
+    await svc.redis.delete(key)
+    return n / elapsed
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--redis-url", default="redis://localhost:6379/15")
+    parser.add_argument("--n", type=int, default=2000, help="Refreshes per measurement")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16])
+    parser.add_argument("--alg", default="RS256")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        private_pem, public_pem = generate_key_pem(args.alg)
+        (Path(tmp) / "k.key").write_bytes(private_pem)
+        (Path(tmp) / "k.key.pub").write_bytes(public_pem)
+        jwt_utils.keyring = KeyRing(
+            str(Path(tmp) / "k.key"), str(Path(tmp) / "k.key.pub"), args.alg, 0
+        )
+        jwt_utils.keyring.load()
+
+    client = redis.Redis.from_url(args.redis_url)
+    await client.script_load(ROTATE_REFRESH_LUA)
+    await client.script_load(ROTATE_OPAQUE_REFRESH_LUA)
+    await client.script_load(TRACK_SESSION_LUA)
+
+    async def single_pass(svc, token):
+        return await svc.refresh_by_cookie(token)
+
+    print(f"alg={args.alg} crypto_mode={jwt_utils.crypto_executor.mode} n={args.n}")
+    print(f"{'concurrency':<12}{'before/s':>12}{'after/s':>12}{'opaque/s':>12}{'speedup':>10}")
+    variants = ((legacy_refresh, False), (single_pass, False), (single_pass, True))
+    for concurrency in args.concurrency:
+        rates = []
+        for refresh, opaque in variants:
+            user = SimpleNamespace(user_id=uuid.uuid4(), email="bench@example.com")
+            svc = AuthService(repo=StubUserRepo(user), redis=client)
+            rates.append(await run_variant(refresh, svc, user, args.n, concurrency, opaque))
+        before, after, opaque_rate = rates
+        print(
+            f"{concurrency:<12}{before:>12,.0f}{after:>12,.0f}{opaque_rate:>12,.0f}"
+            f"{opaque_rate / before:>9.2f}x"
+        )
+
+    jwt_utils.crypto_executor.shutdown()
+    await client.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,93 @@
+"""
+Authenticated-request token check: Redis EXISTS per request vs the local revocation filter.
+
+Runs `decode_token` on valid access tokens (signature already cached, so the difference is
+the blacklist lookup) against a real Redis server (`--redis-url`) holding `--revoked`
+blacklisted jtis:
+
+- before: every call sends EXISTS blacklist:{jti}
+- after:  the in-sync Bloom filter answers "not revoked" locally; only hits go to Redis
+
+Run from `auth_service/` (Postgres is not needed):
+    TESTING=1 PYTHONPATH=src python benchmarks/bench_revocation_filter.py \\
+        --redis-url redis://localhost:6379/15 [--n 20000] [--concurrency 1 16]
+"""
+
+import argparse
+import asyncio
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+import redis.asyncio as redis
+import utils.jwt as jwt_utils
+from core.keyring import KeyRing, generate_key_pem
+from utils.revocation_filter import RevocationFilter
+
+
+async def measure(client, tokens, concurrency: int) -> float:
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(token):
+        async with sem:
+            await jwt_utils.decode_token(token, client, token_type="access")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(t) for t in tokens))
+    return len(tokens) / (time.perf_counter() - start)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--redis-url", default="redis://localhost:6379/15")
+    parser.add_argument("--n", type=int, default=20_000, help="Checks per measurement")
+    parser.add_argument("--tokens", type=int, default=200, help="Distinct access tokens")
+    parser.add_argument("--revoked", type=int, default=10_000, help="Blacklisted jtis")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        private_pem, public_pem = generate_key_pem("ES256")
+        (Path(tmp) / "k.key").write_bytes(private_pem)
+        (Path(tmp) / "k.key.pub").write_bytes(public_pem)
+        jwt_utils.keyring = KeyRing(
+            str(Path(tmp) / "k.key"), str(Path(tmp) / "k.key.pub"), "ES256", 0
+        )
+        jwt_utils.keyring.load()
+
+    client = redis.Redis.from_url(args.redis_url)
+    pipe = client.pipeline(transaction=False)
+    for _ in range(args.revoked):
+        pipe.setex(f"blacklist:{uuid.uuid4()}", 600, "1")
+    await pipe.execute()
+
+    distinct = [jwt_utils.create_access_token({"sub": str(i)}) for i in range(args.tokens)]
+    tokens = [distinct[i % len(distinct)] for i in range(args.n)]
+    for token in distinct:  # warm the verified-token cache
+        await jwt_utils.decode_token(token)
+
+    rf = RevocationFilter(100_000, 0.001, name="bench_revocation_filter", retry_sec=0.1)
+    print(f"n={args.n} revoked={args.revoked}")
+    print(f"{'concurrency':<12}{'before/s':>12}{'after/s':>12}{'speedup':>10}")
+    for concurrency in args.concurrency:
+        jwt_utils.revocation_filter = RevocationFilter(1, 0.5, name=f"bench_off_{concurrency}")
+        before = await measure(client, tokens, concurrency)
+
+        jwt_utils.revocation_filter = rf
+        await rf.start(client)
+        while not rf.ready:
+            await asyncio.sleep(0.01)
+        after = await measure(client, tokens, concurrency)
+        await rf.stop()
+
+        print(f"{concurrency:<12}{before:>12,.0f}{after:>12,.0f}{after / before:>9.2f}x")
+
+    print(f"redis checks after: hits={rf.hits.value:.0f} negatives={rf.negatives.value:.0f}")
+    jwt_utils.crypto_executor.shutdown()
+    await client.flushdb()
+    await client.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,100 @@
+import argparse
+
+from core.config import settings
+from utils.security import hash_time, make_context
+
+BCRYPT_ROUNDS = range(4, 18)
+ARGON2_MIN_MEMORY_KIB = 19 * 1024  # OWASP floor for argon2id (with time_cost >= 2)
+
+
+def calibrate_bcrypt(target: float, samples: int) -> tuple[dict, float]:
+    """Most bcrypt rounds whose hash time stays within `target` seconds."""
+    best, best_time = {"BCRYPT_ROUNDS": BCRYPT_ROUNDS[0]}, 0.0
+    for rounds in BCRYPT_ROUNDS:
+        took = hash_time(make_context(["bcrypt"], bcrypt_rounds=rounds), samples)
+        print(f"  bcrypt rounds={rounds:<2} {took * 1000:8.1f} ms")
+        if took > target:
+            break
+        best, best_time = {"BCRYPT_ROUNDS": rounds}, took
+    return best, best_time
+
+
+def calibrate_argon2(
+    target: float, samples: int, memory_kib: int, parallelism: int
+) -> tuple[dict, float]:
+    """
+    Most argon2id passes within `target` seconds at `memory_kib`. Memory is halved (down to
+    the OWASP floor) until at least two passes fit; otherwise the largest one-pass setting.
+    """
+    fallback: tuple[dict, float] = ({}, 0.0)
+    while True:
+        params: dict = {}
+        took = 0.0
+        for time_cost in range(1, 33):
+            context = make_context(
+                ["argon2"],
+                argon2_time_cost=time_cost,
+                argon2_memory_cost=memory_kib,
+                argon2_parallelism=parallelism,
+            )
+            elapsed = hash_time(context, samples)
+            print(f"  argon2id m={memory_kib} KiB t={time_cost:<2} {elapsed * 1000:8.1f} ms")
+            if elapsed > target:
+                break
+            params, took = (
+                {
+                    "ARGON2_TIME_COST": time_cost,
+                    "ARGON2_MEMORY_COST": memory_kib,
+                    "ARGON2_PARALLELISM": parallelism,
+                },
+                elapsed,
+            )
+        if params.get("ARGON2_TIME_COST", 0) >= 2:
+            return params, took
+        if params and not fallback[0]:
+            fallback = (params, took)
+        if memory_kib // 2 < ARGON2_MIN_MEMORY_KIB:
+            return fallback
+        memory_kib //= 2
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Measure password hash time on this host and suggest cost parameters"
+    )
+    parser.add_argument("--scheme", choices=["argon2", "bcrypt"], default="argon2")
+    parser.add_argument("--target-ms", type=float, default=50.0, help="Time budget per hash")
+    parser.add_argument("--samples", type=int, default=3, help="Hashes timed per setting")
+    parser.add_argument("--memory-kib", type=int, default=settings.argon2_memory_cost)
+    parser.add_argument("--parallelism", type=int, default=settings.argon2_parallelism)
+    args = parser.parse_args()
+
+    current = make_context(
+        settings.password_scheme_list,
+        bcrypt_rounds=settings.bcrypt_rounds,
+        argon2_time_cost=settings.argon2_time_cost,
+        argon2_memory_cost=settings.argon2_memory_cost,
+        argon2_parallelism=settings.argon2_parallelism,
+    )
+    print(
+        f"current: PASSWORD_SCHEMES={settings.password_schemes} "
+        f"{hash_time(current, args.samples) * 1000:.1f} ms per hash"
+    )
+
+    target = args.target_ms / 1000
+    if args.scheme == "bcrypt":
+        params, took = calibrate_bcrypt(target, args.samples)
+    else:
+        params, took = calibrate_argon2(target, args.samples, args.memory_kib, args.parallelism)
+    if not params:
+        raise SystemExit(f"No {args.scheme} setting fits {args.target_ms:.0f} ms on this host")
+
+    schemes = ",".join(dict.fromkeys([args.scheme, *settings.password_scheme_list]))
+    print(f"\nSuggested ({took * 1000:.1f} ms per hash, target {args.target_ms:.0f} ms):")
+    print(f"PASSWORD_SCHEMES={schemes}")
+    for name, value in params.items():
+        print(f"{name}={value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Convert `user_refresh:{user_id}` sets (whole refresh tokens) into the `user_sessions:{user_id}`
+index (ZSET of jti / `opaque:{hash}` scored by expiry). Expired and unreadable members are
+dropped; sessions already in the new index are kept. Safe to re-run.
+
+Run once right after deploying the session index: until then, refresh tokens issued in
+opaque mode before the upgrade cannot be rotated, and older sessions do not count towards
+MAX_SESSIONS_PER_USER.
+
+    python migrate_sessions.py [--dry-run]
+"""
+
+import argparse
+import asyncio
+import time
+
+import jwt
+from db.redis_db import close_redis, init_redis
+from helpers.auth_helpers import (
+    LEGACY_SESSIONS_KEY,
+    OPAQUE_MEMBER,
+    REFRESH_KEY,
+    REFRESH_TOKEN_TTL,
+    SESSIONS_KEY,
+)
+from redis.exceptions import ResponseError
+from utils.jwt import unverified_claims
+
+
+async def index_entries(redis, tokens: set[str], now: float) -> dict[str, int]:
+    """Session index members (with expiry) for the live tokens of one legacy set."""
+    entries: dict[str, int] = {}
+    opaque = [t for t in tokens if t.startswith(OPAQUE_MEMBER.format(""))]
+    pipe = redis.pipeline(transaction=False)
+    for member in opaque:
+        pipe.ttl(REFRESH_KEY.format(member.removeprefix(OPAQUE_MEMBER.format(""))))
+    for member, ttl in zip(opaque, await pipe.execute() if opaque else [], strict=True):
+        if ttl > 0:  # -2: already used or expired
+            entries[member] = int(now) + ttl
+
+    for token in tokens.difference(opaque):
+        try:
+            claims = unverified_claims(token)
+        except jwt.InvalidTokenError:
+            continue
+        if claims.get("jti") and claims.get("exp", 0) > now:
+            entries[claims["jti"]] = int(claims["exp"])
+    return entries
+
+
+async def memory_usage(redis, key: str) -> int | None:
+    """MEMORY USAGE of a key; None where the command is disabled (some managed Redis)."""
+    try:
+        return await redis.memory_usage(key) or 0
+    except ResponseError:
+        return None
+
+
+async def migrate(dry_run: bool) -> None:
+    redis = await init_redis()
+    now = time.time()
+    users = kept = dropped = 0
+    # payload = stored member bytes (+8 per score); memory = MEMORY USAGE, when available
+    payload = [0, 0]
+    memory: list[int | None] = [0, 0]
+    try:
+        async for legacy_key in redis.scan_iter(match=LEGACY_SESSIONS_KEY.format("*"), count=1000):
+            user_id = legacy_key.removeprefix(LEGACY_SESSIONS_KEY.format(""))
+            index_key = SESSIONS_KEY.format(user_id)
+            tokens = await redis.smembers(legacy_key)
+            entries = await index_entries(redis, tokens, now)
+            users, kept, dropped = (
+                users + 1,
+                kept + len(entries),
+                dropped + len(tokens) - len(entries),
+            )
+            payload[0] += sum(len(t) for t in tokens)
+            payload[1] += sum(len(m) + 8 for m in entries)
+            memory[0] = _add(memory[0], await memory_usage(redis, legacy_key))
+            if dry_run:
+                continue
+
+            pipe = redis.pipeline(transaction=True)
+            if entries:
+                pipe.zadd(index_key, entries)
+                pipe.expire(index_key, REFRESH_TOKEN_TTL)
+            pipe.delete(legacy_key)
+            await pipe.execute()
+            memory[1] = _add(memory[1], await memory_usage(redis, index_key))
+    finally:
+        await close_redis(redis)
+
+    print(f"users: {users}, sessions kept: {kept}, dropped (expired/used): {dropped}")
+    print(f"payload: {payload[0]} -> {payload[1]} bytes")
+    if memory[0] is not None:
+        print(f"MEMORY USAGE: {memory[0]} -> {memory[1] if not dry_run else '?'} bytes")
+    print("Dry run: nothing written" if dry_run else "OK: sessions migrated to user_sessions:*")
+
+
+def _add(total: int | None, value: int | None) -> int | None:
+    return None if total is None or value is None else total + value
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate refresh-session sets to the ZSET index")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would change")
+    args = parser.parse_args()
+    asyncio.run(migrate(args.dry_run))
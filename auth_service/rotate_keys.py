@@ -0,0 +1,113 @@
+import argparse
+import json
+import os
+import secrets
+import time
+from datetime import UTC, datetime
+
+from core.config import settings
+from core.keyring import generate_key_pem
+from utils.jwt import ACCESS_TOKEN_EXPIRE_MINUTES, REFRESH_TOKEN_EXPIRE_DAYS
+
+# A retired key must verify every token it signed: the longest-lived one is a refresh token.
+RETIRED_KEY_GRACE_SEC = REFRESH_TOKEN_EXPIRE_DAYS * 24 * 3600 + ACCESS_TOKEN_EXPIRE_MINUTES * 60
+
+
+def generate_key_pair(directory: str, algorithm: str) -> dict:
+    """Write a new key pair into `directory` and return its manifest entry."""
+    private_pem, public_pem = generate_key_pem(algorithm)
+
+    name = f"jwt-{algorithm.lower()}-{datetime.now(UTC).strftime('%Y%m%d%H%M%S')}-{secrets.token_hex(3)}"
+    private_name, public_name = f"{name}.key", f"{name}.key.pub"
+
+    fd = os.open(os.path.join(directory, private_name), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(private_pem)
+    with open(os.path.join(directory, public_name), "wb") as f:
+        f.write(public_pem)
+
+    return {"private_key": private_name, "public_key": public_name, "alg": algorithm}
+
+
+def write_manifest(path: str, manifest: dict) -> None:
+    # Atomic replace: workers polling the mtime never read a half-written file.
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, path)
+
+
+def init_manifest(path: str, algorithm: str) -> dict:
+    """Adopt the current key pair as active and stage a fresh `next` key."""
+    directory = os.path.dirname(os.path.abspath(path))
+    active = {
+        "status": "active",
+        "private_key": os.path.relpath(os.path.abspath(settings.jwt_private_key_path), directory),
+        "public_key": os.path.relpath(os.path.abspath(settings.jwt_public_key_path), directory),
+        "alg": algorithm,
+    }
+    nxt = {"status": "next", **generate_key_pair(directory, algorithm)}
+    return {"keys": [active, nxt]}
+
+
+def rotate(manifest: dict, directory: str, algorithm: str, now: float) -> dict:
+    """
+    One rotation step:
+      retired (expired) -> dropped
+      active            -> retired (kept for verification until every token it signed expired)
+      next              -> active
+      new key           -> next
+    """
+    keys = manifest.get("keys", [])
+    if not any(k["status"] == "next" for k in keys):
+        raise SystemExit("No 'next' key to promote; run with --init first")
+
+    rotated = []
+    for k in keys:
+        if k["status"] == "retired" and k.get("not_after", 0) <= now:
+            continue
+        if k["status"] == "active":
+            k = {
+                "status": "retired",
+                "public_key": k["public_key"],
+                "alg": k.get("alg", algorithm),
+                "not_after": int(now + RETIRED_KEY_GRACE_SEC),
+            }
+        elif k["status"] == "next":
+            k = {**k, "status": "active"}
+        rotated.append(k)
+
+    rotated.append({"status": "next", **generate_key_pair(directory, algorithm)})
+    return {"keys": rotated}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Rotate JWT signing keys (key-set manifest)")
+    parser.add_argument(
+        "--manifest",
+        default=settings.jwt_keyset_path or "keys/keyset.json",
+        help="Key-set manifest path (default: JWT_KEYSET_PATH)",
+    )
+    parser.add_argument("--alg", default=settings.jwt_algorithm, help="Algorithm for new keys")
+    parser.add_argument(
+        "--init", action="store_true", help="Create the manifest from the current key pair"
+    )
+    args = parser.parse_args()
+
+    directory = os.path.dirname(os.path.abspath(args.manifest))
+    if args.init:
+        if os.path.exists(args.manifest):
+            raise SystemExit(f"Manifest already exists: {args.manifest}")
+        manifest = init_manifest(args.manifest, args.alg)
+    else:
+        with open(args.manifest, encoding="utf-8") as f:
+            manifest = rotate(json.load(f), directory, args.alg, time.time())
+
+    write_manifest(args.manifest, manifest)
+    for k in manifest["keys"]:
+        print(f"{k['status']:>8}: {k['public_key']}")
+    print(f"OK: {args.manifest} written; workers reload it within JWT_KEY_RELOAD_INTERVAL_SEC")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,22 @@
 from http import HTTPStatus
 
+import redis.asyncio as redis
+from db.redis_db import get_redis
 from fastapi import APIRouter, Cookie, Depends, Request, Response
 from fastapi.security import OAuth2PasswordRequestForm
-from helpers.auth_helpers import set_refresh_cookie
-from schemas.auth import AccessTokenResponse, LoginRequest
+from helpers.auth_helpers import clear_refresh_cookie, set_refresh_cookie
+from middleware.rate_limit import client_ip
+from models import User
+from schemas.auth import (
+    AccessTokenResponse,
+    IntrospectionResult,
+    IntrospectRequest,
+    IntrospectResponse,
+    LoginRequest,
+)
 from services.auth import AuthService
-from utils.dependencies import get_auth_service
+from utils.dependencies import get_auth_service, get_current_user, require_shared_secret
+from utils.jwt import introspect_tokens
 
 router = APIRouter()
 
@@ -25,11 +36,14 @@ async def login_oauth2(
 
 @router.post("/login-json", response_model=AccessTokenResponse, status_code=HTTPStatus.OK)
 async def login_json(
+    request: Request,
     data: LoginRequest,
     response: Response,
     auth_service: AuthService = Depends(get_auth_service),
 ):
-    tokens = await auth_service.login_with_json(data.username, data.password)
+    tokens = await auth_service.login_with_json(
+        data.username, data.password, client_ip(request.scope)
+    )
     set_refresh_cookie(response, tokens.refresh_token)
     return {"access_token": tokens.access_token, "token_type": tokens.token_type}
 
@@ -53,3 +67,40 @@ async def logout(
 ):
     refresh_token = request.cookies.get("refresh_token")
     return await auth_service.logout_by_cookie(refresh_token, response)
+
+
+@router.post("/logout-all", status_code=HTTPStatus.OK)
+async def logout_all(
+    response: Response,
+    current_user: User = Depends(get_current_user),
+    auth_service: AuthService = Depends(get_auth_service),
+):
+    """Revoke every access and refresh token of the current user (all devices)."""
+    await auth_service.logout_all(current_user.user_id)
+    clear_refresh_cookie(response)
+    return {"detail": "Logged out from all sessions"}
+
+
+@router.post(
+    "/introspect",
+    response_model=IntrospectResponse,
+    response_model_exclude_none=True,  # inactive tokens: just {"active": false}
+    status_code=HTTPStatus.OK,
+    dependencies=[Depends(require_shared_secret("introspect_secret"))],
+)
+async def introspect(
+    data: IntrospectRequest,
+    redis_cli: redis.Redis = Depends(get_redis),
+):
+    """Batch RFC 7662-style introspection of access tokens for downstream services."""
+    results = await introspect_tokens(data.tokens, redis_cli, token_type="access")
+    return IntrospectResponse(
+        results=[
+            IntrospectionResult.model_validate(
+                {**claims, "active": True, "token_type": claims["type"]}
+            )
+            if claims is not None
+            else IntrospectionResult(active=False)
+            for claims in results
+        ]
+    )
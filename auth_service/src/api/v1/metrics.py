@@ -0,0 +1,17 @@
+from core.metrics import metrics
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+from utils.dependencies import require_shared_secret
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get(
+    "/metrics",
+    response_class=PlainTextResponse,
+    include_in_schema=False,
+    dependencies=[Depends(require_shared_secret("metrics_secret"))],
+)
+async def metrics_endpoint() -> PlainTextResponse:
+    """Per-worker counters/gauges in Prometheus text format (scrapers send METRICS_SECRET)."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
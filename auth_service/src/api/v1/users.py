@@ -11,8 +11,14 @@ from schemas.user import (
     UserUpdateRequest,
     UserUpdateResponse,
 )
+from services.auth import AuthService
 from services.user import UserService
-from utils.dependencies import get_current_user, get_current_user_with_roles, get_user_service
+from utils.dependencies import (
+    get_auth_service,
+    get_current_user,
+    get_current_user_with_roles,
+    get_user_service,
+)
 
 router = APIRouter()
 
@@ -47,3 +53,13 @@ async def delete_user(
     _: None = Depends(get_current_user_with_roles(["admin"])),
 ):
     return await service.delete_user(user_id)
+
+
+@router.post("/{user_id}/revoke-sessions", status_code=HTTPStatus.NO_CONTENT)
+async def revoke_user_sessions(
+    user_id: UUID,
+    auth_service: AuthService = Depends(get_auth_service),
+    _: None = Depends(get_current_user_with_roles(["admin"])),
+):
+    """Force-logout a user: every token issued to them so far stops working."""
+    await auth_service.logout_all(user_id)
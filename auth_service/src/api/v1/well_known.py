@@ -1,18 +1,27 @@
-import json
-
 from core.config import settings
-from fastapi import APIRouter
-from jwcrypto import jwk
+from core.keyring import keyring
+from fastapi import APIRouter, Header, Response
 
 router = APIRouter()
 
 
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match uses weak comparison: W/ prefixes are ignored, "*" matches anything."""
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip().removeprefix("W/")
+        if candidate in ("*", etag):
+            return True
+    return False
+
+
 @router.get("/.well-known/jwks.json")
-async def jwks():
-    key = jwk.JWK.from_pem(settings.jwt_public_key.encode())
-    kid = key.thumbprint()
-    pub = json.loads(key.export(private_key=False))
-    pub["kid"] = kid
-    pub["alg"] = "RS256"
-    pub["use"] = "sig"
-    return {"keys": [pub]}
+async def jwks(if_none_match: str | None = Header(default=None)):
+    """Pre-encoded JWKS document (rebuilt only when the key set changes)."""
+    key_set = keyring.current()
+    headers = {
+        "ETag": key_set.jwks_etag,
+        "Cache-Control": f"public, max-age={settings.jwks_cache_max_age_sec}",
+    }
+    if if_none_match and _etag_matches(if_none_match, key_set.jwks_etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=key_set.jwks_body, media_type="application/json", headers=headers)
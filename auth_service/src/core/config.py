@@ -1,6 +1,18 @@
-from pydantic import model_validator
+from typing import Literal
+
+from pydantic import ValidationInfo, field_validator, model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+# Supported JWT signing algorithms -> expected JWK key type and curve.
+JWT_KEY_TYPES: dict[str, tuple[str, str | None]] = {
+    "RS256": ("RSA", None),
+    "ES256": ("EC", "P-256"),
+    "EdDSA": ("OKP", "Ed25519"),
+}
+
+# Where CPU-heavy work (JWT crypto, password hashing) runs.
+ExecutorMode = Literal["inline", "thread", "process"]
+
 
 class Settings(BaseSettings):
     db_user: str = ""
@@ -12,16 +24,67 @@ class Settings(BaseSettings):
     jwt_algorithm: str = "RS256"
     jwt_private_key_path: str = ""
     jwt_public_key_path: str = ""
-
-    @property
-    def jwt_private_key(self) -> str:
-        with open(self.jwt_private_key_path, encoding="utf-8") as f:
-            return f.read()
-
-    @property
-    def jwt_public_key(self) -> str:
-        with open(self.jwt_public_key_path, encoding="utf-8") as f:
-            return f.read()
+    # Optional key-set manifest (active/next/retired keys); overrides the single key pair.
+    jwt_keyset_path: str = ""
+    # Key files are loaded once; mtime is re-checked at most this often (0 = SIGHUP only).
+    jwt_key_reload_interval_sec: int = 5
+    # Max verified tokens cached per worker (signature check skipped until `exp`); 0 disables.
+    jwt_verify_cache_size: int = 10_000
+    # Tokens whose signature check failed are rejected without crypto for this long; 0 disables.
+    jwt_reject_cache_size: int = 10_000
+    jwt_reject_cache_ttl_sec: int = 60
+    # Per-worker Bloom filter of revoked jtis (skips the Redis blacklist lookup on a miss).
+    revocation_filter_enabled: bool = True
+    revocation_filter_capacity: int = 100_000
+    revocation_filter_error_rate: float = 0.001
+    # Where JWT signing/verification runs: inline (event loop) | thread | process.
+    jwt_crypto_mode: ExecutorMode = "thread"
+    # Pool size (0 = CPU count) and max calls submitted at once (0 = pool size).
+    jwt_crypto_workers: int = 0
+    jwt_crypto_max_concurrency: int = 0
+    # Per-username login throttle: after this many failures from one client IP, each further
+    # failure locks that IP out of the username for base * 2^k seconds (capped); after the
+    # account-wide count, the username is locked for everyone. Failures are forgotten after
+    # the window.
+    login_throttle_enabled: bool = True
+    login_throttle_free_attempts: int = 5
+    login_throttle_account_free_attempts: int = 50
+    login_throttle_base_delay_sec: int = 1
+    login_throttle_max_delay_sec: int = 900
+    login_throttle_window_sec: int = 900
+    # Password hashing: comma-separated schemes (argon2, bcrypt). New hashes use the first;
+    # hashes of the others or with other parameters are rehashed on the next login.
+    password_schemes: str = "bcrypt"
+    bcrypt_rounds: int = 12
+    argon2_time_cost: int = 3
+    argon2_memory_cost: int = 65536  # KiB
+    argon2_parallelism: int = 4
+    # Where hashing runs, like JWT_CRYPTO_MODE: mode, pool size, max calls submitted at once.
+    password_hash_mode: ExecutorMode = "thread"
+    password_hash_workers: int = 0
+    password_hash_max_concurrency: int = 0
+    # Admission control: beyond this many queued calls, or this long waiting for a slot,
+    # login/signup fail fast with 503 + Retry-After (0 = unbounded).
+    password_hash_max_queue: int = 64
+    password_hash_max_wait_sec: float = 2.0
+    password_hash_retry_after_sec: int = 1
+    # Refresh tokens: "jwt" (signed) or "opaque" (random, stored hashed in Redis).
+    refresh_token_mode: Literal["jwt", "opaque"] = "jwt"
+    # Live refresh sessions kept per user; the oldest are revoked beyond it (0 = unlimited).
+    max_sessions_per_user: int = 100
+    # Embed role names + authz version in access tokens; admin checks then skip Postgres.
+    jwt_embed_roles: bool = False
+    # Cache-Control max-age of /.well-known/jwks.json; keep well below the key staging period.
+    jwks_cache_max_age_sec: int = 300
+    # Anonymous principal (guest role) reused per worker for this long; 0 = query every time.
+    guest_principal_cache_ttl_sec: int = 60
+    # POST /auth/introspect: max tokens per request; optional shared secret for callers.
+    introspect_max_tokens: int = 100
+    introspect_secret: str = ""
+    # Calls per minute per caller IP (one gateway usually makes all of them).
+    introspect_rate_limit: int = 600
+    # GET /metrics: scrapers send "Authorization: Bearer <secret>"; empty = endpoint disabled.
+    metrics_secret: str = ""
 
     redis_host: str = "localhost"
     redis_port: int = 6379
@@ -50,6 +113,17 @@ class Settings(BaseSettings):
 
     rate_limit_window_sec: int = 60
     rate_limit_max_requests: int = 100
+    # Signature checks of bearer tokens not yet verified, per client IP and window. Checked
+    # before the token is verified, i.e. before the per-user limit can apply (0 = no limit).
+    rate_limit_verify_max_requests: int = 100
+    # Default rate-limit algorithm: "log" (exact sliding window, one ZSET member per request)
+    # or "gcra" (one value per key). RateRule(algorithm=...) overrides it per rule.
+    rate_limit_algorithm: Literal["log", "gcra"] = "log"
+    # Local tier: per worker, admit up to this many requests per key without Redis while the key
+    # is well under its limit (0 = off). Bounds the overshoot to workers x batch per subject.
+    rate_limit_local_batch: int = 0
+    # How often the local tier records its counts in Redis.
+    rate_limit_local_sync_ms: int = 250
 
     # Trust proxy headers (X-Forwarded-For, etc.) ONLY behind a trusted reverse proxy.
     # If service is exposed directly, keep this False to avoid spoofing.
@@ -59,6 +133,10 @@ class Settings(BaseSettings):
     # Comma-separated, e.g. "10.0.0.10,10.0.0.11"
     trusted_proxy_ips: str = ""
 
+    @property
+    def password_scheme_list(self) -> list[str]:
+        return [s.strip() for s in self.password_schemes.split(",") if s.strip()]
+
     @property
     def trusted_proxy_ip_set(self) -> set[str]:
         raw = (self.trusted_proxy_ips or "").strip()
@@ -84,14 +162,79 @@ class Settings(BaseSettings):
             ("db_user", self.db_user),
             ("db_password", self.db_password),
             ("db_name", self.db_name),
-            ("jwt_private_key_path", self.jwt_private_key_path),
-            ("jwt_public_key_path", self.jwt_public_key_path),
         ]
+        if not self.jwt_keyset_path:
+            required += [
+                ("jwt_private_key_path", self.jwt_private_key_path),
+                ("jwt_public_key_path", self.jwt_public_key_path),
+            ]
         missing = [name for name, val in required if not val]
         if missing and not self.testing:
             raise ValueError(f"Missing required settings: {', '.join(missing)}")
         return self
 
+    @field_validator("jwt_algorithm")
+    @classmethod
+    def validate_jwt_algorithm(cls, value: str) -> str:
+        if value not in JWT_KEY_TYPES:
+            raise ValueError(
+                f"Unsupported JWT_ALGORITHM={value!r}; expected one of {', '.join(JWT_KEY_TYPES)}"
+            )
+        return value
+
+    @field_validator("revocation_filter_error_rate")
+    @classmethod
+    def validate_revocation_filter_error_rate(cls, value: float) -> float:
+        if not 0 < value < 1:
+            raise ValueError("REVOCATION_FILTER_ERROR_RATE must be between 0 and 1")
+        return value
+
+    @field_validator("password_schemes")
+    @classmethod
+    def validate_password_schemes(cls, value: str) -> str:
+        schemes = [s.strip() for s in value.split(",") if s.strip()]
+        if not schemes or set(schemes) - {"argon2", "bcrypt"}:
+            raise ValueError(
+                f"Unsupported PASSWORD_SCHEMES={value!r}; "
+                "expected a comma-separated list of argon2, bcrypt"
+            )
+        return value
+
+    @field_validator("rate_limit_local_batch")
+    @classmethod
+    def validate_rate_limit_local_batch(cls, value: int) -> int:
+        if value < 0:
+            raise ValueError("RATE_LIMIT_LOCAL_BATCH must be >= 0")
+        return value
+
+    @field_validator("introspect_rate_limit")
+    @classmethod
+    def validate_introspect_rate_limit(cls, value: int) -> int:
+        if value <= 0:
+            raise ValueError("INTROSPECT_RATE_LIMIT must be > 0")
+        return value
+
+    @field_validator("rate_limit_local_sync_ms")
+    @classmethod
+    def validate_rate_limit_local_sync_ms(cls, value: int) -> int:
+        if value <= 0:
+            raise ValueError("RATE_LIMIT_LOCAL_SYNC_MS must be > 0")
+        return value
+
+    @field_validator(
+        "login_throttle_free_attempts",
+        "login_throttle_account_free_attempts",
+        "login_throttle_base_delay_sec",
+        "login_throttle_max_delay_sec",
+        "login_throttle_window_sec",
+    )
+    @classmethod
+    def validate_login_throttle(cls, value: int, info: ValidationInfo) -> int:
+        # the lock is a `SET ... EX delay`, and Redis rejects EX 0
+        if value <= 0:
+            raise ValueError(f"{str(info.field_name).upper()} must be > 0")
+        return value
+
     @model_validator(mode="after")
     def validate_optional_features(self):
         if self.enable_tracer and not self.otel_exporter_otlp_endpoint:
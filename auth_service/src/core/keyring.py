@@ -0,0 +1,368 @@
+"""
+Load-once JWT key material with staged rotation.
+
+Keys are read from disk and parsed once; callers get pre-parsed key objects,
+the key id (RFC 7638 thumbprint), the pre-encoded JWS header and the public JWK.
+The JWKS document is serialized once per key set, with a strong ETag over its bytes.
+
+Key sources:
+- `JWT_KEYSET_PATH` (optional): a JSON manifest listing keys with a status:
+    - "active":  signs new tokens (exactly one);
+    - "next":    published in JWKS and accepted for verification, not used for signing yet;
+    - "retired": verification only, until its `not_after` timestamp.
+  See `auth_service/keys/README.md` and `rotate_keys.py`.
+- otherwise the single pair `JWT_PRIVATE_KEY_PATH` / `JWT_PUBLIC_KEY_PATH` is the active key.
+
+Reload policy:
+- the manifest and key files are re-checked by mtime at most every
+  `jwt_key_reload_interval_sec` seconds (0 disables polling), so every worker picks up
+  a rotation without a restart;
+- `reload()` forces a reload (wired to SIGHUP in `main.lifespan`);
+- retired keys drop out of the set when their `not_after` passes (no disk access).
+
+A reload builds a new immutable snapshot and swaps it in one assignment, so readers
+never observe a half-loaded key set.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field, replace
+from typing import Any
+
+from core.config import JWT_KEY_TYPES, settings
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+from jwcrypto import jwk
+from jwt.algorithms import Algorithm, get_default_algorithms
+from jwt.utils import base64url_encode
+
+logger = logging.getLogger("app")
+
+KEY_STATUSES = ("active", "next", "retired")
+
+
+@dataclass(frozen=True)
+class JwtKey:
+    kid: str
+    algorithm: str
+    status: str
+    signer: Algorithm
+    public_key: Any
+    private_key: Any | None
+    header_b64: bytes
+    public_jwk: dict[str, Any]
+    not_after: float | None = None
+    # Raw PEMs, so a process-pool worker can rebuild the key (parsed keys don't pickle).
+    public_pem: bytes = field(default=b"", repr=False)
+    private_pem: bytes | None = field(default=None, repr=False)
+
+    def is_expired(self, now: float) -> bool:
+        return self.not_after is not None and now >= self.not_after
+
+
+@dataclass(frozen=True)
+class KeySet:
+    active: JwtKey
+    by_kid: dict[str, JwtKey]
+    jwks: dict[str, Any]
+    mtimes: tuple[tuple[str, float], ...] = field(default=())
+    # Earliest retired-key expiry; the set is re-filtered once this passes.
+    next_expiry: float | None = None
+    # Pre-encoded JWKS document and its strong ETag (served as-is by /.well-known/jwks.json).
+    jwks_body: bytes = b""
+    jwks_etag: str = ""
+
+    def get(self, kid: str) -> JwtKey | None:
+        return self.by_kid.get(kid)
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _mtime(path: str) -> float:
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return 0.0
+
+
+def generate_key_pem(algorithm: str) -> tuple[bytes, bytes]:
+    """Generate a fresh (private PEM, public PEM) pair for `algorithm`."""
+    private_key: rsa.RSAPrivateKey | ec.EllipticCurvePrivateKey | ed25519.Ed25519PrivateKey
+    if algorithm == "RS256":
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    elif algorithm == "ES256":
+        private_key = ec.generate_private_key(ec.SECP256R1())
+    elif algorithm == "EdDSA":
+        private_key = ed25519.Ed25519PrivateKey.generate()
+    else:
+        raise ValueError(f"Unsupported JWT algorithm: {algorithm}")
+
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    public_pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo,
+    )
+    return private_pem, public_pem
+
+
+def load_key(
+    public_pem: bytes,
+    private_pem: bytes | None,
+    algorithm: str,
+    status: str = "active",
+    not_after: float | None = None,
+) -> JwtKey:
+    if algorithm not in JWT_KEY_TYPES:
+        raise ValueError(
+            f"Unsupported JWT algorithm: {algorithm} (supported: {', '.join(JWT_KEY_TYPES)})"
+        )
+    signer = get_default_algorithms()[algorithm]
+
+    public = jwk.JWK.from_pem(public_pem)
+    kid = public.thumbprint()
+    public_jwk = json.loads(public.export(private_key=False))
+
+    kty, crv = JWT_KEY_TYPES[algorithm]
+    if public_jwk.get("kty") != kty or public_jwk.get("crv") != crv:
+        found = public_jwk.get("kty") + (f"/{public_jwk['crv']}" if "crv" in public_jwk else "")
+        expected = kty + (f"/{crv}" if crv else "")
+        raise ValueError(f"{algorithm} requires a key of type {expected}, got {found} (kid={kid})")
+
+    header = {"alg": algorithm, "kid": kid, "typ": "JWT"}
+    header_b64 = base64url_encode(
+        json.dumps(header, separators=(",", ":"), sort_keys=True).encode()
+    )
+
+    public_jwk.update({"kid": kid, "alg": algorithm, "use": "sig"})
+
+    return JwtKey(
+        kid=kid,
+        algorithm=algorithm,
+        status=status,
+        signer=signer,
+        public_key=signer.prepare_key(public_pem),
+        private_key=signer.prepare_key(private_pem) if private_pem else None,
+        header_b64=header_b64,
+        public_jwk=public_jwk,
+        not_after=not_after,
+        public_pem=public_pem,
+        private_pem=private_pem,
+    )
+
+
+def build_key_set(
+    keys: list[JwtKey], mtimes: tuple[tuple[str, float], ...] = (), now: float | None = None
+) -> KeySet:
+    """Index keys by kid, drop expired retired keys and precompute the JWKS document."""
+    now = time.time() if now is None else now
+    live = [k for k in keys if not k.is_expired(now)]
+
+    active = [k for k in live if k.status == "active"]
+    if len(active) != 1:
+        raise ValueError(f"Key set must contain exactly one active key, found {len(active)}")
+    if active[0].private_key is None:
+        raise ValueError("Active key has no private key")
+
+    by_kid: dict[str, JwtKey] = {}
+    for k in live:
+        if k.kid in by_kid:
+            raise ValueError(f"Duplicate kid in key set: {k.kid}")
+        by_kid[k.kid] = k
+
+    expiries = [k.not_after for k in live if k.not_after is not None]
+    jwks = {"keys": [k.public_jwk for k in live]}
+    jwks_body = json.dumps(jwks, separators=(",", ":"), sort_keys=True).encode()
+    return KeySet(
+        active=active[0],
+        by_kid=by_kid,
+        jwks=jwks,
+        mtimes=mtimes,
+        next_expiry=min(expiries) if expiries else None,
+        jwks_body=jwks_body,
+        jwks_etag=f'"{hashlib.sha256(jwks_body).hexdigest()[:32]}"',
+    )
+
+
+def load_key_pair(private_key_path: str, public_key_path: str, algorithm: str) -> KeySet:
+    """Single-pair mode: the configured pair is the only (active) key."""
+    mtimes = (
+        (private_key_path, _mtime(private_key_path)),
+        (public_key_path, _mtime(public_key_path)),
+    )
+    key = load_key(_read(public_key_path), _read(private_key_path), algorithm)
+    return build_key_set([key], mtimes)
+
+
+def load_key_manifest(manifest_path: str, default_algorithm: str) -> KeySet:
+    """
+    Manifest mode. Format (paths are relative to the manifest directory):
+
+        {"keys": [
+            {"status": "active", "private_key": "k2.key", "public_key": "k2.key.pub"},
+            {"status": "next", "private_key": "k3.key", "public_key": "k3.key.pub"},
+            {"status": "retired", "public_key": "k1.key.pub", "not_after": 1767225600}
+        ]}
+
+    `alg` may be set per key; it defaults to JWT_ALGORITHM.
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    watched = [(manifest_path, _mtime(manifest_path))]
+    manifest = json.loads(_read(manifest_path))
+
+    keys: list[JwtKey] = []
+    for entry in manifest.get("keys", []):
+        status = entry.get("status")
+        if status not in KEY_STATUSES:
+            raise ValueError(f"Invalid key status in {manifest_path}: {status!r}")
+
+        public_path = os.path.join(base_dir, entry["public_key"])
+        watched.append((public_path, _mtime(public_path)))
+
+        private_pem = None
+        if status != "retired" and entry.get("private_key"):
+            private_path = os.path.join(base_dir, entry["private_key"])
+            watched.append((private_path, _mtime(private_path)))
+            private_pem = _read(private_path)
+
+        keys.append(
+            load_key(
+                _read(public_path),
+                private_pem,
+                entry.get("alg") or default_algorithm,
+                status=status,
+                not_after=entry.get("not_after"),
+            )
+        )
+
+    return build_key_set(keys, tuple(watched))
+
+
+class KeyRing:
+    """Process-wide holder of the current signing/verification key set."""
+
+    def __init__(
+        self,
+        private_key_path: str | None = None,
+        public_key_path: str | None = None,
+        algorithm: str | None = None,
+        reload_interval_sec: float | None = None,
+        keyset_path: str | None = None,
+    ):
+        self._private_key_path = private_key_path
+        self._public_key_path = public_key_path
+        self._algorithm = algorithm
+        self._reload_interval_sec = reload_interval_sec
+        self._keyset_path = keyset_path
+
+        self._keys: KeySet | None = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    # Paths/algorithm fall back to settings lazily so tests can patch settings.
+    @property
+    def private_key_path(self) -> str:
+        return self._private_key_path or settings.jwt_private_key_path
+
+    @property
+    def public_key_path(self) -> str:
+        return self._public_key_path or settings.jwt_public_key_path
+
+    @property
+    def keyset_path(self) -> str:
+        if self._keyset_path is not None:
+            return self._keyset_path
+        # Explicit key pair paths passed to the constructor win over the global manifest.
+        if self._private_key_path or self._public_key_path:
+            return ""
+        return settings.jwt_keyset_path
+
+    @property
+    def algorithm(self) -> str:
+        return self._algorithm or settings.jwt_algorithm
+
+    @property
+    def reload_interval_sec(self) -> float:
+        if self._reload_interval_sec is not None:
+            return self._reload_interval_sec
+        return settings.jwt_key_reload_interval_sec
+
+    def load(self) -> KeySet:
+        """(Re)load keys from disk unconditionally."""
+        with self._lock:
+            if self.keyset_path:
+                keys = load_key_manifest(self.keyset_path, self.algorithm)
+            else:
+                keys = load_key_pair(self.private_key_path, self.public_key_path, self.algorithm)
+            self._keys = keys
+            self._last_check = time.monotonic()
+        logger.info(
+            "JWT keys loaded (active kid=%s, alg=%s, published=%d)",
+            keys.active.kid,
+            keys.active.algorithm,
+            len(keys.by_kid),
+        )
+        return keys
+
+    def reload(self) -> None:
+        """Force a reload; keeps serving the previous keys if the new ones are broken."""
+        try:
+            self.load()
+        except Exception as exc:  # noqa: BLE001 - a bad rotation must not take the service down
+            logger.error("JWT key reload failed, keeping previous keys: %r", exc)
+
+    @staticmethod
+    def _files_changed(keys: KeySet) -> bool:
+        return any(_mtime(path) != mtime for path, mtime in keys.mtimes)
+
+    def _drop_expired(self, keys: KeySet, now: float) -> KeySet:
+        try:
+            pruned = build_key_set(list(keys.by_kid.values()), keys.mtimes, now)
+        except ValueError as exc:
+            logger.error("JWT key set expiry pruning failed: %r", exc)
+            return replace(keys, next_expiry=None)
+        logger.info("JWT retired key(s) expired, published=%d", len(pruned.by_kid))
+        return pruned
+
+    def current(self) -> KeySet:
+        """Return the current key set, loading or refreshing it if needed."""
+        keys = self._keys
+        if keys is None:
+            return self.load()
+
+        interval = self.reload_interval_sec
+        if interval > 0:
+            now = time.monotonic()
+            if now - self._last_check >= interval:
+                self._last_check = now
+                if self._files_changed(keys):
+                    self.reload()
+                    keys = self._keys or keys
+
+        if keys.next_expiry is not None and time.time() >= keys.next_expiry:
+            keys = self._keys = self._drop_expired(keys, time.time())
+        return keys
+
+    def active(self) -> JwtKey:
+        return self.current().active
+
+    def get(self, kid: str) -> JwtKey | None:
+        return self.current().get(kid)
+
+    def jwks(self) -> dict[str, Any]:
+        return self.current().jwks
+
+
+keyring = KeyRing()
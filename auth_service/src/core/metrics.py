@@ -0,0 +1,153 @@
+"""
+Minimal in-process metrics registry.
+
+Counters, gauges and summaries are registered by name (get-or-create) and rendered in the
+Prometheus text exposition format at `/api/v1/metrics`. Values are per worker process;
+scrape every worker (or aggregate in the collector) for service-wide numbers.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections.abc import Callable
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def samples(self) -> list[tuple[str, float]]:
+        return [(self.name, self._value)]
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, fn: Callable[[], float] | None = None):
+        self.name = name
+        self.help = help
+        self._fn = fn
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        with self._lock:
+            self._value -= amount
+
+    @property
+    def value(self) -> float:
+        return float(self._fn()) if self._fn is not None else self._value
+
+    def samples(self) -> list[tuple[str, float]]:
+        return [(self.name, self.value)]
+
+
+class Summary:
+    """Count / sum / max of observed values (e.g. latencies in seconds)."""
+
+    kind = "summary"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def samples(self) -> list[tuple[str, float]]:
+        return [(f"{self.name}_count", self.count), (f"{self.name}_sum", self.sum)]
+
+    def render(self) -> list[str]:
+        # `max` is not part of the Prometheus summary type; expose it as its own gauge.
+        return [
+            *_render_family(self.name, self.help, self.kind, self.samples()),
+            *_render_family(
+                f"{self.name}_max", f"{self.help} (max)", "gauge", [(f"{self.name}_max", self.max)]
+            ),
+        ]
+
+
+Metric = Counter | Gauge | Summary
+
+
+def _format_value(value: float) -> str:
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def _render_family(name: str, help: str, kind: str, samples: list[tuple[str, float]]) -> list[str]:
+    return [
+        f"# HELP {name} {help}",
+        f"# TYPE {name} {kind}",
+        *(f"{sample} {_format_value(value)}" for sample, value in samples),
+    ]
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, name: str, factory: Callable[[], Metric]) -> Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = factory()
+            return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        metric = self._get_or_create(name, lambda: Counter(name, help))
+        assert isinstance(metric, Counter)
+        return metric
+
+    def gauge(self, name: str, help: str, fn: Callable[[], float] | None = None) -> Gauge:
+        metric = self._get_or_create(name, lambda: Gauge(name, help, fn))
+        assert isinstance(metric, Gauge)
+        return metric
+
+    def summary(self, name: str, help: str) -> Summary:
+        metric = self._get_or_create(name, lambda: Summary(name, help))
+        assert isinstance(metric, Summary)
+        return metric
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in sorted(self._metrics.values(), key=lambda m: m.name):
+            if isinstance(metric, Summary):
+                lines.extend(metric.render())
+            else:
+                lines.extend(
+                    _render_family(metric.name, metric.help, metric.kind, metric.samples())
+                )
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
@@ -3,17 +3,40 @@ from __future__ import annotations
 import os
 
 from core.config import settings
+from core.keyring import keyring
+from passlib.exc import MissingBackendError
+from passlib.hash import argon2
 
 
 def validate_runtime_environment() -> None:
     missing: list[str] = []
 
-    if not os.path.exists(settings.jwt_private_key_path):
-        missing.append(f"JWT private key not found: {settings.jwt_private_key_path}")
+    if settings.jwt_keyset_path:
+        if not os.path.exists(settings.jwt_keyset_path):
+            missing.append(f"JWT key-set manifest not found: {settings.jwt_keyset_path}")
+    else:
+        if not os.path.exists(settings.jwt_private_key_path):
+            missing.append(f"JWT private key not found: {settings.jwt_private_key_path}")
 
-    if not os.path.exists(settings.jwt_public_key_path):
-        missing.append(f"JWT public key not found: {settings.jwt_public_key_path}")
+        if not os.path.exists(settings.jwt_public_key_path):
+            missing.append(f"JWT public key not found: {settings.jwt_public_key_path}")
 
+    hint = "Generate keys as described in auth_service/keys/README.md"
     if missing:
-        hint = "Generate keys as described in auth_service/keys/README.md"
         raise RuntimeError("\n".join([*missing, hint]))
+
+    # Parse the keys once up front: a key that does not match JWT_ALGORITHM
+    # (e.g. an RSA key with ES256) must fail startup, not the first login.
+    try:
+        keyring.load()
+    except Exception as exc:
+        raise RuntimeError(f"JWT keys are invalid: {exc}\n{hint}") from exc
+
+    # argon2 needs the optional argon2-cffi backend; without it every login would fail.
+    if "argon2" in settings.password_scheme_list:
+        try:
+            argon2.get_backend()
+        except MissingBackendError as exc:
+            raise RuntimeError(
+                "PASSWORD_SCHEMES includes argon2 but argon2-cffi is not installed"
+            ) from exc
@@ -1,30 +1,273 @@
+import hashlib
+import secrets
+import time
 from http import HTTPStatus
 
-import jwt as pyjwt
 import redis.asyncio as Redis
 from core.config import settings
+from core.metrics import metrics
 from fastapi import HTTPException, Response
 from models import User
 from schemas.auth import TokenPair
 from sqlalchemy.ext.asyncio import AsyncSession
 from utils.jwt import (
     REFRESH_TOKEN_EXPIRE_DAYS,
-    create_access_token,
-    create_refresh_token,
+    claims_ttl,
+    create_access_token_async,
+    create_token_pair,
     decode_token,
-    get_token_ttl,
+    is_token_revoked,
+    revocation_filter,
+    unverified_claims,
+    verify,
 )
+from utils.revocation_filter import EPOCH_CHANNEL, EPOCH_PREFIX, REVOCATION_CHANNEL
 
 
 # ---------- Token issuing ----------
-def issue_tokens(user: User) -> TokenPair:
-    """Create access and refresh tokens for a user."""
-    payload = {"sub": str(user.user_id), "email": user.email}
-    return TokenPair(
-        access_token=create_access_token(payload),
-        refresh_token=create_refresh_token(payload),
-        token_type="bearer",
+async def issue_tokens(user: User, access_claims: dict | None = None) -> TokenPair:
+    """Create access and refresh tokens for a user (signed on the crypto executor).
+
+    With REFRESH_TOKEN_MODE=opaque only the access token is signed; the refresh token is
+    random and is stored by track_refresh_token() / rotate_opaque_refresh().
+    """
+    if settings.refresh_token_mode == "opaque":
+        access = await create_access_token_async(str(user.user_id), user.email, access_claims)
+        return TokenPair(access_token=access, refresh_token=new_opaque_refresh_token())
+    return TokenPair(**await create_token_pair(str(user.user_id), user.email, access_claims))
+
+
+async def track_refresh_token(
+    redis: Redis.Redis | None, user_id, refresh_token: str, max_sessions: int | None = None
+) -> None:
+    """Index a newly issued refresh token (and store it, if opaque) in the user's sessions.
+
+    Beyond `max_sessions` (default MAX_SESSIONS_PER_USER) the sessions closest to expiry,
+    i.e. the least recently refreshed, are evicted and revoked.
+    """
+    if not redis:
+        return
+    member, expires_at = session_member(refresh_token)
+    keys = [SESSIONS_KEY.format(user_id)]
+    args = [
+        int(time.time()),
+        member,
+        expires_at,
+        settings.max_sessions_per_user if max_sessions is None else max_sessions,
+        REFRESH_TOKEN_TTL,
+    ]
+    if is_opaque_token(refresh_token):
+        keys.append(REFRESH_KEY.format(refresh_token_hash(refresh_token)))
+        args.append(str(user_id))
+    evicted = await redis.register_script(TRACK_SESSION_LUA)(keys=keys, args=args)
+    if evicted:
+        await revoke_evicted_sessions(redis, evicted)
+
+
+# ---------- Session index ----------
+# `user_sessions:{user_id}`: ZSET of the user's refresh tokens, member = jti (JWT) or
+# `opaque:{hash}` (opaque), score = expiry. Expired members are pruned on every write and the
+# key expires with the newest session, so the index never outgrows the live sessions.
+# Replaces `user_refresh:{user_id}` (a SET of whole tokens; see migrate_sessions.py).
+SESSIONS_KEY = "user_sessions:{}"
+LEGACY_SESSIONS_KEY = "user_refresh:{}"
+
+sessions_evicted = metrics.counter(
+    "sessions_evicted_total", "Refresh sessions revoked by MAX_SESSIONS_PER_USER"
+)
+
+
+def session_member(refresh_token: str) -> tuple[str, int]:
+    """Index member and expiry (unix seconds) of a refresh token this service issued."""
+    if is_opaque_token(refresh_token):
+        member = OPAQUE_MEMBER.format(refresh_token_hash(refresh_token))
+        return member, int(time.time()) + REFRESH_TOKEN_TTL
+    claims = unverified_claims(refresh_token)
+    return claims["jti"], int(claims["exp"])
+
+
+# Prune expired members, add the new one, evict the oldest beyond the limit, refresh the TTL.
+# KEYS: user_sessions:{user_id} [, refresh:{hash} for a new opaque token]
+# ARGV: now, member, expiry, max sessions (0 = unlimited), index ttl [, user id]
+# Returns the evicted members with their expiries (ZRANGE ... WITHSCORES).
+TRACK_SESSION_LUA = """
+if KEYS[2] then
+    redis.call('SET', KEYS[2], ARGV[6], 'EX', ARGV[5])
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+redis.call('ZADD', KEYS[1], ARGV[3], ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+local limit = tonumber(ARGV[4])
+local excess = redis.call('ZCARD', KEYS[1]) - limit
+if limit == 0 or excess <= 0 then
+    return {}
+end
+local evicted = redis.call('ZRANGE', KEYS[1], 0, excess - 1, 'WITHSCORES')
+redis.call('ZREMRANGEBYRANK', KEYS[1], 0, excess - 1)
+return evicted
+"""
+
+
+async def revoke_evicted_sessions(redis: Redis.Redis, evicted: list) -> None:
+    """Revoke sessions dropped from the index: blacklist JWT jtis, delete opaque tokens."""
+    now = time.time()
+    pipe = redis.pipeline(transaction=False)
+    jtis = []
+    for member, expires_at in zip(evicted[::2], evicted[1::2], strict=True):
+        member = member.decode() if isinstance(member, bytes) else member
+        if member.startswith(OPAQUE_MEMBER.format("")):
+            pipe.delete(REFRESH_KEY.format(member.removeprefix(OPAQUE_MEMBER.format(""))))
+        elif (ttl := int(float(expires_at) - now)) > 0:
+            pipe.setex(f"blacklist:{member}", ttl, "1")
+            pipe.publish(REVOCATION_CHANNEL, member)
+            jtis.append(member)
+    await pipe.execute()
+    for jti in jtis:
+        revocation_filter.add(jti)
+    sessions_evicted.inc(len(evicted) // 2)
+
+
+# ---------- Opaque refresh tokens ----------
+# `refresh:{sha256(token)}` -> user id, TTL = refresh lifetime. Only the hash is stored, and the
+# user's session index tracks `opaque:{hash}`, so a Redis dump leaks no usable token.
+REFRESH_KEY = "refresh:{}"
+OPAQUE_MEMBER = "opaque:{}"
+REFRESH_TOKEN_TTL = REFRESH_TOKEN_EXPIRE_DAYS * 24 * 60 * 60
+
+
+def new_opaque_refresh_token() -> str:
+    return secrets.token_urlsafe(32)  # 256 bits
+
+
+def is_opaque_token(token: str) -> bool:
+    """Opaque tokens are URL-safe base64 without dots; JWTs always have two."""
+    return "." not in token
+
+
+def refresh_token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+async def lookup_opaque_refresh(redis: Redis.Redis | None, token: str | None) -> str:
+    """User id of a live opaque refresh token (single GET); 400/401 like validate_refresh."""
+    if not token:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail="No refresh token provided",
+        )
+    user_id = await redis.get(REFRESH_KEY.format(refresh_token_hash(token))) if redis else None
+    if user_id is None:
+        raise HTTPException(status_code=HTTPStatus.UNAUTHORIZED, detail="Invalid token")
+    return user_id.decode() if isinstance(user_id, bytes) else user_id
+
+
+async def is_opaque_refresh_indexed(redis: Redis.Redis, user_id, token: str) -> bool:
+    """Whether the token is still in the user's session index (not revoked, evicted or used)."""
+    member = OPAQUE_MEMBER.format(refresh_token_hash(token))
+    return await redis.zscore(SESSIONS_KEY.format(user_id), member) is not None
+
+
+# Atomically: check the old token still belongs to the user (and is still indexed, i.e. not
+# dropped by revoke_user_sessions or evicted), delete it, store and index the new one.
+# KEYS: refresh:{old_hash}, refresh:{new_hash}, user_sessions:{user_id}
+# ARGV: user id, ttl, old member, new member (`opaque:{hash}`), now
+ROTATE_OPAQUE_REFRESH_LUA = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] or not redis.call('ZSCORE', KEYS[3], ARGV[3]) then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+redis.call('SET', KEYS[2], ARGV[1], 'EX', ARGV[2])
+redis.call('ZREM', KEYS[3], ARGV[3])
+redis.call('ZREMRANGEBYSCORE', KEYS[3], '-inf', ARGV[5])
+redis.call('ZADD', KEYS[3], tonumber(ARGV[5]) + tonumber(ARGV[2]), ARGV[4])
+redis.call('EXPIRE', KEYS[3], ARGV[2])
+return 1
+"""
+
+
+async def rotate_opaque_refresh(
+    redis: Redis.Redis, user_id, old_token: str, new_token: str
+) -> bool:
+    """Swap an opaque refresh token for a new one in one round trip (False if already used)."""
+    old_hash, new_hash = refresh_token_hash(old_token), refresh_token_hash(new_token)
+    script = redis.register_script(ROTATE_OPAQUE_REFRESH_LUA)
+    rotated = await script(
+        keys=[
+            REFRESH_KEY.format(old_hash),
+            REFRESH_KEY.format(new_hash),
+            SESSIONS_KEY.format(user_id),
+        ],
+        args=[
+            str(user_id),
+            REFRESH_TOKEN_TTL,
+            OPAQUE_MEMBER.format(old_hash),
+            OPAQUE_MEMBER.format(new_hash),
+            int(time.time()),
+        ],
     )
+    return bool(rotated)
+
+
+async def revoke_opaque_refresh(redis: Redis.Redis, user_id, *token_hashes: str) -> int:
+    """Delete opaque refresh tokens (by hash) and unindex them, in one round trip.
+
+    Returns how many were still indexed (0 means another request already consumed them,
+    or all sessions were revoked).
+    """
+    if not token_hashes:
+        return 0
+    pipe = redis.pipeline(transaction=True)
+    pipe.delete(*(REFRESH_KEY.format(h) for h in token_hashes))
+    pipe.zrem(SESSIONS_KEY.format(user_id), *(OPAQUE_MEMBER.format(h) for h in token_hashes))
+    _, untracked = await pipe.execute()
+    return untracked
+
+
+# ---------- Revocation epoch ("log out everywhere") ----------
+async def revoke_user_sessions(redis: Redis.Redis, user_id) -> float:
+    """
+    Revoke every token the user holds, in one round trip regardless of session count.
+
+    Sets `user_epoch:{user_id}` to now: access and JWT refresh tokens issued (`iat`) before
+    it are rejected. Dropping the session index revokes opaque refresh tokens (rotation
+    requires membership); their `refresh:{hash}` keys expire on their own. The epoch lives
+    as long as the longest-lived token.
+    """
+    epoch = round(time.time(), 3)
+    pipe = redis.pipeline(transaction=True)
+    pipe.set(f"{EPOCH_PREFIX}{user_id}", epoch, ex=REFRESH_TOKEN_TTL)
+    pipe.delete(SESSIONS_KEY.format(user_id), LEGACY_SESSIONS_KEY.format(user_id))
+    pipe.publish(EPOCH_CHANNEL, f"{user_id} {epoch}")
+    await pipe.execute()
+    revocation_filter.set_epoch(str(user_id), epoch)
+    return epoch
+
+
+# ---------- Authorization version ----------
+AUTHZ_VERSION_KEY = "authz_ver:{}"
+
+
+async def get_authz_version(redis: Redis.Redis | None, user_id) -> int | None:
+    """Current role-assignment version of a user (None when Redis is unavailable)."""
+    if not redis:
+        return None
+    value = await redis.get(AUTHZ_VERSION_KEY.format(user_id))
+    return int(value) if value is not None else 0
+
+
+async def bump_authz_version(redis: Redis.Redis | None, *user_ids) -> None:
+    """
+    Mark role claims in already-issued access tokens of these users as stale.
+
+    The counter has no TTL: an expired key would start again at 1 and make an old token's
+    `authz_ver` match again. It is one small key per user whose roles ever changed.
+    """
+    if not redis or not user_ids:
+        return
+    pipe = redis.pipeline(transaction=False)
+    for user_id in user_ids:
+        pipe.incr(AUTHZ_VERSION_KEY.format(user_id))
+    await pipe.execute()
 
 
 # ---------- Cookies ----------
@@ -52,53 +295,116 @@ async def validate_refresh(
     redis: Redis,
     auth_service,
 ) -> User:
+    payload = await verify_refresh_claims(refresh_token)
+
+    if await is_token_revoked(redis, payload):
+        raise HTTPException(status_code=HTTPStatus.UNAUTHORIZED, detail="Token revoked")
+
+    return await get_refresh_user(payload, auth_service)
+
+
+async def verify_refresh_claims(refresh_token: str | None) -> dict:
+    """Signature, expiry, type and subject checks of a refresh token (no revocation check)."""
     if not refresh_token:
         raise HTTPException(
             status_code=HTTPStatus.BAD_REQUEST,
             detail="No refresh token provided",
         )
 
-    try:
-        payload = await decode_token(refresh_token, redis)
-    except HTTPException:
-        raise
+    # no redis -> blacklist is checked by the caller; token_type makes decode_token reject
+    # anything but a refresh token (401 "Invalid token type")
+    payload = await decode_token(refresh_token, token_type="refresh")
 
-    if payload.get("type") != "refresh":
-        raise HTTPException(
-            status_code=HTTPStatus.UNAUTHORIZED,
-            detail="Invalid token type",
-        )
-
-    user_id = payload.get("sub")
-    if not user_id:
+    if not payload.get("sub") or not payload.get("jti"):
         raise HTTPException(
             status_code=HTTPStatus.UNAUTHORIZED,
             detail="Invalid token payload",
         )
 
-    user = await auth_service.repo.get_by_id(user_id)
+    return payload
+
+
+async def get_refresh_user(payload: dict, auth_service) -> User:
+    user = await auth_service.repo.get_by_id(payload["sub"])
     if not user:
         raise HTTPException(
             status_code=HTTPStatus.NOT_FOUND,
             detail="User not found",
         )
-
     return user
 
 
 # ---------- Blacklist ----------
-async def blacklist_token(redis: Redis, token: str) -> None:
-    ttl = get_token_ttl(token)
-    if ttl <= 0:
-        return  # expired/invalid ttl -> nothing to store
-
+async def blacklist_token(redis: Redis, token: str) -> str:
+    """Revoke a token until it expires; returns its jti (the session index member)."""
     # decode without blacklist check (and without exp verification)
-    payload = pyjwt.decode(
-        token,
-        settings.jwt_public_key,
-        algorithms=[settings.jwt_algorithm],
-        options={"verify_exp": False},
-    )
+    payload = await verify(token, verify_exp=False)
 
     jti = payload.get("jti") or token
-    await redis.setex(f"blacklist:{jti}", ttl, "1")
+    ttl = claims_ttl(payload)
+    if ttl <= 0:
+        return jti  # expired/invalid ttl -> nothing to store
+
+    pipe = redis.pipeline(transaction=False)
+    pipe.setex(f"blacklist:{jti}", ttl, "1")
+    pipe.publish(REVOCATION_CHANNEL, jti)
+    await pipe.execute()
+    revocation_filter.add(jti)
+    return jti
+
+
+# Atomically: reject a revoked token (blacklisted, or issued before the user's epoch), revoke
+# it, swap it for the new one in the user's session index (pruning expired members).
+# KEYS: blacklist:{old_jti}, user_sessions:{user_id}, user_epoch:{user_id}
+# ARGV: ttl, old jti, old iat, new member, new expiry, now, index ttl, revocation channel
+ROTATE_REFRESH_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+local epoch = redis.call('GET', KEYS[3])
+if epoch and tonumber(ARGV[3]) < tonumber(epoch) then
+    return 0
+end
+redis.call('SET', KEYS[1], '1', 'EX', ARGV[1])
+redis.call('PUBLISH', ARGV[8], ARGV[2])
+redis.call('ZREM', KEYS[2], ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[6])
+redis.call('ZADD', KEYS[2], ARGV[5], ARGV[4])
+redis.call('EXPIRE', KEYS[2], ARGV[7])
+return 1
+"""
+
+
+async def rotate_refresh_token(redis: Redis, payload: dict, new_token: str) -> bool:
+    """
+    Revoke the JWT refresh token with claims `payload` and index `new_token`, in one round trip.
+
+    An opaque `new_token` (legacy JWT cookie refreshed in opaque mode) must already be
+    stored; its hash is what gets indexed.
+
+    Returns False if the old token was already revoked (e.g. a concurrent refresh won);
+    only one of several concurrent rotations of the same token can succeed.
+    """
+    ttl = max(claims_ttl(payload), 1)
+    member, expires_at = session_member(new_token)
+    script = redis.register_script(ROTATE_REFRESH_LUA)
+    rotated = await script(
+        keys=[
+            f"blacklist:{payload['jti']}",
+            SESSIONS_KEY.format(payload["sub"]),
+            f"{EPOCH_PREFIX}{payload['sub']}",
+        ],
+        args=[
+            ttl,
+            payload["jti"],
+            payload.get("iat", 0),
+            member,
+            expires_at,
+            int(time.time()),
+            REFRESH_TOKEN_TTL,
+            REVOCATION_CHANNEL,
+        ],
+    )
+    if rotated:
+        revocation_filter.add(payload["jti"])
+    return bool(rotated)
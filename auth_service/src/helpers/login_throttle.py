@@ -0,0 +1,140 @@
+"""
+Per-username login throttling, on top of the per-IP rate limit in main.py.
+
+A distributed attack on one account never trips the per-IP limit, and each attempt costs a
+user lookup plus a password hash. Here failed logins for a normalized username are counted
+twice, per client IP and for the whole account:
+
+- `login_fail_ip:{ip}:{username}` / `login_fail:{username}`: failures so far; they expire
+  LOGIN_THROTTLE_WINDOW_SEC after the last one (and never before the lock they caused).
+- `login_lock_ip:{ip}:{username}`: set after LOGIN_THROTTLE_FREE_ATTEMPTS failures from that
+  IP, for base * 2^(n - free - 1) seconds, capped at LOGIN_THROTTLE_MAX_DELAY_SEC.
+- `login_lock:{username}`: the same after LOGIN_THROTTLE_ACCOUNT_FREE_ATTEMPTS failures from
+  anywhere.
+
+So a client guessing a password locks itself out of that account, while the owner logging in
+from elsewhere is only locked out by an attack spread over many IPs (which the account-wide
+threshold, much higher than the per-IP one, still caps).
+
+While locked, logins get 429 + Retry-After after one Redis round trip, before the DB and the
+password executor. Unknown usernames are counted the same way, so the response does not tell
+them apart. A successful login clears the account's keys and those of its client IP. Without
+Redis, or when it fails, logins are not throttled (like the rate limiter).
+"""
+
+import logging
+import math
+from http import HTTPStatus
+
+import redis.asyncio as Redis
+from core.config import settings
+from core.metrics import metrics
+from fastapi import HTTPException
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+FAIL_KEY = "login_fail:{}"
+LOCK_KEY = "login_lock:{}"
+CLIENT_FAIL_KEY = "login_fail_ip:{}:{}"
+CLIENT_LOCK_KEY = "login_lock_ip:{}:{}"
+
+login_throttled = metrics.counter(
+    "login_throttled_total", "Logins rejected by the login throttle (no DB/hash work)"
+)
+
+# KEYS: login_fail_ip:{ip}:{username}, login_lock_ip:{ip}:{username},
+#       login_fail:{username}, login_lock:{username}
+# ARGV: counter ttl, free attempts per IP, free attempts per account, base delay, max delay
+# Returns the longer of the two lock durations in seconds (0 = not locked).
+RECORD_FAILURE_LUA = """
+local function record(fail, lock, free)
+    local n = redis.call('INCR', fail)
+    redis.call('EXPIRE', fail, ARGV[1])
+    local over = n - tonumber(free)
+    if over <= 0 then
+        return 0
+    end
+    local delay = math.floor(math.min(tonumber(ARGV[4]) * 2 ^ (over - 1), tonumber(ARGV[5])))
+    redis.call('SET', lock, '1', 'EX', delay)
+    return delay
+end
+return math.max(record(KEYS[1], KEYS[2], ARGV[2]), record(KEYS[3], KEYS[4], ARGV[3]))
+"""
+
+
+def normalize_username(username: str) -> str:
+    return username.strip().casefold()
+
+
+def _keys(username: str, client_ip: str) -> list[str]:
+    """Fail and lock keys, per client IP first, then for the account."""
+    name = normalize_username(username)
+    return [
+        CLIENT_FAIL_KEY.format(client_ip, name),
+        CLIENT_LOCK_KEY.format(client_ip, name),
+        FAIL_KEY.format(name),
+        LOCK_KEY.format(name),
+    ]
+
+
+async def check_login_throttle(
+    redis: Redis.Redis | None, username: str, client_ip: str = ""
+) -> int:
+    """Raise 429 if the username is locked for this client; else return its failure count."""
+    if not redis or not settings.login_throttle_enabled:
+        return 0
+    _, client_lock, fail, lock = _keys(username, client_ip)
+    pipe = redis.pipeline(transaction=False)
+    pipe.pttl(client_lock)
+    pipe.pttl(lock)
+    pipe.get(fail)
+    try:
+        client_lock_ms, lock_ms, failures = await pipe.execute()
+    except RedisError as exc:
+        logger.warning("Login throttle unavailable, not throttling: %s", exc)
+        return 0
+    lock_ms = max(client_lock_ms, lock_ms)
+    if lock_ms > 0:
+        login_throttled.inc()
+        raise HTTPException(
+            status_code=HTTPStatus.TOO_MANY_REQUESTS,
+            detail="Too many failed login attempts, retry later",
+            headers={"Retry-After": str(math.ceil(lock_ms / 1000))},
+        )
+    return int(failures or 0)
+
+
+async def record_login_failure(
+    redis: Redis.Redis | None, username: str, client_ip: str = ""
+) -> int:
+    """Count a failed login; returns how long this client is now locked out (0 = not locked)."""
+    if not redis or not settings.login_throttle_enabled:
+        return 0
+    script = redis.register_script(RECORD_FAILURE_LUA)
+    try:
+        delay = await script(
+            keys=_keys(username, client_ip),
+            args=[
+                max(settings.login_throttle_window_sec, settings.login_throttle_max_delay_sec),
+                settings.login_throttle_free_attempts,
+                settings.login_throttle_account_free_attempts,
+                settings.login_throttle_base_delay_sec,
+                settings.login_throttle_max_delay_sec,
+            ],
+        )
+    except RedisError as exc:
+        logger.warning("Login throttle unavailable, failure not counted: %s", exc)
+        return 0
+    return int(delay)
+
+
+async def reset_login_failures(
+    redis: Redis.Redis | None, username: str, client_ip: str = ""
+) -> None:
+    if not redis or not settings.login_throttle_enabled:
+        return
+    try:
+        await redis.delete(*_keys(username, client_ip))
+    except RedisError as exc:
+        logger.warning("Login throttle unavailable, failures not reset: %s", exc)
@@ -1,8 +1,11 @@
-from contextlib import asynccontextmanager
+import asyncio
+import signal
+from contextlib import asynccontextmanager, suppress
 
-from api.v1 import auth, health, oauth, ready, roles, user_roles, users, well_known
+from api.v1 import auth, health, metrics, oauth, ready, roles, user_roles, users, well_known
 from core import telemetry
 from core.config import settings
+from core.keyring import keyring
 from core.logging import setup_logging
 from core.startup_check import validate_runtime_environment
 from db.postgres import make_engine, make_session_factory
@@ -10,15 +13,28 @@ from db.redis_db import close_redis, init_redis
 from fastapi import FastAPI
 from fastapi.openapi.utils import get_openapi
 from fastapi_pagination import add_pagination
-from middleware.rate_limit import RateLimiterMiddleware, RateRule
+from middleware.authentication import AuthenticationMiddleware
+from middleware.rate_limit import (
+    RateLimiterMiddleware,
+    RateRule,
+    load_rate_limit_scripts,
+    local_limiter,
+)
 from middleware.request_id import RequestIDMiddleware
 from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
+from utils.jwt import crypto_executor, revocation_filter
+from utils.security import password_executor
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     validate_runtime_environment()
 
+    # --- JWT keys (parsed once by the startup check; SIGHUP forces a reload) ---
+    loop = asyncio.get_running_loop()
+    with suppress(NotImplementedError, AttributeError):
+        loop.add_signal_handler(signal.SIGHUP, keyring.reload)
+
     # --- DB ---
     engine = make_engine()
     session_factory = make_session_factory(engine)
@@ -29,6 +45,10 @@ async def lifespan(app: FastAPI):
     # --- Redis ---
     redis = await init_redis()
     app.state.redis = redis
+    await load_rate_limit_scripts(redis)
+    await local_limiter.start(redis)
+    if settings.revocation_filter_enabled:
+        await revocation_filter.start(redis)
 
     SQLAlchemyInstrumentor().instrument(engine=engine.sync_engine)
 
@@ -38,6 +58,12 @@ async def lifespan(app: FastAPI):
     yield
 
     # --- Shutdown ---
+    with suppress(NotImplementedError, AttributeError):
+        loop.remove_signal_handler(signal.SIGHUP)
+    await revocation_filter.stop()
+    await local_limiter.stop(redis)
+    crypto_executor.shutdown()
+    password_executor.shutdown()
     await engine.dispose()
     await close_redis(redis)
 
@@ -75,6 +101,8 @@ rules = [
     RateRule(r"^/api/v1/users/signup$", limit=5, window=60),
     # Login: moderate
     RateRule(r"^/api/v1/auth/login$", limit=10, window=60),
+    # Introspection: its own budget, each call checks up to INTROSPECT_MAX_TOKENS tokens
+    RateRule(r"^/api/v1/auth/introspect$", limit=settings.introspect_rate_limit, window=60),
     # Everything else: default
     RateRule(
         r"^/api/v1/.*",
@@ -83,12 +111,35 @@ rules = [
     ),
 ]
 
+# Not rate-limited, and bearer tokens on them are not checked
+PUBLIC_PATHS = [
+    "/api/v1/healthz",
+    "/api/v1/readyz",
+    "/docs",
+    "/openapi.json",
+]
+
 app.add_middleware(
     RateLimiterMiddleware,
     rules=rules,
     default_limit=settings.rate_limit_max_requests,
     default_window=settings.rate_limit_window_sec,
-    whitelist_paths=["/api/v1/healthz", "/api/v1/readyz", "/docs", "/openapi.json"],
+    whitelist_paths=PUBLIC_PATHS,
+)
+# Added after the rate limiter so it runs first: authenticated users are limited per user_id.
+# Metrics and introspection are authenticated with a shared secret, not a JWT.
+# Tokens it has not verified yet are limited per IP before their signature is checked.
+verify_rule = None
+if settings.rate_limit_verify_max_requests:
+    verify_rule = RateRule(
+        r".*",
+        limit=settings.rate_limit_verify_max_requests,
+        window=settings.rate_limit_window_sec,
+    )
+app.add_middleware(
+    AuthenticationMiddleware,
+    whitelist_paths=[*PUBLIC_PATHS, "/api/v1/metrics", "/api/v1/auth/introspect"],
+    verify_rule=verify_rule,
 )
 app.add_middleware(RequestIDMiddleware)
 
@@ -103,3 +154,4 @@ app.include_router(well_known.router)
 app.include_router(health.router, prefix="/api/v1")
 
 app.include_router(ready.router, prefix="/api/v1")
+app.include_router(metrics.router, prefix="/api/v1")
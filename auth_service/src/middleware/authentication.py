@@ -0,0 +1,115 @@
+import logging
+import time
+from collections.abc import Iterable
+
+from core.config import settings
+from middleware.rate_limit import (
+    RateRule,
+    check_rate_limit,
+    client_ip,
+    rate_limit_headers,
+    rate_limit_key,
+)
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+from utils.jwt import decode_token, precheck, verified_tokens
+
+logger = logging.getLogger("app")
+
+# Rate-limit "route" of the per-IP budget for signature checks of uncached tokens.
+VERIFY_BUCKET = "<token-verify>"
+
+
+class AuthenticationMiddleware:
+    """
+    Pure ASGI: verifies the request's bearer token once, before anything else needs it.
+
+    For `Authorization: Bearer <token>`, the token is checked like the auth dependencies
+    check it (decode_token: signature, expiry, type "access", revocation) and the result is
+    stored in the request state (`request.state`, i.e. `scope["state"]`):
+
+    - `access_token`  the bearer token that was checked
+    - `claims`        its claims, or None if it is invalid, expired, revoked or not an access token
+    - `user_id`       the `sub` claim of a valid token (read by RateLimiterMiddleware)
+
+    This runs before the rate limiter, so it guards its own expensive work:
+
+    - a token is first run through `precheck` (no crypto, no Redis); one that fails it gets
+      `claims` None straight away and is limited by client IP;
+    - a token that passes but is not in the verified-token cache needs a signature check. With
+      `verify_rule`, those count against a per-client-IP budget first, and over it the request
+      gets 429 + Retry-After without any crypto (a Redis error lets it through, like the
+      rate limiter);
+    - paths in `whitelist_paths` (health checks, docs, endpoints using a shared secret) are
+      not looked at.
+
+    Nothing else is rejected here; the dependencies in utils/dependencies.py reuse `claims`
+    (see `_access_claims`) and decide between 401, 403 and a guest principal, so every route
+    behaves as before with one verification per request. Requests without a bearer token, and
+    apps without `state.redis` (no revocation check possible), are passed through untouched.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        whitelist_paths: Iterable[str] | None = None,
+        verify_rule: RateRule | None = None,
+    ):
+        self.app = app
+        self.whitelist = set(whitelist_paths or [])
+        self.verify_rule = verify_rule
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in self.whitelist:
+            await self.app(scope, receive, send)
+            return
+
+        scheme, _, token = Headers(scope=scope).get("authorization", "").partition(" ")
+        redis = getattr(scope["app"].state, "redis", None)
+        if scheme.lower() == "bearer" and token and redis is not None:
+            claims = None
+            try:
+                precheck(token, token_type="access")
+            except Exception:
+                pass
+            else:
+                if token not in verified_tokens:
+                    rejected = await self._check_verify_budget(scope, redis)
+                    if rejected is not None:
+                        await rejected(scope, receive, send)
+                        return
+                try:
+                    claims = await decode_token(token, redis=redis, token_type="access")
+                except Exception:
+                    claims = None
+            if claims is not None and claims.get("type") != "access":
+                claims = None
+
+            state = scope.setdefault("state", {})
+            state["access_token"] = token
+            state["claims"] = claims
+            if claims is not None and claims.get("sub"):
+                state["user_id"] = claims["sub"]
+
+        await self.app(scope, receive, send)
+
+    async def _check_verify_budget(self, scope: Scope, redis) -> JSONResponse | None:
+        """Count one signature check against the client IP; the 429 response if over budget."""
+        rule = self.verify_rule
+        if rule is None or getattr(settings, "testing", False):
+            return None
+        now_ms = int(time.time() * 1000)
+        key = rate_limit_key(rule, f"ip:{client_ip(scope)}", VERIFY_BUCKET)
+        try:
+            allowed, remaining, reset_ms = await check_rate_limit(redis, rule, key, now_ms)
+        except Exception as e:
+            logger.warning(f"[auth] Redis error, skip the verification limit: {e}")
+            return None
+        if allowed:
+            return None
+        return JSONResponse(
+            status_code=429,
+            content={"detail": "Too Many Requests"},
+            headers=rate_limit_headers(rule, allowed, remaining, reset_ms, now_ms),
+        )
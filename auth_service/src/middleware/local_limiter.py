@@ -0,0 +1,161 @@
+"""
+Per-worker first tier of the rate limiter: requests that are clearly under their limit are
+admitted from memory, and the counts reach Redis in batches.
+
+Every Redis check in RateLimiterMiddleware returns the key's remaining quota, which this
+tier remembers. Until the next check, a key may take requests locally while
+
+    remaining - unconfirmed > RATE_LIMIT_LOCAL_BATCH  and  unconfirmed < RATE_LIMIT_LOCAL_BATCH
+
+(`unconfirmed` = requests admitted by this worker that `remaining` does not reflect yet:
+pending, or sent to Redis without an answer). Anything else, a key this worker has not seen
+yet included, goes to Redis for an exact check, which also records the pending requests.
+
+Every RATE_LIMIT_LOCAL_SYNC_MS the background task records all pending counts and refreshes
+the remaining quota of every key used since the last sync, in one pipeline. Keys not used since
+the last sync are forgotten.
+
+Overshoot: each worker holds at most RATE_LIMIT_LOCAL_BATCH unconfirmed requests per key,
+and admits locally only while Redis last reported more than that much quota left. A subject can
+therefore get at most (workers x RATE_LIMIT_LOCAL_BATCH) requests beyond its limit, counting
+every worker process on every node. Limits of RATE_LIMIT_LOCAL_BATCH or less (login,
+signup) are always checked in Redis.
+
+Metrics:
+- `rate_limit_local_total`   requests admitted without a Redis call
+- `rate_limit_synced_total`  locally admitted requests recorded by the background sync
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from core.metrics import metrics
+from redis.asyncio import Redis
+
+logger = logging.getLogger(__name__)
+
+admitted_locally = metrics.counter(
+    "rate_limit_local_total", "Requests admitted by the local rate-limit tier (no Redis call)"
+)
+synced = metrics.counter(
+    "rate_limit_synced_total", "Locally admitted requests recorded in Redis by the batch sync"
+)
+
+# (redis, [(key, rule, pending)], now_ms) -> [(remaining, reset_ms)], one per key
+SyncFn = Callable[[Redis, list[tuple[str, Any, int]], int], Awaitable[list[tuple[int, int]]]]
+
+
+class _Entry:
+    __slots__ = ("rule", "remaining", "reset_ms", "pending", "inflight", "used")
+
+    def __init__(self, rule: Any, remaining: int, reset_ms: int):
+        self.rule = rule
+        self.remaining = remaining
+        self.reset_ms = reset_ms
+        self.pending = 0  # admitted here, not sent to Redis yet
+        self.inflight = 0  # sent to Redis, not reflected in `remaining` yet
+        self.used = True
+
+
+class LocalRateLimiter:
+    def __init__(self, batch: int, sync_ms: int, sync: SyncFn):
+        self.batch = batch
+        self.sync_ms = sync_ms
+        self._sync = sync
+        self._entries: dict[str, _Entry] = {}
+        self._task: asyncio.Task | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.batch > 0
+
+    def admit(self, key: str) -> tuple[int, int] | None:
+        """Admit a request locally: (remaining, reset_ms), or None to check Redis."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        unconfirmed = entry.pending + entry.inflight
+        if unconfirmed >= self.batch or entry.remaining - unconfirmed <= self.batch:
+            return None
+        entry.pending += 1
+        entry.used = True
+        admitted_locally.inc()
+        return entry.remaining - unconfirmed - 1, entry.reset_ms
+
+    def take_pending(self, key: str) -> int:
+        """Hand the pending requests (plus the current one) to an exact Redis check."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return 0
+        pending, entry.pending = entry.pending, 0
+        entry.inflight += pending + 1
+        return pending
+
+    def settle(self, key: str, rule: Any, sent: int, result: tuple[int, int] | None) -> None:
+        """Apply the (remaining, reset_ms) a Redis check returned for `sent` requests.
+
+        `result` is None when the check failed: the key then goes to Redis until it answers.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            if result is not None:
+                self._entries[key] = _Entry(rule, *result)
+            return
+        entry.inflight = max(0, entry.inflight - sent)
+        entry.remaining, entry.reset_ms = result if result is not None else (0, entry.reset_ms)
+        entry.used = True
+
+    async def flush(self, redis: Redis) -> None:
+        batch: list[tuple[str, _Entry, int]] = []
+        for key, entry in list(self._entries.items()):
+            if not (entry.used or entry.pending or entry.inflight):
+                del self._entries[key]
+                continue
+            batch.append((key, entry, entry.pending))
+            entry.inflight += entry.pending
+            entry.pending, entry.used = 0, False
+        if not batch:
+            return
+        try:
+            results = await self._sync(
+                redis, [(key, e.rule, n) for key, e, n in batch], int(time.time() * 1000)
+            )
+        except Exception:
+            # The counts are lost; make every key check Redis until it answers again.
+            for _, entry, n in batch:
+                entry.inflight, entry.remaining = max(0, entry.inflight - n), 0
+            raise
+        for (_, entry, n), (remaining, reset_ms) in zip(batch, results, strict=True):
+            entry.inflight = max(0, entry.inflight - n)
+            entry.remaining, entry.reset_ms = remaining, reset_ms
+        synced.inc(sum(n for _, _, n in batch))
+
+    async def start(self, redis: Redis) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run(redis))
+
+    async def stop(self, redis: Redis) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            try:
+                await self.flush(redis)  # do not drop the last batch on shutdown
+            except Exception:
+                logger.warning("Rate limit: final sync failed", exc_info=True)
+        self._entries.clear()
+
+    async def _run(self, redis: Redis) -> None:
+        while True:
+            await asyncio.sleep(self.sync_ms / 1000)
+            try:
+                await self.flush(redis)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning("Rate limit sync failed; checking Redis", exc_info=True)
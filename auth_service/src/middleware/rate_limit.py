@@ -1,4 +1,5 @@
 import logging
+import math
 import re
 import time
 import uuid
@@ -6,13 +7,153 @@ from collections.abc import Iterable
 
 from core.config import settings
 from core.logging import request_id_ctx
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
+from middleware.local_limiter import LocalRateLimiter
+from starlette.datastructures import Headers, MutableHeaders
 from starlette.responses import JSONResponse
+from starlette.routing import BaseRoute
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Both scripts check and record requests for one key in one atomic step, so concurrent
+# requests cannot all pass the check. Same arguments and reply:
+# KEYS: rate key
+# ARGV: now (ms), window (ms), limit, hits (1 = check this request, 0 = only record),
+#       pending (requests already admitted by the local tier, recorded unconditionally),
+#       member (log only: unique id of this request)
+# Returns {allowed, remaining, reset_ms}, reset being when the next slot frees up.
+
+# Sliding log: a ZSET of request timestamps, trimmed to the window on every call.
+SLIDING_LOG_LUA = """
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+local pending = tonumber(ARGV[5])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], 0, now - window)
+for i = 1, pending do
+    redis.call('ZADD', KEYS[1], now, ARGV[6] .. ':' .. i)
+end
+local count = redis.call('ZCARD', KEYS[1])
+local allowed = 0
+if ARGV[4] == '1' and count < limit then
+    redis.call('ZADD', KEYS[1], now, ARGV[6])
+    count = count + 1
+    allowed = 1
+end
+if allowed + pending > 0 then
+    redis.call('PEXPIRE', KEYS[1], window)
+end
+local reset = now + window
+local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+if oldest[2] then
+    reset = tonumber(oldest[2]) + window
+end
+return {allowed, math.max(0, limit - count), reset}
+"""
+
+# GCRA: the key holds one number, the theoretical arrival time (TAT) of the next request.
+# Each request pushes it `window / limit` ms further; a request is allowed while the TAT stays
+# within `window` of now, i.e. `limit` requests at once, then one per `window / limit`.
+GCRA_LUA = """
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+local pending = tonumber(ARGV[5])
+local interval = window / limit
+local tat = math.max(tonumber(redis.call('GET', KEYS[1])) or now, now) + pending * interval
+local allowed = 0
+if ARGV[4] == '1' and tat + interval - now <= window then
+    tat = tat + interval
+    allowed = 1
+end
+if allowed + pending > 0 then
+    redis.call('SET', KEYS[1], tat, 'PX', math.max(1, math.ceil(tat - now)))
+end
+local used = math.ceil((tat - now) / interval - 1e-9)
+local slot = math.min(used, limit)
+return {allowed, math.max(0, limit - used), math.ceil(tat - (slot - 1) * interval)}
+"""
+
+# RateRule.algorithm -> script. "log" is exact over any window but stores every request
+# (a ZSET of up to `limit` members); "gcra" stores one value per key.
+RATE_LIMIT_SCRIPTS = {"log": SLIDING_LOG_LUA, "gcra": GCRA_LUA}
+
+
+async def load_rate_limit_scripts(redis) -> None:
+    """SCRIPT LOAD at startup, so the first limited request is a plain EVALSHA."""
+    for script in RATE_LIMIT_SCRIPTS.values():
+        await redis.script_load(script)
+
+
+def _script_args(rule: "RateRule", now_ms: int, hits: int, pending: int = 0) -> list:
+    args = [now_ms, rule.window * 1000, rule.limit, hits, pending]
+    if rule.algorithm == "log":
+        args.append(f"{now_ms}-{uuid.uuid4().hex}")
+    return args
+
+
+async def sync_rate_limits(redis, batch, now_ms: int) -> list[tuple[int, int]]:
+    """
+    Record [(key, rule, pending)] from the local tier in one pipeline.
 
-
-def _client_ip(request: Request) -> str:
-    peer_ip = request.client.host if request.client else None
+    Returns (remaining, reset_ms) for each entry.
+    """
+    async with redis.pipeline(transaction=False) as pipe:
+        for key, rule, pending in batch:
+            script = redis.register_script(RATE_LIMIT_SCRIPTS[rule.algorithm])
+            await script(keys=[key], args=_script_args(rule, now_ms, 0, pending), client=pipe)
+        results = await pipe.execute()
+    return [(int(remaining), int(reset_ms)) for _, remaining, reset_ms in results]
+
+
+local_limiter = LocalRateLimiter(
+    batch=settings.rate_limit_local_batch,
+    sync_ms=settings.rate_limit_local_sync_ms,
+    sync=sync_rate_limits,
+)
+
+
+async def check_rate_limit(
+    redis, rule: "RateRule", key: str, now_ms: int, limiter: LocalRateLimiter | None = None
+) -> tuple[int, int, int]:
+    """Count one request: (allowed, remaining, reset_ms). Local tier first, then Redis."""
+    limiter = limiter or local_limiter
+    if limiter.enabled and (local := limiter.admit(key)) is not None:
+        return 1, *local
+    pending = limiter.take_pending(key)
+    result = None
+    try:
+        allowed, remaining, reset_ms = await redis.register_script(
+            RATE_LIMIT_SCRIPTS[rule.algorithm]
+        )(keys=[key], args=_script_args(rule, now_ms, 1, pending))
+        result = int(remaining), int(reset_ms)
+    finally:
+        if limiter.enabled:
+            limiter.settle(key, rule, pending + 1, result)
+    return int(allowed), int(remaining), int(reset_ms)
+
+
+def rate_limit_key(rule: "RateRule", ident: str, route: str) -> str:
+    if rule.algorithm == "log":
+        return f"rl:{rule.limit}:{rule.window}:{ident}:{route}"
+    return f"rl:{rule.algorithm}:{rule.limit}:{rule.window}:{ident}:{route}"
+
+
+def rate_limit_headers(
+    rule: "RateRule", allowed: int, remaining: int, reset_ms: int, now_ms: int
+) -> dict[str, str]:
+    """X-RateLimit-* headers for a checked request, plus Retry-After when it was rejected."""
+    headers = {
+        "X-RateLimit-Limit": str(rule.limit),
+        "X-RateLimit-Remaining": str(remaining),
+        "X-RateLimit-Reset": str(int(reset_ms) // 1000),
+    }
+    if not allowed:
+        headers["Retry-After"] = str(max(0, math.ceil((int(reset_ms) - now_ms) / 1000)))
+    return headers
+
+
+def client_ip(scope: Scope) -> str:
+    """Client IP for rate limits and throttles (X-Forwarded-For only from a trusted proxy)."""
+    peer_ip = scope["client"][0] if scope.get("client") else None
 
     # Trust X-Forwarded-For only when explicitly enabled AND (optionally) coming from an allowlisted proxy.
     if settings.trust_proxy_headers:
@@ -20,7 +161,7 @@ def _client_ip(request: Request) -> str:
         if allowed and peer_ip not in allowed:
             return peer_ip or "unknown"
 
-        forwarded = request.headers.get("x-forwarded-for")
+        forwarded = Headers(scope=scope).get("x-forwarded-for")
         if forwarded:
             first = forwarded.split(",")[0].strip()
             if first:
@@ -30,46 +171,100 @@ def _client_ip(request: Request) -> str:
 
 
 class RateRule:
-    __slots__ = ("pattern", "limit", "window")
+    __slots__ = ("pattern", "limit", "window", "algorithm")
 
-    def __init__(self, pattern: str, limit: int, window: int):
+    def __init__(self, pattern: str, limit: int, window: int, algorithm: str | None = None):
         self.pattern = re.compile(pattern)
         self.limit = limit
         self.window = window
+        self.algorithm = algorithm or settings.rate_limit_algorithm
+        if self.algorithm not in RATE_LIMIT_SCRIPTS:
+            raise ValueError(f"Unsupported rate limit algorithm {self.algorithm!r}")
+
+
+# Rate-limit bucket of requests that match no route (404s): one per subject, whatever the path.
+UNMATCHED_ROUTE = "<unmatched>"
+
+# (path regex, methods or None for any, path template), in the router's order
+RouteTable = list[tuple[re.Pattern[str], frozenset[str] | None, str]]
+
+
+def compile_route_table(routes: Iterable[BaseRoute]) -> RouteTable:
+    """Flatten an app's routes into the table `_route_template` matches against."""
+    table: RouteTable = []
+    for route in routes:
+        # Routers included by FastAPI resolve their routes lazily; expand them in place.
+        contexts = getattr(route, "effective_route_contexts", None)
+        if contexts is not None:
+            table.extend(compile_route_table(contexts()))
+        elif hasattr(route, "path_regex"):
+            methods = getattr(route, "methods", None)
+            table.append(
+                (route.path_regex, frozenset(methods) if methods else None, route.path_format)
+            )
+    return table
 
 
-class RateLimiterMiddleware(BaseHTTPMiddleware):
-    """
-    Sliding-window rate limiting backed by Redis ZSET.
-
-    Key: `rate:{subject}:{path}` where subject is either user_id (if authenticated) or client IP.
+def _route_template(table: RouteTable, method: str, path: str) -> str:
+    """Template of the route a request will be dispatched to, first match wins like Starlette."""
+    partial = None
+    for regex, methods, template in table:
+        if regex.match(path):
+            if methods is None or method in methods:
+                return template
+            if partial is None:
+                partial = template  # wrong method: same route, answered with 405
+    return partial or UNMATCHED_ROUTE
 
-    Algorithm per request:
-    1) ZADD(now) to store the current timestamp.
-    2) ZREMRANGEBYSCORE(0..window_start) to drop old entries.
-    3) ZCARD to count requests in the current window.
-    4) EXPIRE to avoid unbounded key growth.
 
-    If count exceeds the limit, return 429 and include:
+class RateLimiterMiddleware:
+    """
+    Pure ASGI rate limiting backed by Redis, with the algorithm chosen per rule
+    (RATE_LIMIT_ALGORITHM by default):
+
+    - "log": sliding window, a ZSET of request timestamps per key.
+    - "gcra": generic cell rate algorithm, one number per key (see GCRA_LUA).
+
+    Key: `rl:[gcra:]{limit}:{window}:{subject}:{route}` where subject is either user_id
+    (set by AuthenticationMiddleware for a valid access token) or client IP, and route is
+    the template of the matched route (`/api/v1/users/{user_id}`, so varying the id does not
+    give a fresh bucket; paths that match no route share UNMATCHED_ROUTE). Rule patterns are
+    matched against the template too (or the path, for unmatched requests). Both are resolved
+    against a route table compiled from the app's routes on the first request, once per
+    method and path, and memoized (up to `route_cache_size` entries).
+
+    Per request, one EVALSHA of the rule's script (loaded at startup by
+    `load_rate_limit_scripts`) checks and records the request atomically and returns
+    allowed / remaining / reset. For "log" that is:
+    1) drop entries older than the window (ZREMRANGEBYSCORE),
+    2) count the rest (ZCARD),
+    3) if under the limit, add the request (ZADD) and refresh the TTL (PEXPIRE),
+    4) reset = oldest entry + window.
+
+    With RATE_LIMIT_LOCAL_BATCH > 0, `local_limiter` admits requests that are clearly under
+    the limit without Redis and records them in batches (see middleware/local_limiter.py).
+
+    Every response carries:
     - X-RateLimit-Limit
     - X-RateLimit-Remaining
     - X-RateLimit-Reset
-    - Retry-After
+    and a 429 also carries Retry-After.
 
     Client IP:
     - Uses X-Forwarded-For only when `TRUST_PROXY_HEADERS=true` (trusted reverse proxy).
-    - Otherwise uses request.client.host to prevent spoofing.
+    - Otherwise uses the peer address (scope["client"]) to prevent spoofing.
     """
 
     def __init__(
         self,
-        app,
+        app: ASGIApp,
         rules: Iterable[RateRule] | None = None,
         default_limit: int = None,
         default_window: int = None,
         whitelist_paths: Iterable[str] | None = None,
+        route_cache_size: int = 10_000,
     ):
-        super().__init__(app)
+        self.app = app
         self.logger = logging.getLogger("app")
 
         self.default_limit = default_limit or settings.rate_limit_max_requests
@@ -78,92 +273,85 @@ class RateLimiterMiddleware(BaseHTTPMiddleware):
         # Rules are evaluated from most specific to least specific
         self.rules = list(rules or [])
         self.whitelist = set(whitelist_paths or ["/health", "/metrics"])
+        self.default_rule = RateRule(
+            pattern=r".*", limit=self.default_limit, window=self.default_window
+        )
+
+        # "METHOD path" -> (route template, rule); insertion-ordered, oldest evicted when full
+        self.route_cache_size = route_cache_size
+        self._routes: dict[str, tuple[str, RateRule]] = {}
+        self._route_table: RouteTable | None = None  # compiled on the first request
 
     def _pick_rule(self, path: str) -> RateRule:
         for r in self.rules:
             if r.pattern.match(path):
                 return r
-        return RateRule(pattern=r".*", limit=self.default_limit, window=self.default_window)
-
-    async def dispatch(self, request: Request, call_next: RequestResponseEndpoint) -> Response:
+        return self.default_rule
+
+    def _resolve(self, scope: Scope) -> tuple[str, RateRule]:
+        path = scope["path"]
+        cache_key = f"{scope['method']} {path}"  # one path can reach different routes by method
+        resolved = self._routes.get(cache_key)
+        if resolved is None:
+            if self._route_table is None:
+                self._route_table = compile_route_table(scope["app"].router.routes)
+            route = _route_template(self._route_table, scope["method"], path)
+            # Unmatched paths still pick their rule by path (e.g. the /api/v1 default).
+            resolved = route, self._pick_rule(path if route == UNMATCHED_ROUTE else route)
+            if len(self._routes) >= self.route_cache_size:
+                del self._routes[next(iter(self._routes))]
+            self._routes[cache_key] = resolved
+        return resolved
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
         # In tests, bypass rate limiting
-        if getattr(settings, "testing", False):
-            return await call_next(request)
+        if scope["type"] != "http" or getattr(settings, "testing", False):
+            await self.app(scope, receive, send)
+            return
 
         # Whitelisted paths bypass rate limiting
-        if request.url.path in self.whitelist:
-            self.logger.info("[rate] skip (whitelist): %s", request.url.path)
-            return await call_next(request)
+        path = scope["path"]
+        if path in self.whitelist:
+            self.logger.info("[rate] skip (whitelist): %s", path)
+            await self.app(scope, receive, send)
+            return
 
-        rule = self._pick_rule(request.url.path)
+        route, rule = self._resolve(scope)
 
         # Determine the rate-limit subject
-        subject = getattr(getattr(request, "state", object()), "user_id", None)
+        subject = scope.get("state", {}).get("user_id")
         if subject:
             ident = f"user:{subject}"
         else:
-            ident = f"ip:{_client_ip(request)}"
+            ident = f"ip:{client_ip(scope)}"
 
-        key = f"rl:{rule.limit}:{rule.window}:{ident}:{request.url.path}"
         now_ms = int(time.time() * 1000)
-        win_ms = rule.window * 1000
-
-        redis = request.app.state.redis
+        key = rate_limit_key(rule, ident, route)
 
-        # Use a pipeline to minimize round-trips
-        pipe = redis.pipeline(transaction=False)
-        pipe.zremrangebyscore(key, 0, now_ms - win_ms)
-        pipe.zcard(key)
         try:
-            _, count = await pipe.execute()
+            allowed, remaining, reset_ms = await check_rate_limit(
+                scope["app"].state.redis, rule, key, now_ms
+            )
         except Exception as e:
             # If Redis is unavailable, degrade gracefully (do not block requests)
             req_id = request_id_ctx.get("-")
             self.logger.warning(f"[rate] Redis error, skip limiting (req_id={req_id}): {e}")
-            return await call_next(request)
-
-        if count >= rule.limit:
-            # Use the oldest timestamp to compute reset/retry-after
-            oldest = await redis.zrange(key, 0, 0, withscores=True)
-            if oldest:
-                oldest_ts_ms = int(oldest[0][1])
-                reset_epoch = (oldest_ts_ms + win_ms) // 1000
-                retry_after = max(0, reset_epoch - int(now_ms // 1000))
-            else:
-                reset_epoch = int((now_ms + win_ms) // 1000)
-                retry_after = rule.window
-
-            headers = {
-                "X-RateLimit-Limit": str(rule.limit),
-                "X-RateLimit-Remaining": "0",
-                "X-RateLimit-Reset": str(reset_epoch),
-                "Retry-After": str(retry_after),
-            }
-            return JSONResponse(
+            await self.app(scope, receive, send)
+            return
+
+        headers = rate_limit_headers(rule, allowed, remaining, reset_ms, now_ms)
+        if not allowed:
+            response = JSONResponse(
                 status_code=429,
                 content={"detail": "Too Many Requests"},
                 headers=headers,
             )
+            await response(scope, receive, send)
+            return
 
-        member = f"{now_ms}-{uuid.uuid4().hex}"
-        pipe = redis.pipeline(transaction=False)
-        pipe.zadd(key, {member: now_ms})
-        pipe.expire(key, rule.window)
-        pipe.zcard(key)
-        _, _, new_count = await pipe.execute()
-        remaining = max(0, rule.limit - int(new_count))
-
-        response = await call_next(request)
-
-        # Attach rate-limit headers to the response
-        oldest = await redis.zrange(key, 0, 0, withscores=True)
-        if oldest:
-            oldest_ts_ms = int(oldest[0][1])
-            reset_epoch = (oldest_ts_ms + win_ms) // 1000
-        else:
-            reset_epoch = int((now_ms + win_ms) // 1000)
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).update(headers)
+            await send(message)
 
-        response.headers["X-RateLimit-Limit"] = str(rule.limit)
-        response.headers["X-RateLimit-Remaining"] = str(remaining)
-        response.headers["X-RateLimit-Reset"] = str(reset_epoch)
-        return response
+        await self.app(scope, receive, send_with_headers)
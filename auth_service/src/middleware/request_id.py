@@ -2,19 +2,32 @@ import logging
 import uuid
 
 from core.logging import request_id_ctx
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 logger = logging.getLogger("app")
 
 
-class RequestIDMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request, call_next):
-        request_id = request.headers.get("x-request-id", str(uuid.uuid4()))
+class RequestIDMiddleware:
+    """Pure ASGI: tags logs and the response with the request's X-Request-ID (or a new one)."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = Headers(scope=scope).get("x-request-id", str(uuid.uuid4()))
         request_id_ctx.set(request_id)
 
-        logger.info(f"Request {request.method} {request.url.path}")
-        response = await call_next(request)
-        logger.info(f"Response {response.status_code}")
+        logger.info(f"Request {scope['method']} {scope['path']}")
+
+        async def send_with_request_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                logger.info(f"Response {message['status']}")
+                MutableHeaders(scope=message)["x-request-id"] = request_id
+            await send(message)
 
-        response.headers["x-request-id"] = request_id
-        return response
+        await self.app(scope, receive, send_with_request_id)
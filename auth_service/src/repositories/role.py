@@ -41,6 +41,10 @@ class RoleRepository:
         await self.session.delete(role)
         await self.session.commit()
 
+    async def get_user_ids(self, role_id) -> builtins.list:
+        q = await self.session.execute(select(UserRole.user_id).where(UserRole.role_id == role_id))
+        return [row[0] for row in q.all()]
+
     async def remove_role(self, user_id, role_id):
         q = await self.session.execute(
             select(UserRole).where(UserRole.user_id == user_id, UserRole.role_id == role_id)
@@ -1,7 +1,8 @@
 from typing import TypedDict
 
+from core.config import settings
 from models import User
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 
 
 class LoginRequest(BaseModel):
@@ -29,3 +30,23 @@ class RegisterRequest(BaseModel):
 class AuthResult(TypedDict):
     user: User
     tokens: TokenPair
+
+
+class IntrospectRequest(BaseModel):
+    tokens: list[str] = Field(min_length=1, max_length=settings.introspect_max_tokens)
+
+
+class IntrospectionResult(BaseModel):
+    """RFC 7662 response: `active`, plus the verified claims of an active token."""
+
+    active: bool
+    token_type: str | None = None
+    sub: str | None = None
+    exp: int | None = None
+    iat: float | None = None
+    jti: str | None = None
+    roles: list[str] | None = None  # only with JWT_EMBED_ROLES
+
+
+class IntrospectResponse(BaseModel):
+    results: list[IntrospectionResult]  # same order as the request
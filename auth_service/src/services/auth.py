@@ -1,35 +1,84 @@
 from http import HTTPStatus
 from uuid import UUID
 
+from core.config import settings
 from fastapi import HTTPException, Request, Response
 from helpers.auth_helpers import (
+    SESSIONS_KEY,
     blacklist_token,
     clear_refresh_cookie,
+    get_authz_version,
+    get_refresh_user,
+    is_opaque_refresh_indexed,
+    is_opaque_token,
     issue_tokens,
+    lookup_opaque_refresh,
+    refresh_token_hash,
+    revoke_opaque_refresh,
+    revoke_user_sessions,
+    rotate_opaque_refresh,
+    rotate_refresh_token,
     set_refresh_cookie,
+    track_refresh_token,
     validate_refresh,
+    verify_refresh_claims,
 )
+from helpers.login_throttle import (
+    check_login_throttle,
+    record_login_failure,
+    reset_login_failures,
+)
+from middleware.rate_limit import client_ip
 from models import LoginHistory
 from schemas.auth import AuthResult, TokenPair
-from utils.security import verify_password
+from utils.jwt import is_token_revoked
+from utils.security import password_rehashes, verify_and_update_password_async
 
 from .base import BaseService
 
 
 class AuthService(BaseService):
-    async def authenticate_user(self, username: str, password: str) -> AuthResult | None:
-        """Validate credentials and issue tokens."""
+    async def authenticate_user(
+        self, username: str, password: str, ip: str = ""
+    ) -> AuthResult | None:
+        """Validate credentials and issue tokens (429 while the username is throttled for `ip`)."""
+        failures = await check_login_throttle(self.redis, username, ip)
+
         user = await self.repo.get_by_username(username)
-        if not user or not verify_password(password, user.hashed_password):
+        ok, new_hash = (
+            await verify_and_update_password_async(password, user.hashed_password)
+            if user
+            else (False, None)
+        )
+        if not ok:
+            await record_login_failure(self.redis, username, ip)
             return None
-
-        tokens: TokenPair = issue_tokens(user)
-
-        if self.redis:
-            await self.redis.sadd(f"user_refresh:{user.user_id}", tokens.refresh_token)
+        if failures:
+            await reset_login_failures(self.redis, username, ip)
+        if new_hash:
+            # PASSWORD_SCHEMES or cost changed since this hash was made: upgrade it now that
+            # we have the plain password.
+            user.hashed_password = new_hash
+            await self.repo.session.commit()
+            password_rehashes.inc()
+
+        tokens: TokenPair = await issue_tokens(user, await self.authz_claims(user))
+        await track_refresh_token(self.redis, user.user_id, tokens.refresh_token)
 
         return {"user": user, "tokens": tokens}
 
+    async def authz_claims(self, user) -> dict:
+        """Role claims for the access token when JWT_EMBED_ROLES is on (else empty)."""
+        if not settings.jwt_embed_roles:
+            return {}
+        # Read the version before the roles: a concurrent change then makes the token stale
+        # (DB fallback) instead of carrying old roles under the new version.
+        version = await get_authz_version(self.redis, user.user_id)
+        if version is None:
+            return {}
+        roles = await self.repo.get_user_roles(user.user_id)
+        return {"roles": sorted(roles), "authz_ver": version}
+
     async def record_login(self, user_id: UUID | str, user_agent: str, ip_address: str):
         """Record a login event in the login history."""
         login = LoginHistory(user_id=user_id, user_agent=user_agent, ip_address=ip_address)
@@ -38,24 +87,24 @@ class AuthService(BaseService):
 
     async def logout(self, user_id: UUID, refresh_token: str):
         """Logout a single token."""
-        if self.redis:
-            await blacklist_token(self.redis, refresh_token)
-            await self.redis.srem(f"user_refresh:{user_id}", refresh_token)
+        if not self.redis:
+            return
+        if is_opaque_token(refresh_token):
+            await revoke_opaque_refresh(self.redis, user_id, refresh_token_hash(refresh_token))
+        else:
+            jti = await blacklist_token(self.redis, refresh_token)
+            await self.redis.zrem(SESSIONS_KEY.format(user_id), jti)
 
     async def logout_all(self, user_id: UUID):
-        """Logout all refresh tokens for the user."""
+        """Revoke every token of the user (one Redis write, however many sessions)."""
         if not self.redis:
             return
-        tokens = await self.redis.smembers(f"user_refresh:{user_id}")
-        for token in tokens:
-            token = token.decode() if isinstance(token, bytes) else token
-            await blacklist_token(self.redis, token)
-        await self.redis.delete(f"user_refresh:{user_id}")
+        await revoke_user_sessions(self.redis, user_id)
 
     async def login_with_form(
         self, username: str, password: str, request: Request, response: Response
     ) -> TokenPair:
-        result = await self.authenticate_user(username, password)
+        result = await self.authenticate_user(username, password, client_ip(request.scope))
         if not result:
             raise HTTPException(status_code=HTTPStatus.UNAUTHORIZED, detail="Invalid credentials")
 
@@ -69,26 +118,67 @@ class AuthService(BaseService):
         set_refresh_cookie(response, tokens.refresh_token)
         return tokens
 
-    async def login_with_json(self, username: str, password: str) -> TokenPair:
-        result = await self.authenticate_user(username, password)
+    async def login_with_json(self, username: str, password: str, ip: str = "") -> TokenPair:
+        result = await self.authenticate_user(username, password, ip)
         if not result:
             raise HTTPException(status_code=HTTPStatus.UNAUTHORIZED, detail="Invalid credentials")
         return result["tokens"]
 
     async def refresh_by_cookie(self, refresh_token: str | None) -> TokenPair:
-        user = await validate_refresh(refresh_token, self.repo.session, self.redis, self)
+        if refresh_token and is_opaque_token(refresh_token):
+            return await self._refresh_opaque(refresh_token)
+
+        # 1) verify the old refresh once (signature, exp, type)
+        payload = await verify_refresh_claims(refresh_token)
+
+        # 2) a replayed or revoked token stops here, before the DB lookup and signing
+        #    (revocation filter, at most one MGET); step 4 re-checks it atomically
+        if self.redis and await is_token_revoked(self.redis, payload):
+            raise HTTPException(status_code=HTTPStatus.UNAUTHORIZED, detail="Token revoked")
+        user = await get_refresh_user(payload, self)
+
+        # 3) issue new pair (an opaque refresh is stored before it is indexed below; it
+        #    replaces the old session, so no eviction)
+        tokens: TokenPair = await issue_tokens(user, await self.authz_claims(user))
+        if self.redis and is_opaque_token(tokens.refresh_token):
+            await track_refresh_token(self.redis, user.user_id, tokens.refresh_token, 0)
+
+        # 4) revoke old + unindex old + index new, atomically (fails if already revoked)
+        if self.redis and not await rotate_refresh_token(self.redis, payload, tokens.refresh_token):
+            if is_opaque_token(tokens.refresh_token):
+                await revoke_opaque_refresh(
+                    self.redis, user.user_id, refresh_token_hash(tokens.refresh_token)
+                )
+            raise HTTPException(status_code=HTTPStatus.UNAUTHORIZED, detail="Token revoked")
 
-        # 1) revoke old refresh immediately
-        if self.redis and refresh_token:
-            await blacklist_token(self.redis, refresh_token)
-            await self.redis.srem(f"user_refresh:{user.user_id}", refresh_token)
-
-        # 2) issue new pair
-        tokens: TokenPair = issue_tokens(user)
+        return tokens
 
-        # 3) track new refresh
-        if self.redis:
-            await self.redis.sadd(f"user_refresh:{user.user_id}", tokens.refresh_token)
+    async def _refresh_opaque(self, refresh_token: str) -> TokenPair:
+        """
+        Opaque rotation: one GET to find the user, one ZSCORE to check the token is still
+        indexed, one script to swap it. No RSA verify.
+        """
+        user_id = await lookup_opaque_refresh(self.redis, refresh_token)
+        # a revoked or evicted token stops here, before the DB lookup and signing; the rotation
+        # script below re-checks it atomically
+        if not await is_opaque_refresh_indexed(self.redis, user_id, refresh_token):
+            raise HTTPException(status_code=HTTPStatus.UNAUTHORIZED, detail="Token revoked")
+        user = await get_refresh_user({"sub": user_id}, self)
+
+        tokens: TokenPair = await issue_tokens(user, await self.authz_claims(user))
+        if is_opaque_token(tokens.refresh_token):
+            rotated = await rotate_opaque_refresh(
+                self.redis, user_id, refresh_token, tokens.refresh_token
+            )
+        else:
+            # REFRESH_TOKEN_MODE switched back to jwt: consume the opaque token, index the JWT.
+            rotated = bool(
+                await revoke_opaque_refresh(self.redis, user_id, refresh_token_hash(refresh_token))
+            )
+            if rotated:
+                await track_refresh_token(self.redis, user.user_id, tokens.refresh_token)
+        if not rotated:
+            raise HTTPException(status_code=HTTPStatus.UNAUTHORIZED, detail="Token revoked")
 
         return tokens
 
@@ -98,7 +188,11 @@ class AuthService(BaseService):
         if not refresh_token:
             raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail="No refresh token")
 
-        user = await validate_refresh(refresh_token, self.repo.session, self.redis, self)
-        await self.logout(user.user_id, refresh_token)
+        if is_opaque_token(refresh_token):
+            user_id = await lookup_opaque_refresh(self.redis, refresh_token)
+        else:
+            user = await validate_refresh(refresh_token, self.repo.session, self.redis, self)
+            user_id = user.user_id
+        await self.logout(user_id, refresh_token)
         clear_refresh_cookie(response)
         return {"detail": "Logged out successfully"}
@@ -3,17 +3,19 @@ import uuid
 
 from core.oauth.interfaces import OAuthProvider
 from core.oauth.types import OAuthUserInfo
+from helpers.auth_helpers import issue_tokens, track_refresh_token
+from redis.asyncio import Redis
 from repositories.social_accounts import SocialAccountRepository
 from repositories.user import UserRepository
 from schemas.oauth import OAuthCallbackResponse
 from services.user import UserService
 from sqlalchemy.ext.asyncio import AsyncSession
-from utils.jwt import create_access_token, create_refresh_token
 
 
 class OAuthService:
-    def __init__(self, providers: dict[str, OAuthProvider]):
+    def __init__(self, providers: dict[str, OAuthProvider], redis: Redis | None = None):
         self.providers = providers
+        self.redis = redis
 
     def get_provider(self, name: str) -> OAuthProvider:
         if name not in self.providers:
@@ -47,11 +49,8 @@ class OAuthService:
             username = info.login or f"user_{info.provider_account_id}"
             email = info.email or f"{username}@no-email.local"
 
-            user = await user_service.create_user(
-                username=username,
-                email=email,
-                password=uuid.uuid4().hex,
-            )
+            # No local password: nothing to hash, and password login is refused.
+            user = await user_service.create_user(username=username, email=email, password=None)
 
             await socials.link(
                 user_id=user.user_id,
@@ -61,12 +60,14 @@ class OAuthService:
 
         await db.commit()
 
-        payload = {"sub": str(user.user_id), "email": user.email}
+        tokens = await issue_tokens(user)
+        # Opaque refresh tokens only exist once stored; JWT ones join the user's session set.
+        await track_refresh_token(self.redis, user.user_id, tokens.refresh_token)
         return OAuthCallbackResponse(
             user_id=str(user.user_id),
             email=user.email,
-            access_token=create_access_token(payload),
-            refresh_token=create_refresh_token(payload),
+            access_token=tokens.access_token,
+            refresh_token=tokens.refresh_token,
             provider=provider,
         )
 
@@ -2,6 +2,7 @@ from http import HTTPStatus
 from uuid import UUID
 
 from fastapi import HTTPException
+from helpers.auth_helpers import bump_authz_version
 from models import Role
 from schemas.role import RoleCreate, RoleUpdate
 from services.base import BaseService
@@ -23,13 +24,16 @@ class RoleService(BaseService):
         role = await self.repo.get_by_id(role_id)
         if not role:
             raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Role not found")
+        user_ids = await self.repo.get_user_ids(role_id) if self.redis else []
         await self.repo.delete(role)
+        await bump_authz_version(self.redis, *user_ids)
 
     async def update(self, role_id: UUID, data: RoleUpdate) -> Role:
         role = await self.repo.get_by_id(role_id)
         if not role:
             raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Role not found")
 
+        renamed = bool(data.name) and data.name != role.name
         if data.name:
             existing = await self.repo.get_by_name(data.name)
             if existing and existing.role_id != role_id:
@@ -41,7 +45,11 @@ class RoleService(BaseService):
         if data.description is not None:
             role.description = data.description
 
-        return await self.repo.update(role)
+        role = await self.repo.update(role)
+        if renamed and self.redis:
+            # Role names are what access tokens carry (JWT_EMBED_ROLES).
+            await bump_authz_version(self.redis, *await self.repo.get_user_ids(role_id))
+        return role
 
     async def get_guest_role(self) -> Role:
         role = await self.repo.get_role_by_name("guest")
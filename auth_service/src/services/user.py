@@ -3,6 +3,7 @@ from http import HTTPStatus
 from fastapi import HTTPException
 from fastapi_pagination import Page, Params
 from fastapi_pagination.ext.sqlalchemy import apaginate
+from helpers.auth_helpers import bump_authz_version
 from models import LoginHistory, Role, User, UserRole
 from schemas.user import (
     UserUpdateRequest,
@@ -10,7 +11,7 @@ from schemas.user import (
 )
 from services.base import BaseService
 from sqlalchemy import select
-from utils.security import hash_password, verify_password
+from utils.security import UNUSABLE_PASSWORD, hash_password_async, verify_password_async
 
 
 class UserService(BaseService):
@@ -23,7 +24,8 @@ class UserService(BaseService):
     async def get_user_by_username(self, username: str) -> User | None:
         return await self.repo.get_by_username(username)
 
-    async def create_user(self, username: str, email: str, password: str) -> User:
+    async def create_user(self, username: str, email: str, password: str | None) -> User:
+        """Create a user with the default role; `password=None` means no local password."""
         if await self.repo.get_by_email(email):
             raise HTTPException(
                 HTTPStatus.BAD_REQUEST,
@@ -35,7 +37,7 @@ class UserService(BaseService):
                 "Username already taken",
             )
 
-        hashed_pwd = hash_password(password)
+        hashed_pwd = await hash_password_async(password) if password else UNUSABLE_PASSWORD
         user = User(username=username, email=email, hashed_password=hashed_pwd)
         self.repo.session.add(user)
         await self.repo.session.flush()
@@ -78,8 +80,8 @@ class UserService(BaseService):
             updated = True
 
         if update.old_password and update.new_password:
-            if verify_password(update.old_password, current_user.hashed_password):
-                current_user.hashed_password = hash_password(update.new_password)
+            if await verify_password_async(update.old_password, current_user.hashed_password):
+                current_user.hashed_password = await hash_password_async(update.new_password)
                 updated = True
             else:
                 raise HTTPException(HTTPStatus.BAD_REQUEST, "Wrong password")
@@ -100,4 +102,5 @@ class UserService(BaseService):
             raise HTTPException(HTTPStatus.NOT_FOUND, "User not found")
         await self.repo.session.delete(user)
         await self.repo.session.commit()
+        await bump_authz_version(self.redis, user_id)
         return {"detail": "User deleted successfully"}
@@ -2,6 +2,7 @@ from http import HTTPStatus
 from uuid import UUID
 
 from fastapi import HTTPException
+from helpers.auth_helpers import bump_authz_version
 from models import Role
 from schemas.user import CurrentUserResponse
 from schemas.user_role import UserRoleListResponse
@@ -25,6 +26,7 @@ class UserRoleService(BaseService):
             roles = await self.repo.get_roles_for_user(user_id)
             await self.redis.delete(f"user_roles:{user_id}")
             await self.redis.sadd(f"user_roles:{user_id}", *[r.name for r in roles])
+            await bump_authz_version(self.redis, user_id)
 
         return {"detail": f"Role {role_id} assigned to user {user_id}"}
 
@@ -41,6 +43,7 @@ class UserRoleService(BaseService):
             await self.redis.delete(f"user_roles:{user_id}")
             if roles:
                 await self.redis.sadd(f"user_roles:{user_id}", *[r.name for r in roles])
+            await bump_authz_version(self.redis, user_id)
 
         return {"detail": f"Role {role_id} removed from user {user_id}"}
 
@@ -11,13 +11,20 @@ This module defines:
 Some routes require a strict authenticated user; those dependencies do not fall back to guest.
 """
 
+import hmac
+import time
+from typing import Any
+
 import redis.asyncio as redis
+from core.config import settings
+from core.metrics import metrics
 from core.oauth.providers.google import GoogleOAuthProvider
 from core.oauth.providers.yandex import YandexOAuthProvider
 from db.postgres import get_session
 from db.redis_db import get_redis
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Header, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
+from helpers.auth_helpers import get_authz_version
 from models import Role, User
 from repositories.role import RoleRepository
 from repositories.user import UserRepository
@@ -39,14 +46,50 @@ from utils.jwt import decode_token
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login")
 oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login", auto_error=False)
 
+authz_from_claims = metrics.counter(
+    "authz_from_claims_total", "Role checks answered from access-token claims (no DB)"
+)
+authz_stale_claims = metrics.counter(
+    "authz_stale_claims_total", "Role claims rejected as stale (authz version changed)"
+)
+
 
 # =============================
-# Internal helper
+# Internal helpers
 # =============================
+async def _access_claims(
+    token: str | None,
+    redis: redis.Redis,
+    request: Request = None,
+) -> dict[str, Any] | None:
+    """
+    Claims of a valid *access* token, or None (missing/invalid/expired/revoked/non-access).
+
+    Reuses the result AuthenticationMiddleware stored in `request.state` for this token, so
+    the token is verified once per request however many dependencies need it; decodes it
+    here when the middleware did not check it (no request, or no Redis on the app).
+    Does NOT raise.
+    """
+    if not token:
+        return None
+
+    state = request.scope.get("state", {}) if request is not None else {}
+    if state.get("access_token") == token:
+        return state["claims"]
+
+    try:
+        payload = await decode_token(token, redis=redis, token_type="access")
+    except Exception:
+        return None
+
+    return payload if payload.get("type") == "access" else None
+
+
 async def _get_user_from_token(
     token: str | None,
     session: AsyncSession,
     redis: redis.Redis,
+    request: Request = None,
 ) -> User | None:
     """
     Best-effort access token resolver.
@@ -56,15 +99,8 @@ async def _get_user_from_token(
     - Returns None for missing/invalid token, decode failures, non-access tokens, or unknown users.
     - Does NOT raise HTTPException (public routes may treat invalid tokens as anonymous).
     """
-    if not token:
-        return None
-
-    try:
-        payload = await decode_token(token, redis=redis)
-    except Exception:
-        return None
-
-    if payload.get("type") != "access":
+    payload = await _access_claims(token, redis, request)
+    if payload is None:
         return None
 
     result = await session.execute(select(User).where(User.user_id == payload.get("sub")))
@@ -139,10 +175,33 @@ async def _build_guest_principal(session: AsyncSession) -> CurrentUserResponse:
     return CurrentUserResponse(id=None, username="guest", email=None, roles=roles)
 
 
+# (expires_at, principal) of the last built guest principal, per worker.
+_guest_cache: tuple[float, CurrentUserResponse] | None = None
+
+
+async def _get_guest_principal(session: AsyncSession) -> CurrentUserResponse:
+    """
+    _build_guest_principal() reused for GUEST_PRINCIPAL_CACHE_TTL_SEC.
+
+    Anonymous and invalid-token traffic would otherwise cost one or two role queries
+    per request. The returned object is shared; callers must not mutate it.
+    """
+    global _guest_cache
+    now = time.monotonic()
+    if _guest_cache is not None and _guest_cache[0] > now:
+        return _guest_cache[1]
+
+    principal = await _build_guest_principal(session)
+    if settings.guest_principal_cache_ttl_sec > 0:
+        _guest_cache = (now + settings.guest_principal_cache_ttl_sec, principal)
+    return principal
+
+
 async def get_current_principal(
     session: AsyncSession = Depends(get_session),
     redis_cli: redis.Redis = Depends(get_redis),
     token: str | None = Depends(oauth2_scheme_optional),
+    request: Request = None,
 ) -> CurrentUserResponse:
     """
     Resolve the current principal for routes that allow anonymous access.
@@ -151,16 +210,9 @@ async def get_current_principal(
     - Missing/invalid token => guest principal (never raises).
     - Valid access token => authenticated principal + roles.
     """
-    if not token:
-        return await _build_guest_principal(session)
-
-    try:
-        payload = await decode_token(token, redis=redis_cli)
-    except Exception:
-        return await _build_guest_principal(session)
-
-    if payload.get("type") != "access":
-        return await _build_guest_principal(session)
+    payload = await _access_claims(token, redis_cli, request)
+    if payload is None:
+        return await _get_guest_principal(session)
 
     user_id = payload.get("sub")
     user_repo = UserRepository(session)
@@ -168,7 +220,7 @@ async def get_current_principal(
 
     user = await user_repo.get_by_id(user_id)
     if not user:
-        return await _build_guest_principal(session)
+        return await _get_guest_principal(session)
 
     roles = await ur_repo.get_roles_for_user(user.user_id)
     return CurrentUserResponse(
@@ -183,6 +235,7 @@ async def get_current_user(
     session: AsyncSession = Depends(get_session),
     redis: redis.Redis = Depends(get_redis),
     token: str = Depends(oauth2_scheme),
+    request: Request = None,
 ) -> User:
     """
     Strict authenticated-user dependency.
@@ -191,13 +244,9 @@ async def get_current_user(
     - Requires a valid *access* token.
     - Raises 401 on any auth failure (no guest fallback).
     """
-    try:
-        payload = await decode_token(token, redis=redis)
-    except Exception:
-        raise HTTPException(status_code=401, detail="Invalid authentication") from None
-
-    if payload.get("type") != "access":
-        raise HTTPException(status_code=401, detail="Invalid authentication") from None
+    payload = await _access_claims(token, redis, request)
+    if payload is None:
+        raise HTTPException(status_code=401, detail="Invalid authentication")
 
     user_id = payload.get("sub")
     result = await session.execute(select(User).where(User.user_id == user_id))
@@ -207,6 +256,44 @@ async def get_current_user(
     return user
 
 
+def _require_roles(required_roles: list[str], role_names: list[str]) -> None:
+    if not any(req in role_names for req in required_roles):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"Insufficient permissions. Required: {required_roles}, found: {role_names}",
+        )
+
+
+async def _authorize_from_claims(
+    token: str, redis: redis.Redis, required_roles: list[str], request: Request = None
+) -> dict[str, Any] | None:
+    """
+    JWT_EMBED_ROLES fast path: authorize from the token's `roles` claim.
+
+    Returns the claims on success, None when the token carries no roles or its
+    `authz_ver` no longer matches Redis (caller falls back to the DB check).
+    """
+    payload = await _access_claims(token, redis, request)
+    if payload is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Authentication required",
+        )
+
+    role_names = payload.get("roles")
+    if not isinstance(role_names, list):
+        return None
+
+    version = await get_authz_version(redis, payload.get("sub"))
+    if version is None or version != payload.get("authz_ver"):
+        authz_stale_claims.inc()
+        return None
+
+    authz_from_claims.inc()
+    _require_roles(required_roles, role_names)
+    return payload
+
+
 def get_current_user_with_roles(required_roles: list[str]):
     """
     Dependency factory for protected routes.
@@ -214,15 +301,22 @@ def get_current_user_with_roles(required_roles: list[str]):
     Contract:
     - 401 if unauthenticated
     - 403 if authenticated but missing required role(s)
-    - returns ORM User on success
+    - returns ORM User on success, or the access-token claims when authorized
+      from embedded roles (JWT_EMBED_ROLES)
     """
 
     async def dependency(
         token: str = Depends(oauth2_scheme),
         session: AsyncSession = Depends(get_session),
         redis: redis.Redis = Depends(get_redis),
-    ) -> User:
-        user = await _get_user_from_token(token, session, redis)
+        request: Request = None,
+    ) -> User | dict[str, Any]:
+        if settings.jwt_embed_roles:
+            claims = await _authorize_from_claims(token, redis, required_roles, request)
+            if claims is not None:
+                return claims
+
+        user = await _get_user_from_token(token, session, redis, request)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -232,23 +326,44 @@ def get_current_user_with_roles(required_roles: list[str]):
         service = UserRoleService(UserRoleRepository(session), redis)
         user_roles = await service.get_user_roles(user.user_id)
 
-        role_names = [r.name for r in user_roles]
-        if not any(req in role_names for req in required_roles):
+        _require_roles(required_roles, [r.name for r in user_roles])
+        return user
+
+    return dependency
+
+
+def require_shared_secret(setting: str):
+    """
+    Dependency factory for internal endpoints called by other services, not by users.
+
+    Contract:
+    - 503 while the secret setting (e.g. "metrics_secret") is empty: the endpoint is off
+    - 401 unless the caller sends `Authorization: Bearer <secret>`
+    """
+
+    async def dependency(authorization: str | None = Header(default=None)) -> None:
+        secret = getattr(settings, setting)
+        if not secret:
             raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail=f"Insufficient permissions. Required: {required_roles}, found: {role_names}",
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=f"Endpoint disabled: {setting.upper()} is not set",
+            )
+        if not hmac.compare_digest(authorization or "", f"Bearer {secret}"):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid client credentials"
             )
-
-        return user
 
     return dependency
 
 
-def get_oauth_service(db: AsyncSession = Depends(get_session)) -> OAuthService:
+def get_oauth_service(
+    db: AsyncSession = Depends(get_session),
+    redis_cli: redis.Redis = Depends(get_redis),
+) -> OAuthService:
     providers = {
         "yandex": YandexOAuthProvider(),
         "google": GoogleOAuthProvider(),
     }
-    svc = OAuthService(providers=providers)
+    svc = OAuthService(providers=providers, redis=redis_cli)
     svc.db = db
     return svc
@@ -0,0 +1,125 @@
+"""
+Bounded executor for CPU-bound work called from async handlers.
+
+Modes:
+- "inline":  run the callable directly on the event loop (no hop, blocks the loop);
+- "thread":  run it in a ThreadPoolExecutor (cryptography/bcrypt release the GIL);
+- "process": run it in a ProcessPoolExecutor (callables and arguments must be picklable).
+
+At most `max_concurrency` calls are submitted to the pool at once; the rest wait on an
+asyncio semaphore, which keeps the pool queue short and makes the backlog observable.
+Admission control (both 0 = off): with `max_queue` calls already waiting, or after waiting
+`max_wait_sec` for a slot, `run` raises ExecutorBusy instead of queueing further.
+
+Metrics (per executor name):
+- `{name}_queue_depth`    calls waiting for a slot
+- `{name}_in_flight`      calls running in the pool
+- `{name}_wait_seconds`   time spent waiting for a slot
+- `{name}_run_seconds`    time spent in the pool (including the hop)
+- `{name}_rejected_total` calls shed by admission control
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from collections.abc import Callable
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, TypeVar
+
+from core.metrics import metrics
+
+T = TypeVar("T")
+
+EXECUTOR_MODES = ("inline", "thread", "process")
+
+
+class ExecutorBusy(RuntimeError):
+    """The executor is saturated (queue full or wait too long); the call was not run."""
+
+
+class BoundedExecutor:
+    def __init__(
+        self,
+        name: str,
+        mode: str,
+        max_workers: int = 0,
+        max_concurrency: int = 0,
+        max_queue: int = 0,
+        max_wait_sec: float = 0,
+    ):
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(f"Unknown executor mode {mode!r}; expected one of {EXECUTOR_MODES}")
+        self.name = name
+        self.mode = mode
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_concurrency = max_concurrency or self.max_workers
+        self.max_queue = max_queue
+        self.max_wait_sec = max_wait_sec
+
+        self._pool: Executor | None = None
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        self.queue_depth = metrics.gauge(
+            f"{name}_queue_depth", "Calls waiting for an executor slot"
+        )
+        self.in_flight = metrics.gauge(f"{name}_in_flight", "Calls running in the executor")
+        self.wait_seconds = metrics.summary(
+            f"{name}_wait_seconds", "Time spent waiting for an executor slot"
+        )
+        self.run_seconds = metrics.summary(
+            f"{name}_run_seconds", "Time spent running in the executor"
+        )
+        self.rejected = metrics.counter(
+            f"{name}_rejected_total", "Calls shed because the executor was saturated"
+        )
+
+    @property
+    def is_process(self) -> bool:
+        return self.mode == "process"
+
+    def _get_pool(self) -> Executor:
+        if self._pool is None:
+            if self.is_process:
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix=self.name
+                )
+        return self._pool
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        if self.mode == "inline":
+            return fn(*args)
+
+        if self.max_queue and self._semaphore.locked() and self.queue_depth.value >= self.max_queue:
+            self.rejected.inc()
+            raise ExecutorBusy(f"{self.name}: {self.max_queue} calls already queued")
+
+        queued_at = time.perf_counter()
+        self.queue_depth.inc()
+        try:
+            async with asyncio.timeout(self.max_wait_sec or None):
+                await self._semaphore.acquire()
+        except TimeoutError:
+            self.rejected.inc()
+            raise ExecutorBusy(f"{self.name}: no slot within {self.max_wait_sec}s") from None
+        finally:
+            self.queue_depth.dec()
+
+        started_at = time.perf_counter()
+        self.wait_seconds.observe(started_at - queued_at)
+        self.in_flight.inc()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_pool(), fn, *args)
+        finally:
+            self.in_flight.dec()
+            self.run_seconds.observe(time.perf_counter() - started_at)
+            self._semaphore.release()
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
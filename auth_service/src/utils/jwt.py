@@ -1,32 +1,83 @@
+import asyncio
+import binascii
+import json
+import time
 import uuid
 from datetime import UTC, datetime, timedelta
-from typing import Any, cast
+from typing import Any
 
 import jwt
 from core.config import settings
+from core.keyring import JwtKey, keyring, load_key
+from core.metrics import metrics
 from fastapi import HTTPException, status
-from jwcrypto import jwk
+from jwt.utils import base64url_decode, base64url_encode
 from redis.asyncio import Redis
+from utils.executor import BoundedExecutor
+from utils.revocation_filter import EPOCH_PREFIX, RevocationFilter
+from utils.token_cache import RejectedTokenCache, VerifiedTokenCache
 
 # ---------- Constants ----------
 ACCESS_TOKEN_EXPIRE_MINUTES = 15
 REFRESH_TOKEN_EXPIRE_DAYS = 30
 
+# Signature-verified claims, reused until `exp` (revocation is still checked per call).
+verified_tokens = VerifiedTokenCache(settings.jwt_verify_cache_size)
+
+# Tokens that recently failed the signature check are rejected without crypto.
+rejected_tokens = RejectedTokenCache(
+    settings.jwt_reject_cache_size, settings.jwt_reject_cache_ttl_sec
+)
+# Local view of `blacklist:*`; only possible hits are checked in Redis (started in lifespan).
+revocation_filter = RevocationFilter(
+    settings.revocation_filter_capacity,
+    settings.revocation_filter_error_rate,
+    epoch_ttl_sec=REFRESH_TOKEN_EXPIRE_DAYS * 24 * 60 * 60,
+)
+
+precheck_rejections = metrics.counter(
+    "jwt_precheck_rejected_total", "Tokens rejected before signature verification"
+)
+
+# Signing/verification is CPU-bound; keep it off the event loop (see JWT_CRYPTO_MODE).
+crypto_executor = BoundedExecutor(
+    "jwt_crypto",
+    settings.jwt_crypto_mode,
+    max_workers=settings.jwt_crypto_workers,
+    max_concurrency=settings.jwt_crypto_max_concurrency,
+)
+
+# Process-pool workers rebuild keys from PEMs once per kid.
+_worker_keys: dict[str, JwtKey] = {}
+
 
 # ---------- Signing / Generation ----------
-def create_token(data: dict, expires_delta: timedelta, token_type: str) -> str:
+def _token_claims(data: dict, expires_delta: timedelta, token_type: str) -> dict[str, Any]:
     to_encode = data.copy()
-    expire = datetime.now(UTC) + expires_delta
+    now = datetime.now(UTC)
+    expire = now + expires_delta
     jti = str(uuid.uuid4())
-    to_encode.update({"exp": expire, "type": token_type, "jti": jti})
-    key = jwk.JWK.from_pem(settings.jwt_private_key.encode())
-    header = {"alg": settings.jwt_algorithm, "kid": key.thumbprint()}
-    return jwt.encode(
-        to_encode,
-        settings.jwt_private_key,
-        algorithm=settings.jwt_algorithm,
-        headers=header,
+    to_encode.update(
+        {
+            "iat": round(now.timestamp(), 3),  # ms precision: compared with revocation epochs
+            "exp": int(expire.timestamp()),
+            "type": token_type,
+            "jti": jti,
+        }
     )
+    return to_encode
+
+
+def create_token(data: dict, expires_delta: timedelta, token_type: str) -> str:
+    return sign_claims(_token_claims(data, expires_delta, token_type), keyring.active())
+
+
+def sign_claims(claims: dict[str, Any], key: JwtKey) -> str:
+    """Serialize and sign `claims` with `key` (header is pre-encoded per key)."""
+    payload_b64 = base64url_encode(json.dumps(claims, separators=(",", ":")).encode())
+    signing_input = key.header_b64 + b"." + payload_b64
+    signature = key.signer.sign(signing_input, key.private_key)
+    return (signing_input + b"." + base64url_encode(signature)).decode()
 
 
 def create_access_token(data: dict) -> str:
@@ -37,57 +88,278 @@ def create_refresh_token(data: dict) -> str:
     return create_token(data, timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS), "refresh")
 
 
-def create_token_pair(user_id: str, email: str) -> dict[str, str]:
+async def create_access_token_async(
+    user_id: str, email: str, access_claims: dict[str, Any] | None = None
+) -> str:
+    """Sign an access token on the crypto executor; `access_claims` are added as-is."""
+    claims = _token_claims(
+        {"sub": user_id, "email": email, **(access_claims or {})},
+        timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
+        "access",
+    )
+    return await sign(claims, keyring.active())
+
+
+async def create_token_pair(
+    user_id: str, email: str, access_claims: dict[str, Any] | None = None
+) -> dict[str, str]:
+    """Sign an access/refresh pair; `access_claims` are added to the access token only."""
     payload = {"sub": user_id, "email": email}
+    refresh_claims = _token_claims(payload, timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS), "refresh")
     return {
-        "access_token": create_access_token(payload),
-        "refresh_token": create_refresh_token(payload),
+        "access_token": await create_access_token_async(user_id, email, access_claims),
+        "refresh_token": await sign(refresh_claims, keyring.active()),
         "token_type": "bearer",
     }
 
 
 # ---------- Blacklist ----------
-async def is_token_blacklisted(redis: Redis | None, jti: str) -> bool:
+async def revocations(
+    redis: Redis | None, jtis: list[str], user_ids: list[str]
+) -> tuple[set[str], dict[str, float]]:
+    """
+    Revoked ids among `jtis` and the revocation epochs of `user_ids`, in at most one MGET.
+
+    Only revocation-filter hits are looked up in Redis; epochs come from the filter while it
+    is in sync. Users without an epoch are omitted.
+    """
     if not redis:
-        return False
-    exists = await redis.exists(f"blacklist:{jti}")
-    return cast(int, exists) > 0
+        return set(), {}
+    candidates = [jti for jti in jtis if revocation_filter.might_be_revoked(jti)]
+    if revocation_filter.ready:
+        epochs = {uid: e for uid in user_ids if (e := revocation_filter.epoch(uid)) is not None}
+        lookup_ids: list[str] = []
+    else:
+        epochs, lookup_ids = {}, list(user_ids)
+
+    keys = [f"blacklist:{jti}" for jti in candidates] + [
+        f"{EPOCH_PREFIX}{uid}" for uid in lookup_ids
+    ]
+    if not keys:
+        return set(), epochs
+    values = await redis.mget(keys)
+
+    revoked = {jti for jti, value in zip(candidates, values, strict=False) if value is not None}
+    if revocation_filter.ready:
+        revocation_filter.false_positives.inc(len(candidates) - len(revoked))
+    for uid, value in zip(lookup_ids, values[len(candidates) :], strict=True):
+        if value is not None:
+            epochs[uid] = float(value)
+    return revoked, epochs
+
+
+def issued_before_epoch(payload: dict[str, Any], epochs: dict[str, float]) -> bool:
+    """True if the token predates its user's revocation epoch (no `iat` counts as oldest)."""
+    epoch = epochs.get(payload.get("sub", ""))
+    return epoch is not None and payload.get("iat", 0) < epoch
+
+
+async def is_token_revoked(redis: Redis | None, payload: dict[str, Any]) -> bool:
+    """Blacklisted `jti`, or revoked by the user's epoch ("log out everywhere")."""
+    jti, sub = payload.get("jti"), payload.get("sub")
+    revoked, epochs = await revocations(redis, [jti] if jti else [], [sub] if sub else [])
+    return bool(revoked) or issued_before_epoch(payload, epochs)
 
 
 # ---------- Decode + Verification ----------
-async def decode_token(token: str, redis: Redis | None = None) -> dict[str, Any]:
+class TokenTypeError(jwt.InvalidTokenError):
+    """The token's `type` claim is not the one the caller expects (access vs refresh)."""
+
+
+def precheck(token: str, verify_exp: bool = True, token_type: str | None = None) -> JwtKey:
+    """
+    Reject obviously bad tokens before any signature work; return the verification key.
+
+    Parses the header and payload without crypto and checks: three segments of valid
+    base64url JSON, a known `kid` whose algorithm matches `alg`, `exp` in the future
+    (if verify_exp) and the expected `type` (if given). Raises jwt.InvalidTokenError
+    subclasses, like jwt.decode would.
+    """
     try:
-        payload = jwt.decode(
-            token,
-            settings.jwt_public_key,
-            algorithms=[settings.jwt_algorithm],
+        header_b64, payload_b64, _signature = token.split(".")
+        header = json.loads(base64url_decode(header_b64))
+        claims = json.loads(base64url_decode(payload_b64))
+    except (ValueError, binascii.Error):  # includes JSON and UTF-8 decode errors
+        precheck_rejections.inc()
+        raise jwt.DecodeError("Malformed token") from None
+    if not isinstance(header, dict) or not isinstance(claims, dict):
+        precheck_rejections.inc()
+        raise jwt.DecodeError("Malformed token")
+
+    try:
+        kid, alg = header.get("kid"), header.get("alg")
+        # both reach dict lookups and comparisons: anything but a string is just invalid
+        if not isinstance(alg, str) or not isinstance(kid, str | None):
+            raise jwt.InvalidTokenError("Invalid token header")
+        key = keyring.get(kid) if kid else keyring.active()
+        if key is None:
+            raise jwt.InvalidTokenError("Unknown signing key")
+        if alg != key.algorithm:
+            raise jwt.InvalidAlgorithmError("The specified alg value is not allowed")
+
+        exp = claims.get("exp")
+        if verify_exp and isinstance(exp, int | float) and exp <= time.time():
+            raise jwt.ExpiredSignatureError("Signature has expired")
+        if token_type is not None and claims.get("type") != token_type:
+            raise TokenTypeError("Invalid token type")
+    except jwt.InvalidTokenError:
+        precheck_rejections.inc()
+        raise
+    return key
+
+
+def unverified_claims(token: str) -> dict[str, Any]:
+    """Claims of a token this service just signed (no signature or expiry check)."""
+    return jwt.decode(token, options={"verify_signature": False})
+
+
+def _decode_with_key(token: str, key: JwtKey, verify_exp: bool = True) -> dict[str, Any]:
+    return jwt.decode(
+        token,
+        key.public_key,
+        algorithms=[key.algorithm],
+        options={"verify_exp": verify_exp},
+    )
+
+
+# ---------- Executor wrappers ----------
+def _worker_key(kid: str, algorithm: str, public_pem: bytes, private_pem: bytes | None) -> JwtKey:
+    """Process-pool side: parse each key once per worker process."""
+    cache_key = f"{kid}:{'sign' if private_pem else 'verify'}"
+    key = _worker_keys.get(cache_key)
+    if key is None:
+        key = _worker_keys[cache_key] = load_key(public_pem, private_pem, algorithm)
+    return key
+
+
+def _sign_in_worker(
+    kid: str, algorithm: str, public_pem: bytes, private_pem: bytes, claims: dict[str, Any]
+) -> str:
+    return sign_claims(claims, _worker_key(kid, algorithm, public_pem, private_pem))
+
+
+def _verify_in_worker(
+    kid: str, algorithm: str, public_pem: bytes, token: str, verify_exp: bool
+) -> dict[str, Any]:
+    return _decode_with_key(token, _worker_key(kid, algorithm, public_pem, None), verify_exp)
+
+
+async def sign(claims: dict[str, Any], key: JwtKey) -> str:
+    """sign_claims() on the crypto executor."""
+    if crypto_executor.is_process:
+        return await crypto_executor.run(
+            _sign_in_worker, key.kid, key.algorithm, key.public_pem, key.private_pem, claims
         )
+    return await crypto_executor.run(sign_claims, claims, key)
+
+
+async def verify(
+    token: str, verify_exp: bool = True, token_type: str | None = None
+) -> dict[str, Any]:
+    """Verified claims of a token (no revocation check); the signature check runs on the executor.
+
+    Order: verified cache -> precheck() -> rejected cache -> signature check.
+    verify_exp=False (revoking a possibly expired token) bypasses the verified cache.
+    """
+    key_set = keyring.current()
+    if verify_exp:
+        verified_tokens.reset_if_changed(key_set)
+        payload = verified_tokens.get(token)
+        if payload is not None:
+            if token_type is not None and payload.get("type") != token_type:
+                raise TokenTypeError("Invalid token type")
+            return payload
+
+    key = precheck(token, verify_exp, token_type)
+    rejected_tokens.reset_if_changed(key_set)
+    if token in rejected_tokens:
+        raise jwt.InvalidSignatureError("Signature verification failed")
+
+    try:
+        if crypto_executor.is_process:
+            payload = await crypto_executor.run(
+                _verify_in_worker, key.kid, key.algorithm, key.public_pem, token, verify_exp
+            )
+        else:
+            payload = await crypto_executor.run(_decode_with_key, token, key, verify_exp)
+    except jwt.DecodeError:  # bad signature; a time-dependent failure is not cached
+        if keyring.current() is key_set:
+            rejected_tokens.add(token)
+        raise
+
+    # Don't cache a result produced by a key that was rotated out while we waited.
+    if verify_exp and keyring.current() is key_set:
+        verified_tokens.put(token, payload)
+    return payload
+
+
+async def decode_token(
+    token: str, redis: Redis | None = None, token_type: str | None = None
+) -> dict[str, Any]:
+    try:
+        payload = await verify(token, token_type=token_type)
     except jwt.ExpiredSignatureError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Token expired"
         ) from None
+    except TokenTypeError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token type"
+        ) from None
     except jwt.InvalidTokenError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token"
         ) from None
 
-    # Blacklist check
-    jti = payload.get("jti")
-    if jti and await is_token_blacklisted(redis, jti):
+    # Blacklist + per-user epoch check
+    if await is_token_revoked(redis, payload):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token revoked")
 
     return payload
 
 
-# ---------- TTL ----------
-def get_token_ttl(token: str) -> int:
-    """Return token TTL in seconds (for Redis)."""
-    payload = jwt.decode(
-        token,
-        settings.jwt_public_key,
-        algorithms=[settings.jwt_algorithm],
-        options={"verify_exp": False},
+# ---------- Introspection ----------
+async def introspect_tokens(
+    tokens: list[str], redis: Redis | None = None, token_type: str | None = None
+) -> list[dict | None]:
+    """
+    Batch decode_token(): claims for each active token, None for invalid/expired/revoked
+    (or of another `token_type`, if given).
+
+    Signatures are checked concurrently on the crypto executor (memoized in
+    `verified_tokens`); duplicates are verified once; revocation (jti blacklist and user
+    epochs) is at most one MGET.
+    """
+    unique = list(dict.fromkeys(tokens))
+    results = await asyncio.gather(
+        *(verify(token, token_type=token_type) for token in unique), return_exceptions=True
     )
+
+    claims_by_token: dict[str, dict[str, Any]] = {}
+    for token, result in zip(unique, results, strict=True):
+        if isinstance(result, jwt.InvalidTokenError):
+            continue
+        if isinstance(result, BaseException):
+            raise result
+        claims_by_token[token] = result
+
+    jtis = [claims["jti"] for claims in claims_by_token.values() if claims.get("jti")]
+    subs = list(dict.fromkeys(c["sub"] for c in claims_by_token.values() if c.get("sub")))
+    revoked, epochs = await revocations(redis, jtis, subs)
+
+    return [
+        claims
+        if (claims := claims_by_token.get(token)) is not None
+        and claims.get("jti") not in revoked
+        and not issued_before_epoch(claims, epochs)
+        else None
+        for token in tokens
+    ]
+
+
+# ---------- TTL ----------
+def claims_ttl(payload: dict[str, Any]) -> int:
+    """TTL in seconds of already-verified claims (0 if expired or without `exp`)."""
     exp = payload.get("exp")
     if not exp:
         return 0
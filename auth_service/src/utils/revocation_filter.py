@@ -0,0 +1,223 @@
+"""
+Per-worker view of token revocations: a Bloom filter of revoked token ids (`jti`) and the
+per-user revocation epochs (`user_epoch:{user_id}`: tokens issued before it are revoked).
+
+`decode_token` checks both on every authenticated request, and almost every answer is
+"not revoked". The filter answers that locally; only a filter hit goes to Redis.
+
+- Seeded with `SCAN blacklist:*` / `SCAN user_epoch:*` and kept current through the
+  REVOCATION_CHANNEL / EPOCH_CHANNEL pub/sub channels: every write also publishes.
+- Subscribe first, then seed, so a revocation published while seeding is not missed.
+- While the filter is not in sync (startup, lost subscription) it is bypassed and every
+  check goes to Redis, as before.
+- Propagation window: a jti revoked by another worker is accepted here until its pub/sub
+  message arrives (normally milliseconds). Pub/sub is at-most-once, so a message lost with a
+  dropped connection is only recovered by the rebuild after resubscribing; until the loss is
+  noticed, this worker keeps accepting that token. The revoking worker adds the jti to its
+  own filter immediately. With REVOCATION_FILTER_ENABLED=false the filter is never started,
+  so every check goes to Redis and there is no such window.
+- Bloom bits cannot be cleared, but blacklist keys expire: once the filter holds
+  `capacity` entries it is rebuilt from the live keys (sized for at least twice as many).
+- An epoch only matters while tokens issued before it can still be valid: it is dropped
+  `epoch_ttl_sec` (the refresh token lifetime) after it was set, like its Redis key.
+
+Metrics (per filter name):
+- `{name}_negatives_total`        checks answered locally (Redis skipped)
+- `{name}_hits_total`             filter hits confirmed with Redis
+- `{name}_false_positives_total`  hits that Redis did not confirm
+- `{name}_bypassed_total`         checks sent to Redis because the filter was not in sync
+- `{name}_rebuilds_total`         rebuilds from Redis (startup, resubscribe, saturation)
+- `{name}_entries` / `{name}_epochs` / `{name}_ready`
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import math
+import time
+
+from core.metrics import metrics
+from redis.asyncio import Redis
+
+logger = logging.getLogger(__name__)
+
+REVOCATION_CHANNEL = "blacklist:events"
+BLACKLIST_PREFIX = "blacklist:"
+EPOCH_CHANNEL = "user_epoch:events"
+EPOCH_PREFIX = "user_epoch:"
+
+
+def _text(value: str | bytes) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (double hashing of one BLAKE2b digest)."""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = max(capacity, 1)
+        self.error_rate = error_rate
+        self.num_bits = max(8, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / self.capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, item: str) -> list[int]:
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, item: str) -> None:
+        for pos in self._positions(item):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    @property
+    def saturated(self) -> bool:
+        return self.count >= self.capacity
+
+
+class RevocationFilter:
+    def __init__(
+        self,
+        capacity: int,
+        error_rate: float,
+        name: str = "revocation_filter",
+        retry_sec: float = 1.0,
+        epoch_ttl_sec: float | None = None,
+    ):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.retry_sec = retry_sec
+        self.epoch_ttl_sec = epoch_ttl_sec
+        self.ready = False
+        self._bloom = BloomFilter(capacity, error_rate)
+        # oldest first (set_epoch moves a user to the end), so expired epochs are at the front
+        self._epochs: dict[str, float] = {}
+        self._task: asyncio.Task | None = None
+
+        self.negatives = metrics.counter(
+            f"{name}_negatives_total", "Revocation checks answered locally (Redis skipped)"
+        )
+        self.hits = metrics.counter(f"{name}_hits_total", "Filter hits checked against Redis")
+        self.false_positives = metrics.counter(
+            f"{name}_false_positives_total", "Filter hits that Redis did not confirm"
+        )
+        self.bypassed = metrics.counter(
+            f"{name}_bypassed_total", "Revocation checks sent to Redis (filter not in sync)"
+        )
+        self.rebuilds = metrics.counter(f"{name}_rebuilds_total", "Filter rebuilds from Redis")
+        metrics.gauge(
+            f"{name}_entries", "Entries added to the filter", fn=lambda: self._bloom.count
+        )
+        metrics.gauge(
+            f"{name}_epochs", "Users with a revocation epoch", fn=lambda: len(self._epochs)
+        )
+        metrics.gauge(f"{name}_ready", "1 while the filter is in sync", fn=lambda: int(self.ready))
+
+    # ---------- Checks ----------
+    def might_be_revoked(self, jti: str) -> bool:
+        """False only if `jti` is certainly not revoked; True means "ask Redis"."""
+        if not self.ready:
+            self.bypassed.inc()
+            return True
+        if jti in self._bloom:
+            self.hits.inc()
+            return True
+        self.negatives.inc()
+        return False
+
+    def add(self, jti: str) -> None:
+        self._bloom.add(jti)
+
+    def epoch(self, user_id: str) -> float | None:
+        """The user's revocation epoch as last seen (only meaningful while `ready`)."""
+        return self._epochs.get(user_id)
+
+    def set_epoch(self, user_id: str, epoch: float) -> None:
+        previous = self._epochs.pop(user_id, epoch)
+        self._epochs[user_id] = max(epoch, previous)
+
+    def prune_epochs(self, now: float | None = None) -> None:
+        """Drop epochs older than `epoch_ttl_sec`: every token issued before them has expired."""
+        if self.epoch_ttl_sec is None:
+            return
+        cutoff = (time.time() if now is None else now) - self.epoch_ttl_sec
+        while self._epochs:
+            user_id, epoch = next(iter(self._epochs.items()))
+            if epoch > cutoff:
+                break
+            del self._epochs[user_id]
+
+    # ---------- Sync ----------
+    async def rebuild(self, redis: Redis) -> None:
+        """Replace the filter and epochs with the live `blacklist:*` / `user_epoch:*` keys."""
+        jtis = [
+            _text(key)[len(BLACKLIST_PREFIX) :]
+            async for key in redis.scan_iter(match=f"{BLACKLIST_PREFIX}*", count=1000)
+        ]
+        bloom = BloomFilter(max(self.capacity, 2 * len(jtis)), self.error_rate)
+        for jti in jtis:
+            bloom.add(jti)
+
+        epoch_keys = [key async for key in redis.scan_iter(match=f"{EPOCH_PREFIX}*", count=1000)]
+        values = await redis.mget(epoch_keys) if epoch_keys else []
+        epochs = {
+            _text(key)[len(EPOCH_PREFIX) :]: float(value)
+            for key, value in zip(epoch_keys, values, strict=True)
+            if value is not None
+        }
+
+        self._bloom = bloom
+        self._epochs = dict(sorted(epochs.items(), key=lambda item: item[1]))
+        self.prune_epochs()
+        self.rebuilds.inc()
+
+    def _apply(self, message: dict) -> None:
+        data = _text(message["data"])
+        if _text(message["channel"]) == EPOCH_CHANNEL:
+            user_id, epoch = data.split(" ")
+            self.set_epoch(user_id, float(epoch))
+        else:
+            self.add(data)
+
+    async def start(self, redis: Redis) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._sync(redis))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self.ready = False
+
+    async def _sync(self, redis: Redis) -> None:
+        while True:
+            try:
+                async with redis.pubsub() as pubsub:
+                    await pubsub.subscribe(REVOCATION_CHANNEL, EPOCH_CHANNEL)
+                    await self.rebuild(redis)
+                    self.ready = True
+                    while True:
+                        message = await pubsub.get_message(
+                            ignore_subscribe_messages=True, timeout=1.0
+                        )
+                        if message is not None:
+                            self._apply(message)
+                        self.prune_epochs()
+                        if self._bloom.saturated:
+                            await self.rebuild(redis)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning("Revocation filter out of sync; checking Redis", exc_info=True)
+            finally:
+                self.ready = False
+            await asyncio.sleep(self.retry_sec)
@@ -1,6 +1,75 @@
+import statistics
+import time
+from collections.abc import Callable
+from http import HTTPStatus
+from typing import Any, TypeVar
+
+from core.config import settings
+from core.metrics import metrics
+from fastapi import HTTPException
 from passlib.context import CryptContext
+from utils.executor import BoundedExecutor, ExecutorBusy
+
+T = TypeVar("T")
+
+# Stored for accounts without a local password (e.g. created by an OAuth login). It is not a
+# hash any scheme produces, so nothing verifies against it, and it is rejected before any work.
+UNUSABLE_PASSWORD = "!"
+
+
+def make_context(
+    schemes: list[str],
+    bcrypt_rounds: int = 12,
+    argon2_time_cost: int = 3,
+    argon2_memory_cost: int = 65536,
+    argon2_parallelism: int = 4,
+) -> CryptContext:
+    """
+    New passwords are hashed with the first scheme and these parameters.
+
+    Hashes of the other schemes, bcrypt hashes with other rounds (fewer or more: lowering
+    BCRYPT_ROUNDS after a calibration rehashes too) and argon2 hashes with other parameters
+    still verify, but `needs_update` is true for them (rehashed on login).
+    """
+    return CryptContext(
+        schemes=schemes,
+        deprecated="auto",
+        bcrypt__rounds=bcrypt_rounds,
+        bcrypt__min_rounds=bcrypt_rounds,
+        bcrypt__max_rounds=bcrypt_rounds,
+        argon2__type="ID",
+        argon2__time_cost=argon2_time_cost,
+        argon2__memory_cost=argon2_memory_cost,
+        argon2__parallelism=argon2_parallelism,
+    )
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+pwd_context = make_context(
+    settings.password_scheme_list,
+    bcrypt_rounds=settings.bcrypt_rounds,
+    argon2_time_cost=settings.argon2_time_cost,
+    argon2_memory_cost=settings.argon2_memory_cost,
+    argon2_parallelism=settings.argon2_parallelism,
+)
+
+# bcrypt/argon2 cost tens to hundreds of ms of CPU per call; keep it off the event loop
+# (see PASSWORD_HASH_MODE).
+password_executor = BoundedExecutor(
+    "password_hash",
+    settings.password_hash_mode,
+    max_workers=settings.password_hash_workers,
+    max_concurrency=settings.password_hash_max_concurrency,
+    max_queue=settings.password_hash_max_queue,
+    max_wait_sec=settings.password_hash_max_wait_sec,
+)
+
+password_rehashes = metrics.counter(
+    "password_rehashed_total", "Password hashes upgraded on login (scheme or cost changed)"
+)
+
+
+def has_usable_password(hashed_password: str | None) -> bool:
+    return bool(hashed_password) and hashed_password != UNUSABLE_PASSWORD
 
 
 def hash_password(password: str) -> str:
@@ -10,6 +79,61 @@ def hash_password(password: str) -> str:
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
+    if not has_usable_password(hashed_password):
+        return False
     result = pwd_context.verify(plain_password, hashed_password)
     assert isinstance(result, bool)
     return result
+
+
+def verify_and_update_password(
+    plain_password: str, hashed_password: str
+) -> tuple[bool, str | None]:
+    """Verify; on success also return a new hash if the stored one is outdated (else None)."""
+    if not has_usable_password(hashed_password):
+        return False, None
+    ok, new_hash = pwd_context.verify_and_update(plain_password, hashed_password)
+    return bool(ok), new_hash
+
+
+async def _run_admitted(fn: Callable[..., T], *args: Any) -> T:
+    """Run on the password executor; 503 + Retry-After right away when it is saturated."""
+    try:
+        return await password_executor.run(fn, *args)
+    except ExecutorBusy:
+        raise HTTPException(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+            detail="Too many password checks in progress, retry later",
+            headers={"Retry-After": str(settings.password_hash_retry_after_sec)},
+        ) from None
+
+
+async def hash_password_async(password: str) -> str:
+    """hash_password on the password executor (for async handlers)."""
+    return await _run_admitted(hash_password, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password on the password executor (for async handlers)."""
+    if not has_usable_password(hashed_password):
+        return False
+    return await _run_admitted(verify_password, plain_password, hashed_password)
+
+
+async def verify_and_update_password_async(
+    plain_password: str, hashed_password: str
+) -> tuple[bool, str | None]:
+    """verify_and_update_password on the password executor (for async handlers)."""
+    if not has_usable_password(hashed_password):
+        return False, None
+    return await _run_admitted(verify_and_update_password, plain_password, hashed_password)
+
+
+def hash_time(context: CryptContext, samples: int = 3) -> float:
+    """Median seconds one hash takes with `context` on this host."""
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        context.hash("calibration-password")
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
@@ -0,0 +1,147 @@
+"""
+Bounded LRU caches of JWT verification outcomes.
+
+VerifiedTokenCache: signature-verified claims.
+
+Clients reuse the same access token for its whole lifetime, so the expensive part of
+`decode_token` (the signature check) only has to run once per token per worker.
+
+- Keyed by a SHA-256 digest of the token (raw tokens are never kept as keys).
+- An entry is valid until the token's `exp`; expired entries are dropped on lookup.
+- Size-bounded with least-recently-used eviction.
+- Only the crypto is cached: callers still run revocation checks on every call.
+- The cache is flushed whenever the key set changes (a removed key must stop verifying).
+
+RejectedTokenCache: tokens whose signature check failed recently. Bots replaying the same
+forged token are turned away with a hash lookup instead of another RSA verification.
+Entries live for a short TTL and are flushed on key-set changes (an unknown `kid` may
+become valid once the key is published).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any
+
+from core.metrics import metrics
+
+
+class VerifiedTokenCache:
+    def __init__(self, max_size: int, name: str = "jwt_verify_cache"):
+        self.max_size = max_size
+        self._entries: OrderedDict[bytes, dict[str, Any]] = OrderedDict()
+        self._generation: object = None
+
+        self.hits = metrics.counter(f"{name}_hits_total", "Verified-token cache hits")
+        self.misses = metrics.counter(f"{name}_misses_total", "Verified-token cache misses")
+        self.evictions = metrics.counter(
+            f"{name}_evictions_total", "Entries evicted to stay within the size bound"
+        )
+        self.expirations = metrics.counter(
+            f"{name}_expirations_total", "Entries dropped because the token expired"
+        )
+        metrics.gauge(f"{name}_size", "Entries currently cached", fn=lambda: len(self._entries))
+
+    @staticmethod
+    def key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, token: str) -> dict[str, Any] | None:
+        if self.max_size <= 0:
+            return None
+
+        key = self.key(token)
+        claims = self._entries.get(key)
+        if claims is None:
+            self.misses.inc()
+            return None
+
+        if claims["exp"] <= time.time():
+            del self._entries[key]
+            self.expirations.inc()
+            self.misses.inc()
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits.inc()
+        return dict(claims)
+
+    def put(self, token: str, claims: dict[str, Any]) -> None:
+        exp = claims.get("exp")
+        if self.max_size <= 0 or not isinstance(exp, int | float) or exp <= time.time():
+            return
+
+        key = self.key(token)
+        self._entries[key] = dict(claims)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions.inc()
+
+    def __contains__(self, token: str) -> bool:
+        """Cached, possibly expired; unlike `get`, no stats and no eviction."""
+        return self.max_size > 0 and self.key(token) in self._entries
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def reset_if_changed(self, generation: object) -> None:
+        """Drop every entry when `generation` (e.g. the current key set) is a new object."""
+        if generation is not self._generation:
+            self._generation = generation
+            self.clear()
+
+
+class RejectedTokenCache:
+    def __init__(self, max_size: int, ttl_sec: float, name: str = "jwt_reject_cache"):
+        self.max_size = max_size
+        self.ttl_sec = ttl_sec
+        self._entries: OrderedDict[bytes, float] = OrderedDict()
+        self._generation: object = None
+
+        self.hits = metrics.counter(
+            f"{name}_hits_total", "Tokens rejected from the cache (no signature check)"
+        )
+        metrics.gauge(f"{name}_size", "Entries currently cached", fn=lambda: len(self._entries))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, token: str) -> bool:
+        if self.max_size <= 0:
+            return False
+
+        key = VerifiedTokenCache.key(token)
+        expires_at = self._entries.get(key)
+        if expires_at is None:
+            return False
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return False
+
+        self.hits.inc()
+        return True
+
+    def add(self, token: str) -> None:
+        if self.max_size <= 0 or self.ttl_sec <= 0:
+            return
+
+        key = VerifiedTokenCache.key(token)
+        self._entries[key] = time.monotonic() + self.ttl_sec
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def reset_if_changed(self, generation: object) -> None:
+        """Drop every entry when `generation` (e.g. the current key set) is a new object."""
+        if generation is not self._generation:
+            self._generation = generation
+            self.clear()
@@ -2,6 +2,8 @@ import pytest
 from httpx import AsyncClient
 from http import HTTPStatus
 
+from core.config import settings
+
 
 @pytest.mark.asyncio
 async def test_login_oauth2_success(client: AsyncClient, create_user):
@@ -144,3 +146,58 @@ async def test_logout_blacklist(
     assert len(keys) > 0
 
     assert client.cookies.get("refresh_token") is None
+
+
+@pytest.mark.asyncio
+async def test_logout_all_revokes_every_session(client: AsyncClient, create_user):
+    await create_user("olga", "olga@example.com", "password123")
+
+    sessions = []
+    for _ in range(3):
+        resp = await client.post(
+            "/api/v1/auth/login",
+            data={"username": "olga", "password": "password123"},
+        )
+        sessions.append((resp.json()["access_token"], resp.cookies.get("refresh_token")))
+
+    access, _ = sessions[-1]
+    resp = await client.post(
+        "/api/v1/auth/logout-all", headers={"Authorization": f"Bearer {access}"}
+    )
+    assert resp.status_code == HTTPStatus.OK
+
+    for access, refresh in sessions:
+        client.cookies.set("refresh_token", refresh)
+        assert (await client.post("/api/v1/auth/refresh")).status_code == HTTPStatus.UNAUTHORIZED
+        me = await client.get(
+            "/api/v1/user_roles/me", headers={"Authorization": f"Bearer {access}"}
+        )
+        assert me.json()["username"] == "guest"
+
+
+@pytest.mark.asyncio
+async def test_introspect_batch(client: AsyncClient, create_user, monkeypatch):
+    monkeypatch.setattr(settings, "introspect_secret", "s3cret")
+    await create_user("ivan", "ivan@example.com", "password123")
+
+    login_resp = await client.post(
+        "/api/v1/auth/login",
+        data={"username": "ivan", "password": "password123"},
+    )
+    access = login_resp.json()["access_token"]
+    refresh = login_resp.cookies.get("refresh_token")
+
+    await client.post("/api/v1/auth/logout")  # revokes the refresh token
+
+    response = await client.post(
+        "/api/v1/auth/introspect",
+        json={"tokens": [access, "garbage", refresh]},
+        headers={"Authorization": "Bearer s3cret"},
+    )
+    assert response.status_code == HTTPStatus.OK
+    results = response.json()["results"]
+    assert results[0]["active"] is True
+    assert results[0]["token_type"] == "access"
+    assert results[0]["sub"] and results[0]["exp"] and results[0]["jti"]
+    assert results[1] == {"active": False}
+    assert results[2] == {"active": False}
@@ -19,6 +19,17 @@ async def test_jwks_shape(client: AsyncClient):
     assert jwk["kty"] == "RSA"
 
 
+@pytest.mark.asyncio
+async def test_jwks_etag_revalidation(client: AsyncClient):
+    resp = await client.get("/.well-known/jwks.json")
+    etag = resp.headers["etag"]
+    assert "max-age=" in resp.headers["cache-control"]
+
+    cached = await client.get("/.well-known/jwks.json", headers={"If-None-Match": etag})
+    assert cached.status_code == HTTPStatus.NOT_MODIFIED
+    assert cached.headers["etag"] == etag
+
+
 @pytest.mark.asyncio
 async def test_jwks_verifies_our_token(client: AsyncClient, create_user):
     await create_user("jwksuser", "jwks@example.com", "secret123")
@@ -0,0 +1,141 @@
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+from uuid import uuid4
+
+import fakeredis
+import jwt
+import middleware.authentication as authentication
+import pytest
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+from middleware.authentication import AuthenticationMiddleware
+from middleware.rate_limit import RateRule
+from utils import dependencies
+
+
+@pytest.fixture
+def decoded(monkeypatch):
+    """
+    Fake precheck/decode_token: "good" is a valid access token, "refresh" a refresh token,
+    "bad" fails only the signature check and "garbage" already fails the precheck.
+    """
+    calls = []
+
+    def fake_precheck(token, verify_exp=True, token_type=None):
+        if token == "garbage":
+            raise jwt.DecodeError("Malformed token")
+
+    async def fake_decode(token, *, redis, token_type=None):
+        calls.append(token)
+        if token == "good":
+            return {"type": "access", "sub": "u1"}
+        if token == "refresh":
+            return {"type": "refresh", "sub": "u1"}
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    monkeypatch.setattr(authentication, "precheck", fake_precheck)
+    monkeypatch.setattr(authentication, "decode_token", fake_decode)
+    return calls
+
+
+def make_client(verify_rule=None, redis=None):
+    app = FastAPI()
+
+    @app.get("/state")
+    async def state(request: Request):
+        return {k: request.scope.get("state", {}).get(k) for k in ("claims", "user_id")}
+
+    @app.get("/healthz")
+    async def healthz(request: Request):
+        return {k: request.scope.get("state", {}).get(k) for k in ("claims", "user_id")}
+
+    app.add_middleware(
+        AuthenticationMiddleware, whitelist_paths=["/healthz"], verify_rule=verify_rule
+    )
+    app.state.redis = redis or object()
+    return TestClient(app)
+
+
+@pytest.mark.unit
+def test_valid_access_token_is_verified_once_and_shared(decoded):
+    r = make_client().get("/state", headers={"Authorization": "Bearer good"})
+
+    assert r.json() == {"claims": {"type": "access", "sub": "u1"}, "user_id": "u1"}
+    assert decoded == ["good"]
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("token", ["bad", "refresh", "garbage"])
+def test_rejected_tokens_leave_no_user(decoded, token):
+    r = make_client().get("/state", headers={"Authorization": f"Bearer {token}"})
+
+    assert r.json() == {"claims": None, "user_id": None}
+
+
+@pytest.mark.unit
+def test_requests_without_bearer_token_are_not_decoded(decoded):
+    client = make_client()
+
+    client.get("/state")
+    client.get("/state", headers={"Authorization": "Basic Z29vZA=="})
+
+    assert decoded == []
+
+
+@pytest.mark.unit
+def test_tokens_failing_the_precheck_are_not_verified(decoded):
+    r = make_client().get("/state", headers={"Authorization": "Bearer garbage"})
+
+    assert r.json() == {"claims": None, "user_id": None}  # limited by IP
+    assert decoded == []
+
+
+@pytest.mark.unit
+def test_whitelisted_paths_are_not_decoded(decoded):
+    r = make_client().get("/healthz", headers={"Authorization": "Bearer good"})
+
+    assert r.json() == {"claims": None, "user_id": None}
+    assert decoded == []
+
+
+@pytest.mark.unit
+def test_unverified_tokens_are_limited_per_ip_before_the_signature_check(decoded, monkeypatch):
+    monkeypatch.setattr(authentication.settings, "testing", False)
+    monkeypatch.setattr(authentication, "verified_tokens", {"good"})
+    client = make_client(
+        verify_rule=RateRule(r".*", 2, 60), redis=fakeredis.FakeAsyncRedis(decode_responses=True)
+    )
+
+    forged = [client.get("/state", headers={"Authorization": "Bearer bad"}) for _ in range(3)]
+
+    assert [r.status_code for r in forged] == [200, 200, 429]
+    assert forged[2].headers["Retry-After"] == "60"
+    assert decoded == ["bad", "bad"]  # the third one never reached the signature check
+    # already verified tokens and precheck failures cost no signature check: not limited
+    assert client.get("/state", headers={"Authorization": "Bearer good"}).status_code == 200
+    assert client.get("/state", headers={"Authorization": "Bearer garbage"}).status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_dependencies_reuse_the_middleware_result(monkeypatch):
+    decode = AsyncMock(side_effect=AssertionError("decoded twice"))
+    monkeypatch.setattr(dependencies, "decode_token", decode)
+    uid = uuid4()
+    user_obj = SimpleNamespace(user_id=uid)
+    session = AsyncMock()
+    session.execute = AsyncMock(return_value=SimpleNamespace(scalar_one_or_none=lambda: user_obj))
+    state = {"access_token": "t", "claims": {"type": "access", "sub": str(uid)}}
+    request = SimpleNamespace(scope={"state": state})
+
+    user = await dependencies.get_current_user(
+        session=session, redis=AsyncMock(), token="t", request=request
+    )
+    assert user is user_obj
+
+    state["claims"] = None  # the middleware rejected the token
+    with pytest.raises(HTTPException) as e:
+        await dependencies.get_current_user(
+            session=session, redis=AsyncMock(), token="t", request=request
+        )
+    assert e.value.status_code == 401
+    decode.assert_not_awaited()
@@ -18,7 +18,7 @@ async def test_get_user_from_token_returns_none_when_token_missing():
 
 @pytest.mark.asyncio
 async def test_get_user_from_token_returns_none_when_decode_fails(monkeypatch):
-    async def bad_decode(_token, *, redis):
+    async def bad_decode(_token, *, redis, token_type=None):
         raise ValueError("bad token")
 
     monkeypatch.setattr(dependencies, "decode_token", bad_decode)
@@ -33,7 +33,7 @@ async def test_get_user_from_token_returns_none_when_decode_fails(monkeypatch):
 
 @pytest.mark.asyncio
 async def test_get_user_from_token_returns_none_when_not_access_token(monkeypatch):
-    async def ok_decode(_token, *, redis):
+    async def ok_decode(_token, *, redis, token_type=None):
         return {"type": "refresh", "sub": str(uuid4())}
 
     monkeypatch.setattr(dependencies, "decode_token", ok_decode)
@@ -48,7 +48,7 @@ async def test_get_user_from_token_returns_none_when_not_access_token(monkeypatc
 
 @pytest.mark.asyncio
 async def test_get_user_from_token_returns_none_when_user_not_found(monkeypatch):
-    async def ok_decode(_token, *, redis):
+    async def ok_decode(_token, *, redis, token_type=None):
         return {"type": "access", "sub": str(uuid4())}
 
     monkeypatch.setattr(dependencies, "decode_token", ok_decode)
@@ -69,7 +69,7 @@ async def test_get_user_from_token_returns_none_when_user_not_found(monkeypatch)
 async def test_get_user_from_token_success(monkeypatch):
     uid = uuid4()
 
-    async def ok_decode(_token, *, redis):
+    async def ok_decode(_token, *, redis, token_type=None):
         return {"type": "access", "sub": str(uid)}
 
     monkeypatch.setattr(dependencies, "decode_token", ok_decode)
@@ -28,7 +28,7 @@ async def test_get_current_principal_returns_guest_when_decode_fails(monkeypatch
     guest = SimpleNamespace(user_id=None, username="guest", email=None, roles=[])
     monkeypatch.setattr(dependencies, "_build_guest_principal", AsyncMock(return_value=guest))
 
-    async def bad_decode(_token, *, redis):
+    async def bad_decode(_token, *, redis, token_type=None):
         raise ValueError("bad token")
 
     monkeypatch.setattr(dependencies, "decode_token", bad_decode)
@@ -43,11 +43,33 @@ async def test_get_current_principal_returns_guest_when_decode_fails(monkeypatch
     assert out.username == "guest"
 
 
+@pytest.mark.asyncio
+async def test_guest_principal_is_built_once_per_ttl(monkeypatch):
+    guest = SimpleNamespace(user_id=None, username="guest", email=None, roles=[])
+    build = AsyncMock(return_value=guest)
+    monkeypatch.setattr(dependencies, "_build_guest_principal", build)
+    monkeypatch.setattr(dependencies, "_guest_cache", None)
+
+    for token in (None, "garbage", None):
+        out = await dependencies.get_current_principal(
+            session=AsyncMock(), redis_cli=AsyncMock(), token=token
+        )
+        assert out is guest
+
+    assert build.await_count == 1
+
+    monkeypatch.setattr(dependencies.settings, "guest_principal_cache_ttl_sec", 0)
+    monkeypatch.setattr(dependencies, "_guest_cache", None)
+    await dependencies.get_current_principal(session=AsyncMock(), redis_cli=AsyncMock(), token=None)
+    await dependencies.get_current_principal(session=AsyncMock(), redis_cli=AsyncMock(), token=None)
+    assert build.await_count == 3
+
+
 @pytest.mark.asyncio
 async def test_get_current_principal_returns_user_when_token_ok(monkeypatch):
     uid = uuid4()
 
-    async def ok_decode(_token, *, redis):
+    async def ok_decode(_token, *, redis, token_type=None):
         return {"type": "access", "sub": str(uid)}
 
     monkeypatch.setattr(dependencies, "decode_token", ok_decode)
@@ -146,3 +168,64 @@ async def test_get_current_user_with_roles_allows_when_role_present(monkeypatch)
     )
 
     assert out.user_id == uid
+
+
+@pytest.fixture
+def embed_roles(monkeypatch):
+    monkeypatch.setattr(dependencies.settings, "jwt_embed_roles", True)
+
+    def use_token(payload, version):
+        async def ok_decode(_token, *, redis, token_type=None):
+            return payload
+
+        monkeypatch.setattr(dependencies, "decode_token", ok_decode)
+        monkeypatch.setattr(dependencies, "get_authz_version", AsyncMock(return_value=version))
+
+    return use_token
+
+
+@pytest.mark.asyncio
+async def test_get_current_user_with_roles_uses_fresh_claims_without_db(monkeypatch, embed_roles):
+    embed_roles({"type": "access", "sub": "u1", "roles": ["admin"], "authz_ver": 2}, 2)
+
+    async def no_db(*_args, **_kwargs):
+        raise AssertionError("DB must not be queried")
+
+    monkeypatch.setattr(dependencies, "_get_user_from_token", no_db)
+
+    dep = dependencies.get_current_user_with_roles(["admin"])
+    out = await dep(token="t", session=AsyncMock(), redis=AsyncMock())
+
+    assert out["sub"] == "u1"
+
+
+@pytest.mark.asyncio
+async def test_get_current_user_with_roles_claims_without_role_raise_403(embed_roles):
+    embed_roles({"type": "access", "sub": "u1", "roles": ["user"], "authz_ver": 0}, 0)
+
+    dep = dependencies.get_current_user_with_roles(["admin"])
+    with pytest.raises(HTTPException) as e:
+        await dep(token="t", session=AsyncMock(), redis=AsyncMock())
+
+    assert e.value.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_get_current_user_with_roles_stale_claims_fall_back_to_db(monkeypatch, embed_roles):
+    # token still says "admin", but roles changed since it was issued (version 1 -> 2)
+    embed_roles({"type": "access", "sub": "u1", "roles": ["admin"], "authz_ver": 1}, 2)
+
+    user_obj = SimpleNamespace(user_id=uuid4())
+    monkeypatch.setattr(dependencies, "_get_user_from_token", AsyncMock(return_value=user_obj))
+    user_role_svc = SimpleNamespace(
+        get_user_roles=AsyncMock(return_value=[SimpleNamespace(name="user")])
+    )
+    monkeypatch.setattr(dependencies, "UserRoleService", lambda repo, redis: user_role_svc)
+    monkeypatch.setattr(dependencies, "UserRoleRepository", lambda _s: object())
+
+    dep = dependencies.get_current_user_with_roles(["admin"])
+    with pytest.raises(HTTPException) as e:
+        await dep(token="t", session=AsyncMock(), redis=AsyncMock())
+
+    assert e.value.status_code == 403
+    user_role_svc.get_user_roles.assert_awaited_once()
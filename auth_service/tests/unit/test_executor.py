@@ -0,0 +1,153 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import utils.jwt as jwt_mod
+from core.keyring import KeyRing, generate_key_pem
+from utils.executor import BoundedExecutor
+from utils.token_cache import VerifiedTokenCache
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_inline_mode_runs_on_the_loop_thread():
+    ex = BoundedExecutor("t_ex_inline", "inline")
+    assert await ex.run(threading.get_ident) == threading.get_ident()
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_thread_mode_bounds_concurrency_and_tracks_queue():
+    ex = BoundedExecutor("t_ex_bound", "thread", max_workers=4, max_concurrency=2)
+    running = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def work():
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.05)
+        with lock:
+            running -= 1
+        return threading.get_ident()
+
+    tasks = [asyncio.create_task(ex.run(work)) for _ in range(6)]
+    await asyncio.sleep(0.01)
+    assert ex.queue_depth.value == 4
+    assert ex.in_flight.value == 2
+
+    idents = await asyncio.gather(*tasks)
+    ex.shutdown()
+
+    assert peak == 2
+    assert threading.get_ident() not in idents
+    assert ex.queue_depth.value == 0
+    assert ex.in_flight.value == 0
+    assert ex.wait_seconds.count == 6
+    assert ex.wait_seconds.max >= 0.05
+
+
+@pytest.mark.unit
+def test_unknown_mode_rejected():
+    with pytest.raises(ValueError):
+        BoundedExecutor("t_ex_bad", "gpu")
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+@pytest.mark.parametrize("mode", ["thread", "process"])
+async def test_token_pair_round_trip_through_executor(mode, tmp_path, monkeypatch):
+    private_pem, public_pem = generate_key_pem("ES256")
+    (tmp_path / "k.key").write_bytes(private_pem)
+    (tmp_path / "k.key.pub").write_bytes(public_pem)
+    ring = KeyRing(str(tmp_path / "k.key"), str(tmp_path / "k.key.pub"), "ES256", reload_interval_sec=0)
+    ex = BoundedExecutor(f"t_ex_{mode}", mode, max_workers=1)
+    monkeypatch.setattr(jwt_mod, "keyring", ring)
+    monkeypatch.setattr(jwt_mod, "crypto_executor", ex)
+    monkeypatch.setattr(jwt_mod, "verified_tokens", VerifiedTokenCache(100, name=f"t_ex_{mode}_c"))
+
+    try:
+        pair = await jwt_mod.create_token_pair("u1", "u1@example.com")
+        access = await jwt_mod.decode_token(pair["access_token"])
+        refresh = await jwt_mod.decode_token(pair["refresh_token"])
+    finally:
+        ex.shutdown()
+
+    assert (access["sub"], access["type"]) == ("u1", "access")
+    assert (refresh["sub"], refresh["type"]) == ("u1", "refresh")
+    assert ex.run_seconds.count == 4  # two signs + two verifies
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+@pytest.mark.parametrize("mode", ["thread", "process"])
+async def test_password_hashing_runs_off_the_loop(mode, monkeypatch):
+    import utils.security as security_mod
+
+    ex = BoundedExecutor(f"t_pw_{mode}", mode, max_workers=2)
+    monkeypatch.setattr(security_mod, "password_executor", ex)
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.005)
+
+    task = asyncio.create_task(ticker())
+    try:
+        hashed = await security_mod.hash_password_async("s3cret")
+        assert await security_mod.verify_password_async("s3cret", hashed)
+        assert not await security_mod.verify_password_async("wrong", hashed)
+    finally:
+        task.cancel()
+        ex.shutdown()
+
+    assert ex.run_seconds.count == 3
+    assert ticks > 3  # the loop kept running while bcrypt did
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_admission_control_sheds_instead_of_queueing(monkeypatch):
+    import utils.security as security_mod
+    from fastapi import HTTPException
+
+    from utils.executor import ExecutorBusy
+
+    ex = BoundedExecutor("t_ex_admit", "thread", max_workers=1, max_queue=1, max_wait_sec=0.2)
+    release = threading.Event()
+    running = asyncio.create_task(ex.run(release.wait))
+    queued = asyncio.create_task(ex.run(lambda: "queued"))
+    await asyncio.sleep(0.01)
+
+    with pytest.raises(ExecutorBusy):  # queue full: rejected without waiting
+        await ex.run(lambda: "third")
+    assert ex.rejected.value == 1
+
+    with pytest.raises(ExecutorBusy):  # waited max_wait_sec for the slot
+        await queued
+    assert ex.rejected.value == 2
+    assert ex.queue_depth.value == 0
+
+    release.set()
+    await running
+    assert await ex.run(lambda: "ok") == "ok"  # slot returned
+
+    monkeypatch.setattr(security_mod, "password_executor", ex)
+    release.clear()
+    running = asyncio.create_task(ex.run(release.wait))
+    await asyncio.sleep(0.01)
+    try:
+        with pytest.raises(HTTPException) as e:
+            await security_mod.verify_password_async("pw", "hash")
+    finally:
+        release.set()
+        await running
+        ex.shutdown()
+    assert e.value.status_code == 503
+    assert e.value.headers["Retry-After"] == str(security_mod.settings.password_hash_retry_after_sec)
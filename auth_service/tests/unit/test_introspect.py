@@ -0,0 +1,121 @@
+from datetime import timedelta
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import utils.jwt as jwt_mod
+from api.v1.auth import router as auth_router
+from core.config import settings
+from core.keyring import KeyRing, generate_key_pem
+from db.redis_db import get_redis
+from utils.executor import BoundedExecutor
+from utils.token_cache import VerifiedTokenCache
+
+
+class MgetRedis:
+    def __init__(self, revoked: set[str]):
+        self.revoked = revoked
+        self.calls: list[list[str]] = []
+
+    async def mget(self, keys):
+        self.calls.append(keys)
+        return ["1" if key.removeprefix("blacklist:") in self.revoked else None for key in keys]
+
+
+@pytest.fixture
+def ring(tmp_path, monkeypatch):
+    private_pem, public_pem = generate_key_pem("RS256")
+    (tmp_path / "k.key").write_bytes(private_pem)
+    (tmp_path / "k.key.pub").write_bytes(public_pem)
+    ring = KeyRing(str(tmp_path / "k.key"), str(tmp_path / "k.key.pub"), "RS256", reload_interval_sec=0)
+    monkeypatch.setattr(jwt_mod, "keyring", ring)
+    monkeypatch.setattr(jwt_mod, "verified_tokens", VerifiedTokenCache(100, name="t_introspect"))
+    # TestClient runs its own event loop; keep verification off the shared semaphore
+    monkeypatch.setattr(jwt_mod, "crypto_executor", BoundedExecutor("t_introspect", "inline"))
+    return ring
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_introspect_batch_reports_each_token_with_one_mget(ring):
+    good = jwt_mod.create_access_token({"sub": "u1"})
+    revoked = jwt_mod.create_access_token({"sub": "u2"})
+    expired = jwt_mod.create_token({"sub": "u3"}, timedelta(seconds=-5), "access")
+    revoked_jti = jwt_mod.unverified_claims(revoked)["jti"]
+    redis = MgetRedis({revoked_jti})
+
+    results = await jwt_mod.introspect_tokens(
+        [good, "not-a-jwt", revoked, expired, good], redis
+    )
+
+    assert [r["sub"] if r else None for r in results] == ["u1", None, None, None, "u1"]
+    assert len(redis.calls) == 1
+    # only verified, de-duplicated tokens are looked up: two jtis + two user epochs
+    assert sorted(k.split(":")[0] for k in redis.calls[0]) == ["blacklist"] * 2 + ["user_epoch"] * 2
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_introspect_without_redis_skips_revocation(ring):
+    token = jwt_mod.create_refresh_token({"sub": "u1"})
+    [claims] = await jwt_mod.introspect_tokens([token], None)
+    assert claims["type"] == "refresh"
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_introspect_can_be_limited_to_access_tokens(ring):
+    access = jwt_mod.create_access_token({"sub": "u1"})
+    refresh = jwt_mod.create_refresh_token({"sub": "u1"})
+
+    results = await jwt_mod.introspect_tokens([access, refresh], None, token_type="access")
+
+    assert [r["type"] if r else None for r in results] == ["access", None]
+
+
+def introspect(tokens, authorization=None):
+    app = FastAPI()
+    app.include_router(auth_router, prefix="/api/v1/auth")
+    app.dependency_overrides[get_redis] = lambda: None
+    headers = {"Authorization": authorization} if authorization else {}
+    return TestClient(app).post("/api/v1/auth/introspect", json={"tokens": tokens}, headers=headers)
+
+
+@pytest.mark.unit
+def test_introspect_endpoint_returns_claims_of_active_access_tokens(ring, monkeypatch):
+    monkeypatch.setattr(settings, "introspect_secret", "s3cret")
+    access = jwt_mod.create_access_token({"sub": "u1", "roles": ["admin"], "authz_ver": 2})
+    refresh = jwt_mod.create_refresh_token({"sub": "u1"})
+    claims = jwt_mod.unverified_claims(access)
+
+    r = introspect([access, refresh], "Bearer s3cret")
+
+    assert r.status_code == 200
+    assert r.json() == {
+        "results": [
+            {
+                "active": True,
+                "token_type": "access",
+                "sub": "u1",
+                "exp": claims["exp"],
+                "iat": claims["iat"],
+                "jti": claims["jti"],
+                "roles": ["admin"],
+            },
+            {"active": False},
+        ]
+    }
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    ("secret", "authorization", "status"),
+    [("", "Bearer anything", 503), ("s3cret", None, 401), ("s3cret", "Bearer wrong", 401)],
+)
+def test_introspect_endpoint_requires_the_secret(ring, monkeypatch, secret, authorization, status):
+    monkeypatch.setattr(settings, "introspect_secret", secret)
+
+    r = introspect([jwt_mod.create_access_token({"sub": "u1"})], authorization)
+
+    assert r.status_code == status
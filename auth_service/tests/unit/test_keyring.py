@@ -0,0 +1,219 @@
+import json
+import os
+import time
+from datetime import timedelta
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+import utils.jwt as jwt_mod
+import rotate_keys
+from core.keyring import KeyRing, generate_key_pem
+from fastapi import HTTPException
+
+
+def _write_rsa_pair(dirpath, name="jwt"):
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    priv = dirpath / f"{name}.key"
+    pub = dirpath / f"{name}.key.pub"
+    priv.write_bytes(
+        key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+    )
+    pub.write_bytes(
+        key.public_key().public_bytes(
+            serialization.Encoding.PEM,
+            serialization.PublicFormat.SubjectPublicKeyInfo,
+        )
+    )
+    return str(priv), str(pub)
+
+
+@pytest.fixture
+def ring(tmp_path):
+    priv, pub = _write_rsa_pair(tmp_path)
+    return KeyRing(priv, pub, "RS256", reload_interval_sec=0)
+
+
+def test_keyring_loads_once(ring, monkeypatch):
+    first = ring.current()
+
+    def boom(_path):
+        raise AssertionError("key files must not be re-read")
+
+    monkeypatch.setattr("core.keyring._read", boom)
+    assert ring.current() is first
+    assert ring.jwks()["keys"][0]["kid"] == first.active.kid
+
+
+def test_create_token_verifies_with_pyjwt(ring, monkeypatch):
+    monkeypatch.setattr(jwt_mod, "keyring", ring)
+
+    token = jwt_mod.create_token({"sub": "u1"}, timedelta(minutes=1), "access")
+
+    key = ring.active()
+    assert jwt.get_unverified_header(token) == {"alg": "RS256", "kid": key.kid, "typ": "JWT"}
+    claims = jwt.decode(token, key.public_key, algorithms=["RS256"])
+    assert claims["sub"] == "u1"
+    assert claims["type"] == "access"
+
+
+def test_keyring_reloads_on_mtime_change(tmp_path):
+    priv, pub = _write_rsa_pair(tmp_path)
+    ring = KeyRing(priv, pub, "RS256", reload_interval_sec=0.000001)
+    old_kid = ring.active().kid
+
+    _write_rsa_pair(tmp_path)
+    stat = os.stat(priv)
+    os.utime(priv, (stat.st_atime, stat.st_mtime + 10))
+    os.utime(pub, (stat.st_atime, stat.st_mtime + 10))
+
+    assert ring.active().kid != old_kid
+
+
+def test_reload_keeps_previous_keys_when_files_are_broken(ring):
+    old = ring.current()
+    with open(ring.private_key_path, "w") as f:
+        f.write("not a key")
+
+    ring.reload()
+
+    assert ring.current() is old
+
+
+@pytest.fixture
+def manifest_ring(tmp_path):
+    manifest = tmp_path / "keyset.json"
+    rotate_keys.write_manifest(
+        str(manifest),
+        {
+            "keys": [
+                {"status": "active", **rotate_keys.generate_key_pair(str(tmp_path), "RS256")},
+                {"status": "next", **_entry(tmp_path, "next")},
+            ]
+        },
+    )
+    return manifest, KeyRing(keyset_path=str(manifest), algorithm="RS256", reload_interval_sec=0)
+
+
+def _entry(tmp_path, name):
+    priv, pub = _write_rsa_pair(tmp_path, name)
+    return {"private_key": os.path.basename(priv), "public_key": os.path.basename(pub)}
+
+
+def test_manifest_publishes_active_and_next(manifest_ring):
+    _, ring = manifest_ring
+    keys = ring.current()
+
+    assert keys.active.status == "active"
+    assert len(keys.by_kid) == 2
+    assert {k["kid"] for k in ring.jwks()["keys"]} == set(keys.by_kid)
+
+
+@pytest.mark.asyncio
+async def test_rotation_keeps_old_tokens_valid(manifest_ring, tmp_path, monkeypatch):
+    manifest, ring = manifest_ring
+    monkeypatch.setattr(jwt_mod, "keyring", ring)
+    old_token = jwt_mod.create_token({"sub": "u1"}, timedelta(minutes=1), "access")
+    old_kid = ring.active().kid
+
+    manifest_data = json.loads(manifest.read_text())
+    rotated = rotate_keys.rotate(manifest_data, str(tmp_path), "RS256", time.time())
+    rotate_keys.write_manifest(str(manifest), rotated)
+    ring.reload()
+
+    assert ring.active().kid != old_kid
+    assert ring.get(old_kid).status == "retired"
+    assert len(ring.jwks()["keys"]) == 3
+
+    # Tokens signed before the rotation still verify; new tokens use the promoted key.
+    assert (await jwt_mod.decode_token(old_token))["sub"] == "u1"
+    new_token = jwt_mod.create_token({"sub": "u2"}, timedelta(minutes=1), "access")
+    assert jwt.get_unverified_header(new_token)["kid"] == ring.active().kid
+
+
+@pytest.mark.asyncio
+async def test_unknown_kid_is_rejected(ring, tmp_path, monkeypatch):
+    other = KeyRing(*_write_rsa_pair(tmp_path, "other"), "RS256", reload_interval_sec=0)
+    monkeypatch.setattr(jwt_mod, "keyring", other)
+    token = jwt_mod.create_token({"sub": "u1"}, timedelta(minutes=1), "access")
+
+    monkeypatch.setattr(jwt_mod, "keyring", ring)
+    with pytest.raises(HTTPException) as e:
+        await jwt_mod.decode_token(token)
+    assert e.value.status_code == 401
+
+
+def test_expired_retired_key_is_dropped(manifest_ring, tmp_path):
+    manifest, ring = manifest_ring
+    data = json.loads(manifest.read_text())
+    entry = _entry(tmp_path, "old")
+    data["keys"].append({"status": "retired", **entry, "not_after": time.time() + 0.5})
+    rotate_keys.write_manifest(str(manifest), data)
+    ring.reload()
+    assert len(ring.current().by_kid) == 3
+
+    time.sleep(0.5)
+
+    assert len(ring.current().by_kid) == 2
+
+
+@pytest.mark.parametrize(
+    ("alg", "kty", "crv"),
+    [("RS256", "RSA", None), ("ES256", "EC", "P-256"), ("EdDSA", "OKP", "Ed25519")],
+)
+@pytest.mark.asyncio
+async def test_algorithms_round_trip_and_export_jwk(alg, kty, crv, tmp_path, monkeypatch):
+    private_pem, public_pem = generate_key_pem(alg)
+    (tmp_path / "k.key").write_bytes(private_pem)
+    (tmp_path / "k.key.pub").write_bytes(public_pem)
+    ring = KeyRing(str(tmp_path / "k.key"), str(tmp_path / "k.key.pub"), alg, reload_interval_sec=0)
+    monkeypatch.setattr(jwt_mod, "keyring", ring)
+
+    token = jwt_mod.create_token({"sub": "u1"}, timedelta(minutes=1), "access")
+
+    assert jwt.get_unverified_header(token)["alg"] == alg
+    assert (await jwt_mod.decode_token(token))["sub"] == "u1"
+    published = ring.jwks()["keys"][0]
+    assert (published["kty"], published.get("crv"), published["alg"]) == (kty, crv, alg)
+
+
+def test_key_type_must_match_algorithm(tmp_path):
+    private_pem, public_pem = generate_key_pem("RS256")
+    (tmp_path / "k.key").write_bytes(private_pem)
+    (tmp_path / "k.key.pub").write_bytes(public_pem)
+    ring = KeyRing(str(tmp_path / "k.key"), str(tmp_path / "k.key.pub"), "ES256")
+
+    with pytest.raises(ValueError, match="ES256 requires a key of type EC/P-256"):
+        ring.load()
+
+
+@pytest.mark.asyncio
+async def test_jwks_endpoint_serves_precomputed_body_with_etag(ring, tmp_path, monkeypatch):
+    from api.v1 import well_known
+
+    monkeypatch.setattr(well_known, "keyring", ring)
+    key_set = ring.current()
+
+    resp = await well_known.jwks(if_none_match=None)
+    assert resp.status_code == 200
+    assert resp.body == key_set.jwks_body
+    assert json.loads(resp.body) == ring.jwks()
+    assert resp.headers["etag"] == key_set.jwks_etag
+    assert resp.headers["cache-control"].startswith("public, max-age=")
+
+    resp = await well_known.jwks(if_none_match=f'"stale", W/{key_set.jwks_etag}')
+    assert resp.status_code == 304
+    assert resp.body == b""
+
+    # A new key set gets a new ETag, so cached copies are revalidated.
+    _write_rsa_pair(tmp_path)
+    ring.reload()
+    resp = await well_known.jwks(if_none_match=key_set.jwks_etag)
+    assert resp.status_code == 200
+    assert resp.headers["etag"] != key_set.jwks_etag
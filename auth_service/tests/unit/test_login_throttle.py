@@ -0,0 +1,125 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import fakeredis
+import pytest
+from fastapi import HTTPException
+from pydantic import ValidationError
+
+import helpers.login_throttle as throttle
+from core.config import Settings
+from services.auth import AuthService
+
+
+class CountingRedis(fakeredis.FakeAsyncRedis):
+    """fakeredis running the real RECORD_FAILURE_LUA; counts script calls and pipelines."""
+
+    def __init__(self):
+        super().__init__(decode_responses=True)
+        self.scripts = 0
+        self.pipelines = 0
+
+    def register_script(self, lua):
+        script = super().register_script(lua)
+
+        async def run(keys=(), args=(), client=None):
+            self.scripts += 1
+            return await script(keys=keys, args=args, client=client)
+
+        return run
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        self.pipelines += 1
+        return super().pipeline(transaction, shard_hint)
+
+
+@pytest.fixture
+def throttle_settings(monkeypatch):
+    for name, value in {
+        "login_throttle_enabled": True,
+        "login_throttle_free_attempts": 3,
+        "login_throttle_account_free_attempts": 6,
+        "login_throttle_base_delay_sec": 2,
+        "login_throttle_max_delay_sec": 10,
+        "login_throttle_window_sec": 60,
+    }.items():
+        monkeypatch.setattr(throttle.settings, name, value)
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_failures_lock_the_client_with_exponential_backoff(throttle_settings):
+    redis = CountingRedis()
+
+    delays = [await throttle.record_login_failure(redis, " Alice ", "10.0.0.1") for _ in range(5)]
+    assert delays == [0, 0, 0, 2, 4]
+    assert await redis.ttl("login_lock_ip:10.0.0.1:alice") == 4
+    assert await redis.ttl("login_fail_ip:10.0.0.1:alice") == 60  # never shorter than the lock
+    assert not await redis.exists("login_lock:alice")  # account threshold not reached
+
+    with pytest.raises(HTTPException) as e:
+        await throttle.check_login_throttle(redis, "alice", "10.0.0.1")  # normalized
+    assert e.value.status_code == 429
+    assert e.value.headers["Retry-After"] == "4"
+    # the owner logging in from elsewhere is not locked out
+    assert await throttle.check_login_throttle(redis, "alice", "10.0.0.2") == 5
+
+    await redis.pexpire("login_lock_ip:10.0.0.1:alice", 1)
+    await asyncio.sleep(0.01)
+    assert await throttle.check_login_throttle(redis, "ALICE", "10.0.0.1") == 5  # lock expired
+    await throttle.reset_login_failures(redis, "alice", "10.0.0.1")
+    assert await throttle.check_login_throttle(redis, "alice", "10.0.0.1") == 0
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_failures_from_many_clients_lock_the_account(throttle_settings):
+    redis = CountingRedis()
+
+    # one failure per IP never locks a client, but the account-wide count does
+    delays = [
+        await throttle.record_login_failure(redis, "alice", f"10.0.0.{i}") for i in range(10)
+    ]
+    assert delays == [0, 0, 0, 0, 0, 0, 2, 4, 8, 10]  # capped at max delay
+    assert await redis.ttl("login_lock:alice") == 10
+    assert await redis.ttl("login_fail:alice") == 60
+
+    with pytest.raises(HTTPException) as e:
+        await throttle.check_login_throttle(redis, "alice", "192.168.1.1")  # any client
+    assert e.value.headers["Retry-After"] == "10"
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_locked_username_is_rejected_before_db_and_hashing(throttle_settings, monkeypatch):
+    redis = CountingRedis()
+    repo = SimpleNamespace(session=None, get_by_username=AsyncMock(return_value=None))
+    svc = AuthService(repo=repo, redis=redis)
+
+    for _ in range(4):  # unknown user: counted like a wrong password
+        assert await svc.authenticate_user("mallory-target", "guess") is None
+    assert repo.get_by_username.await_count == 4
+
+    redis.scripts = redis.pipelines = 0
+    with pytest.raises(HTTPException) as e:
+        await svc.authenticate_user("mallory-target", "guess")
+    assert e.value.status_code == 429
+    assert repo.get_by_username.await_count == 4  # no DB lookup, no hash
+    assert (redis.pipelines, redis.scripts) == (1, 0)  # one round trip
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    "name",
+    [
+        "login_throttle_free_attempts",
+        "login_throttle_base_delay_sec",
+        "login_throttle_max_delay_sec",
+        "login_throttle_window_sec",
+    ],
+)
+def test_throttle_settings_must_be_positive(name):
+    # a zero delay or window would become `SET ... EX 0`, which Redis rejects (500 on login)
+    with pytest.raises(ValidationError, match=f"{name.upper()} must be > 0"):
+        Settings(**{name: 0})
@@ -0,0 +1,59 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api.v1.metrics import router as metrics_router
+from core.config import settings
+from core.metrics import MetricsRegistry, metrics
+
+
+def test_registry_renders_prometheus_text():
+    registry = MetricsRegistry()
+    registry.counter("requests_total", "Requests").inc(3)
+    registry.gauge("queue_depth", "Queued items", fn=lambda: 7)
+    latency = registry.summary("wait_seconds", "Wait time")
+    latency.observe(0.5)
+    latency.observe(1.5)
+
+    text = registry.render()
+
+    assert "# TYPE requests_total counter\nrequests_total 3\n" in text
+    assert "queue_depth 7\n" in text
+    assert "wait_seconds_count 2\nwait_seconds_sum 2\n" in text
+    assert "wait_seconds_max 1.5\n" in text
+
+
+def test_registry_returns_existing_metric_by_name():
+    registry = MetricsRegistry()
+    assert registry.counter("c_total", "C") is registry.counter("c_total", "C")
+
+
+def make_client():
+    app = FastAPI()
+    app.include_router(metrics_router, prefix="/api/v1")
+    return TestClient(app)
+
+
+def test_metrics_endpoint_exposes_registry(monkeypatch):
+    monkeypatch.setattr(settings, "metrics_secret", "s3cret")
+    metrics.counter("test_endpoint_total", "Endpoint test").inc()
+
+    r = make_client().get("/api/v1/metrics", headers={"Authorization": "Bearer s3cret"})
+
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    assert "test_endpoint_total 1" in r.text
+
+
+@pytest.mark.parametrize(
+    ("secret", "authorization", "status"),
+    [("", "Bearer anything", 503), ("s3cret", None, 401), ("s3cret", "Bearer wrong", 401)],
+)
+def test_metrics_endpoint_requires_the_secret(monkeypatch, secret, authorization, status):
+    monkeypatch.setattr(settings, "metrics_secret", secret)
+    headers = {"Authorization": authorization} if authorization else {}
+
+    r = make_client().get("/api/v1/metrics", headers=headers)
+
+    assert r.status_code == status
+    assert "# TYPE" not in r.text
@@ -90,10 +90,10 @@ async def test_handle_callback_creates_user_when_social_not_found(monkeypatch):
     )
 
     class FakeUserService:
-        async def create_user(self, username: str, email: str, password: str):
+        async def create_user(self, username: str, email: str, password: str | None):
             assert username == "user1"
             assert email == "u@example.com"
-            assert password  # random uuid hex
+            assert password is None  # no local password, nothing hashed
             return created_user
 
     user_service = FakeUserService()
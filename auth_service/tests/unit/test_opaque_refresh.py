@@ -0,0 +1,98 @@
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+from uuid import UUID
+
+import fakeredis
+import pytest
+from fastapi import HTTPException
+
+import helpers.auth_helpers as helpers
+import services.auth as auth_mod
+import utils.jwt as jwt_mod
+from core.keyring import KeyRing, generate_key_pem
+from services.auth import AuthService
+
+USER_ID = UUID("dddddddd-dddd-dddd-dddd-dddddddddddd")
+
+
+@pytest.fixture
+def opaque_mode(tmp_path, monkeypatch):
+    private_pem, public_pem = generate_key_pem("ES256")
+    (tmp_path / "k.key").write_bytes(private_pem)
+    (tmp_path / "k.key.pub").write_bytes(public_pem)
+    ring = KeyRing(
+        str(tmp_path / "k.key"), str(tmp_path / "k.key.pub"), "ES256", reload_interval_sec=0
+    )
+    monkeypatch.setattr(jwt_mod, "keyring", ring)
+    monkeypatch.setattr(helpers.settings, "refresh_token_mode", "opaque")
+
+    user = SimpleNamespace(user_id=USER_ID, email="o@example.com")
+    repo = SimpleNamespace(session=None, get_by_id=AsyncMock(return_value=user))
+    return AuthService(repo=repo, redis=fakeredis.FakeAsyncRedis(decode_responses=True)), user
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_opaque_refresh_is_stored_hashed(opaque_mode):
+    svc, user = opaque_mode
+
+    tokens = await helpers.issue_tokens(user)
+    await helpers.track_refresh_token(svc.redis, user.user_id, tokens.refresh_token)
+
+    assert helpers.is_opaque_token(tokens.refresh_token)
+    assert not helpers.is_opaque_token(tokens.access_token)
+    token_hash = helpers.refresh_token_hash(tokens.refresh_token)
+    assert await svc.redis.keys("refresh:*") == [f"refresh:{token_hash}"]
+    assert await svc.redis.get(f"refresh:{token_hash}") == str(USER_ID)
+    assert await svc.redis.ttl(f"refresh:{token_hash}") == helpers.REFRESH_TOKEN_TTL
+    assert await svc.redis.zrange(f"user_sessions:{USER_ID}", 0, -1) == [f"opaque:{token_hash}"]
+    assert await helpers.lookup_opaque_refresh(svc.redis, tokens.refresh_token) == str(USER_ID)
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_opaque_refresh_rotates_without_signature_checks(opaque_mode, monkeypatch):
+    svc, user = opaque_mode
+    first = await helpers.issue_tokens(user)
+    await helpers.track_refresh_token(svc.redis, user.user_id, first.refresh_token)
+
+    async def no_verify(*_a, **_kw):
+        raise AssertionError("opaque refresh must not verify a JWT")
+
+    monkeypatch.setattr(auth_mod, "verify_refresh_claims", no_verify)
+
+    second = await svc.refresh_by_cookie(first.refresh_token)
+
+    assert helpers.is_opaque_token(second.refresh_token)
+    assert (await jwt_mod.decode_token(second.access_token))["sub"] == str(USER_ID)
+    assert await svc.redis.zrange(f"user_sessions:{USER_ID}", 0, -1) == [
+        f"opaque:{helpers.refresh_token_hash(second.refresh_token)}"
+    ]
+
+    with pytest.raises(HTTPException) as e:
+        await svc.refresh_by_cookie(first.refresh_token)  # already rotated
+    assert e.value.status_code == 401
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_logout_all_revokes_opaque_tokens(opaque_mode):
+    svc, user = opaque_mode
+    for _ in range(3):
+        tokens = await helpers.issue_tokens(user)
+        await helpers.track_refresh_token(svc.redis, user.user_id, tokens.refresh_token)
+
+    await svc.logout_all(user.user_id)
+
+    assert not await svc.redis.exists(f"user_sessions:{USER_ID}")
+    assert await svc.redis.exists(f"user_epoch:{USER_ID}")
+    with pytest.raises(HTTPException) as e:
+        await svc.refresh_by_cookie(tokens.refresh_token)
+    assert e.value.status_code == 401
+    svc.repo.get_by_id.assert_not_awaited()  # rejected before loading the user and signing
+
+    # also after switching back to JWT refresh tokens
+    helpers.settings.refresh_token_mode = "jwt"  # restored by the fixture's monkeypatch
+    with pytest.raises(HTTPException) as e:
+        await svc.refresh_by_cookie(tokens.refresh_token)
+    assert e.value.status_code == 401
@@ -0,0 +1,231 @@
+import asyncio
+
+import fakeredis
+import pytest
+from fastapi import APIRouter, FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+import middleware.authentication as authentication
+import middleware.rate_limit as rate_limit
+from middleware.authentication import AuthenticationMiddleware
+from middleware.local_limiter import LocalRateLimiter
+from middleware.rate_limit import RateLimiterMiddleware, RateRule
+
+
+class CountingRedis(fakeredis.FakeAsyncRedis):
+    """fakeredis running the real rate-limit scripts; counts round trips."""
+
+    def __init__(self, server=None):
+        self.server = server or fakeredis.FakeServer()
+        super().__init__(server=self.server, decode_responses=True)
+        self.round_trips = 0
+
+    def register_script(self, lua):
+        script = super().register_script(lua)
+
+        async def run(keys=(), args=(), client=None):
+            if client is None:  # queued on a pipeline: counted when it executes
+                self.round_trips += 1
+            return await script(keys=keys, args=args, client=client)
+
+        return run
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        self.round_trips += 1
+        return super().pipeline(transaction, shard_hint)
+
+    def snapshot(self) -> fakeredis.FakeRedis:
+        """A sync client on the same data, for assertions outside the app's event loop."""
+        return fakeredis.FakeRedis(server=self.server, decode_responses=True)
+
+
+def make_client(algorithm=None, limit=3, redis=None):
+    app = FastAPI()
+
+    @app.get("/api/v1/ping")
+    async def ping():
+        return {"ok": True}
+
+    @app.get("/api/v1/stream")
+    async def stream():
+        return StreamingResponse(iter([b"a", b"b"]))
+
+    items = APIRouter()
+
+    @items.get("/{item_id}")
+    async def item(item_id: str):
+        return {"id": item_id}
+
+    app.include_router(items, prefix="/api/v1/items")
+
+    rule = RateRule(r"^/api/v1/ping$", limit, 60, algorithm=algorithm)
+    app.add_middleware(RateLimiterMiddleware, rules=[rule])
+    app.state.redis = redis or CountingRedis()
+    return TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def enabled(monkeypatch):
+    monkeypatch.setattr(rate_limit.settings, "testing", False)
+
+
+@pytest.fixture
+def client():
+    return make_client()
+
+
+@pytest.mark.unit
+def test_one_round_trip_per_request_and_429_over_the_limit(client):
+    redis = client.app.state.redis
+
+    remaining = []
+    for _ in range(3):
+        r = client.get("/api/v1/ping")
+        assert r.status_code == 200
+        assert r.headers["X-RateLimit-Limit"] == "3"
+        remaining.append(r.headers["X-RateLimit-Remaining"])
+    assert remaining == ["2", "1", "0"]
+
+    r = client.get("/api/v1/ping")
+    assert r.status_code == 429
+    assert r.headers["X-RateLimit-Remaining"] == "0"
+    assert 0 < int(r.headers["Retry-After"]) <= 60
+    assert redis.round_trips == 4
+    # rejected request is not logged
+    assert redis.snapshot().zcard("rl:3:60:ip:testclient:/api/v1/ping") == 3
+
+
+@pytest.mark.unit
+def test_streaming_responses_pass_through_with_headers(client):
+    r = client.get("/api/v1/stream")
+
+    assert r.content == b"ab"
+    assert r.headers["X-RateLimit-Limit"] == "100"  # default rule
+
+
+@pytest.mark.unit
+def test_keys_use_the_route_template_and_lookups_are_memoized(client):
+    redis = client.app.state.redis
+
+    for i in range(5):
+        client.get(f"/api/v1/items/{i}")
+    r = client.get("/api/v1/items/6")
+    for path in ("/api/v1/nope", "/api/v1/also-nope", "/api/v1/nope"):
+        assert client.get(path).status_code == 404
+
+    assert r.headers["X-RateLimit-Remaining"] == "94"  # one bucket for every item id
+    assert set(redis.snapshot().keys()) == {
+        "rl:100:60:ip:testclient:/api/v1/items/{item_id}",
+        "rl:100:60:ip:testclient:<unmatched>",
+    }
+    middleware = client.app.middleware_stack.app.app
+    assert len(middleware._routes) == 8  # one entry per distinct method + path
+
+
+@pytest.mark.unit
+def test_route_cache_is_bounded():
+    client = make_client()
+    client.get("/api/v1/ping")  # builds the middleware stack
+    middleware = client.app.middleware_stack.app.app
+    middleware.route_cache_size = 3
+
+    for i in range(10):
+        client.get(f"/api/v1/items/{i}")
+
+    assert list(middleware._routes) == [f"GET /api/v1/items/{i}" for i in (7, 8, 9)]
+
+
+@pytest.mark.unit
+def test_authenticated_requests_are_limited_per_user(monkeypatch, client):
+    async def fake_decode(token, *, redis, token_type=None):
+        return {"type": "access", "sub": token}
+
+    monkeypatch.setattr(authentication, "precheck", lambda token, **_kw: None)
+    monkeypatch.setattr(authentication, "decode_token", fake_decode)
+    client.app.add_middleware(AuthenticationMiddleware)  # outer: runs before the limiter
+    redis = client.app.state.redis
+
+    for user in ("alice", "bob", "bob"):
+        client.get("/api/v1/ping", headers={"Authorization": f"Bearer {user}"})
+    client.get("/api/v1/ping")
+
+    data = redis.snapshot()
+    assert {key: data.zcard(key) for key in data.keys()} == {
+        "rl:3:60:user:alice:/api/v1/ping": 1,
+        "rl:3:60:user:bob:/api/v1/ping": 2,
+        "rl:3:60:ip:testclient:/api/v1/ping": 1,
+    }
+
+
+@pytest.mark.unit
+def test_redis_error_does_not_block_requests():
+    server = fakeredis.FakeServer()
+    server.connected = False  # every command raises ConnectionError
+    client = make_client(redis=CountingRedis(server))
+
+    r = client.get("/api/v1/ping")
+
+    assert r.status_code == 200
+    assert "X-RateLimit-Limit" not in r.headers
+
+
+@pytest.mark.unit
+def test_gcra_keeps_one_value_per_key_with_the_same_headers():
+    client = make_client("gcra")
+    redis = client.app.state.redis
+
+    responses = [client.get("/api/v1/ping") for _ in range(4)]
+
+    assert [r.status_code for r in responses] == [200, 200, 200, 429]
+    assert [r.headers["X-RateLimit-Remaining"] for r in responses] == ["2", "1", "0", "0"]
+    assert responses[3].headers["Retry-After"] == "20"  # one slot per window / limit
+    data = redis.snapshot()
+    assert data.keys() == ["rl:gcra:3:60:ip:testclient:/api/v1/ping"]
+    assert data.type("rl:gcra:3:60:ip:testclient:/api/v1/ping") == "string"
+
+
+@pytest.mark.unit
+def test_unknown_algorithm_is_rejected():
+    with pytest.raises(ValueError):
+        RateRule(r".*", 3, 60, algorithm="leaky")
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("algorithm", ["log", "gcra"])
+def test_local_tier_skips_redis_and_bounds_the_overshoot(monkeypatch, algorithm):
+    client = make_client(algorithm, limit=50)
+    redis = client.app.state.redis
+    workers = [LocalRateLimiter(batch=5, sync_ms=250, sync=rate_limit.sync_rate_limits) for _ in range(2)]
+
+    statuses = []
+    for i in range(100):  # two workers, alternating, no background sync in between
+        monkeypatch.setattr(rate_limit, "local_limiter", workers[i % 2])
+        statuses.append(client.get("/api/v1/ping").status_code)
+
+    admitted = statuses.count(200)
+    assert 50 <= admitted <= 50 + 2 * 5  # overshoot <= workers x batch
+    assert statuses[-10:] == [429] * 10
+    assert redis.round_trips < 60  # most requests under the limit never reached Redis
+
+    for worker in workers:  # the sync records whatever is still pending
+        asyncio.run(worker.flush(redis))
+    if algorithm == "log":
+        assert redis.snapshot().zcard("rl:50:60:ip:testclient:/api/v1/ping") == admitted
+
+
+@pytest.mark.unit
+def test_local_tier_counts_requests_still_in_flight():
+    limiter = LocalRateLimiter(batch=2, sync_ms=250, sync=rate_limit.sync_rate_limits)
+    rule = RateRule(r".*", 50, 60)
+    limiter.settle("k", rule, 1, (40, 0))
+
+    assert limiter.admit("k") == (39, 0)
+    assert limiter.take_pending("k") == 1  # exact check sent with 1 pending + itself
+    assert limiter.admit("k") is None  # 2 unconfirmed: no more local admits until it answers
+    limiter.settle("k", rule, 2, (38, 0))
+    assert limiter.admit("k") == (37, 0)
+
+    limiter.take_pending("k")
+    limiter.settle("k", rule, 2, None)  # Redis failed: exact checks until it answers
+    assert limiter.admit("k") is None
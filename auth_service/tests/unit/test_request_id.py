@@ -0,0 +1,41 @@
+import uuid
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from core.logging import request_id_ctx
+from middleware.request_id import RequestIDMiddleware
+
+
+def make_client():
+    app = FastAPI()
+
+    @app.get("/rid")
+    async def rid():
+        return {"request_id": request_id_ctx.get()}
+
+    @app.get("/stream")
+    async def stream():
+        return StreamingResponse(iter([b"a", b"b"]))
+
+    app.add_middleware(RequestIDMiddleware)
+    return TestClient(app)
+
+
+def test_request_id_is_propagated_to_handler_and_response():
+    client = make_client()
+
+    r = client.get("/rid", headers={"X-Request-ID": "rid-1"})
+
+    assert r.json() == {"request_id": "rid-1"}
+    assert r.headers["x-request-id"] == "rid-1"
+
+
+def test_request_id_is_generated_and_set_on_streaming_responses():
+    client = make_client()
+
+    r = client.get("/stream")
+
+    assert r.content == b"ab"
+    assert uuid.UUID(r.headers["x-request-id"])
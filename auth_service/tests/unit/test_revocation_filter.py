@@ -0,0 +1,172 @@
+import asyncio
+
+import pytest
+
+import utils.jwt as jwt_mod
+from utils.revocation_filter import REVOCATION_CHANNEL, BloomFilter, RevocationFilter
+
+
+class FakePubSub:
+    def __init__(self, queue: asyncio.Queue):
+        self.queue = queue
+        self.channels: list[str] = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_exc):
+        return False
+
+    async def subscribe(self, *channels):
+        self.channels.extend(channels)
+
+    async def get_message(self, ignore_subscribe_messages=True, timeout=1.0):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout=0.01)
+        except TimeoutError:
+            return None
+
+
+class FakeRedis:
+    def __init__(self, keys=()):
+        self.keys = set(keys)
+        self.messages: asyncio.Queue = asyncio.Queue()
+        self.mget_keys: list[str] = []
+
+    async def scan_iter(self, match, count):
+        for key in list(self.keys):
+            if key.startswith(match.rstrip("*")):
+                yield key
+
+    def pubsub(self):
+        return FakePubSub(self.messages)
+
+    async def mget(self, keys):
+        self.mget_keys.extend(keys)
+        return ["1" if key in self.keys else None for key in keys]
+
+    def revoke_elsewhere(self, jti):
+        """What another worker's blacklist write looks like from here."""
+        self.keys.add(f"blacklist:{jti}")
+        self.messages.put_nowait({"type": "message", "channel": REVOCATION_CHANNEL, "data": jti})
+
+
+async def revoked(redis, *jtis) -> set[str]:
+    return (await jwt_mod.revocations(redis, list(jtis), []))[0]
+
+
+async def _wait_until(predicate):
+    for _ in range(100):
+        if predicate():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition not reached")
+
+
+@pytest.mark.unit
+def test_bloom_filter_has_no_false_negatives_and_bounded_false_positives():
+    bloom = BloomFilter(capacity=5_000, error_rate=0.01)
+    for i in range(5_000):
+        bloom.add(f"in-{i}")
+
+    assert all(f"in-{i}" in bloom for i in range(5_000))
+    false_positives = sum(f"out-{i}" in bloom for i in range(20_000))
+    assert false_positives / 20_000 < 0.02
+    assert bloom.saturated
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_filter_skips_redis_for_unrevoked_jtis_once_in_sync(monkeypatch):
+    redis = FakeRedis(keys={"blacklist:seeded"})
+    rf = RevocationFilter(1_000, 0.001, name="t_rf_sync", retry_sec=0.01)
+    monkeypatch.setattr(jwt_mod, "revocation_filter", rf)
+
+    # Not in sync yet: every check goes to Redis.
+    assert not await revoked(redis, "fresh")
+    assert redis.mget_keys == ["blacklist:fresh"]
+
+    await rf.start(redis)
+    try:
+        await _wait_until(lambda: rf.ready)
+        redis.mget_keys.clear()
+
+        assert not await revoked(redis, "fresh")
+        assert redis.mget_keys == []  # answered locally
+        assert await revoked(redis, "seeded")
+
+        redis.revoke_elsewhere("published")
+        await _wait_until(lambda: "published" in rf._bloom)
+        assert await revoked(redis, "fresh", "published") == {"published"}
+        assert redis.mget_keys == ["blacklist:seeded", "blacklist:published"]
+    finally:
+        await rf.stop()
+
+    assert not rf.ready
+    assert rf.negatives.value >= 2
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_filter_rebuilds_from_redis_when_saturated():
+    redis = FakeRedis()
+    rf = RevocationFilter(4, 0.01, name="t_rf_full", retry_sec=0.01)
+    await rf.start(redis)
+    try:
+        await _wait_until(lambda: rf.ready)
+        for i in range(4):
+            redis.revoke_elsewhere(f"j{i}")
+        await _wait_until(lambda: rf.rebuilds.value == 2)
+    finally:
+        await rf.stop()
+
+    assert all(f"j{i}" in rf._bloom for i in range(4))
+    assert rf._bloom.capacity == 8  # sized for twice the live keys
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_filter_tracks_user_epochs(monkeypatch):
+    redis = FakeRedis(keys={"user_epoch:u1"})
+    redis.mget = lambda keys: _mget_epochs(keys, {"user_epoch:u1": "100.5"})
+    rf = RevocationFilter(100, 0.01, name="t_rf_epoch", retry_sec=0.01)
+    monkeypatch.setattr(jwt_mod, "revocation_filter", rf)
+    await rf.start(redis)
+    try:
+        await _wait_until(lambda: rf.ready)
+        assert rf.epoch("u1") == 100.5
+
+        redis.messages.put_nowait({"type": "message", "channel": b"user_epoch:events", "data": b"u2 200.25"})
+        await _wait_until(lambda: rf.epoch("u2") is not None)
+
+        # Answered from the filter: no Redis call needed for either user.
+        redis.mget = None
+        assert await jwt_mod.is_token_revoked(redis, {"sub": "u2", "iat": 200.0})
+        assert not await jwt_mod.is_token_revoked(redis, {"sub": "u2", "iat": 200.5})
+        assert not await jwt_mod.is_token_revoked(redis, {"sub": "u3", "iat": 1.0})
+    finally:
+        await rf.stop()
+
+
+async def _mget_epochs(keys, values):
+    return [values.get(key) for key in keys]
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_epochs_are_dropped_once_every_older_token_has_expired():
+    redis = FakeRedis(keys={"user_epoch:old", "user_epoch:new"})
+    redis.mget = lambda keys: _mget_epochs(keys, {"user_epoch:old": "10", "user_epoch:new": "95"})
+    rf = RevocationFilter(100, 0.01, name="t_rf_epoch_ttl", epoch_ttl_sec=50)
+
+    await rf.rebuild(redis)  # seeded at "now" = wall clock: both long expired
+    assert rf._epochs == {}
+
+    for user_id, epoch in (("u1", 100.0), ("u2", 120.0), ("u3", 130.0)):
+        rf.set_epoch(user_id, epoch)
+    rf.set_epoch("u1", 140.0)  # a newer logout-all moves u1 to the back
+
+    rf.prune_epochs(now=175.0)
+    assert rf._epochs == {"u3": 130.0, "u1": 140.0}
+    rf.prune_epochs(now=190.0)
+    assert rf._epochs == {}
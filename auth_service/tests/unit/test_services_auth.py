@@ -1,87 +1,255 @@
+import time
 from types import SimpleNamespace
+from unittest.mock import AsyncMock
 from uuid import UUID
 
+import fakeredis
+import jwt as pyjwt
 import pytest
+from fastapi import HTTPException
 
+import helpers.auth_helpers as helpers
 import services.auth as auth_mod
 from services.auth import AuthService
 
 
-class FakeRedis:
+class CountingRedis(fakeredis.FakeAsyncRedis):
+    """fakeredis running the real Lua scripts; counts script calls and pipelines."""
+
     def __init__(self):
-        self._sets: dict[str, set[object]] = {}
-        self.deleted = set()
+        super().__init__(decode_responses=True)
+        self.scripts = 0
+        self.pipelines = 0
+
+    def register_script(self, lua):
+        script = super().register_script(lua)
+
+        async def run(keys=(), args=(), client=None):
+            self.scripts += 1
+            return await script(keys=keys, args=args, client=client)
+
+        return run
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        self.pipelines += 1
+        return super().pipeline(transaction, shard_hint)
+
+
+async def subscribe(redis, *channels):
+    pubsub = redis.pubsub()
+    await pubsub.subscribe(*channels)
+    await pubsub.get_message(timeout=0)  # subscribe confirmations
+    await pubsub.get_message(timeout=0)
+    return pubsub
 
-    async def sadd(self, key: str, value):
-        self._sets.setdefault(key, set()).add(value)
 
-    async def srem(self, key: str, value):
-        self._sets.setdefault(key, set()).discard(value)
+async def published(pubsub) -> list[tuple[str, str]]:
+    messages = []
+    while (message := await pubsub.get_message(ignore_subscribe_messages=True, timeout=0)):
+        messages.append((message["channel"], message["data"]))
+    return messages
 
-    async def smembers(self, key: str):
-        return self._sets.get(key, set())
 
-    async def delete(self, key: str):
-        self.deleted.add(key)
-        self._sets.pop(key, None)
+def _refresh_jwt(jti: str, exp: float) -> str:
+    """A JWT-shaped refresh token; the session index reads `jti`/`exp` without verifying."""
+    return pyjwt.encode({"jti": jti, "exp": int(exp), "type": "refresh"}, "k" * 32, "HS256")
 
 
 @pytest.mark.asyncio
 async def test_refresh_by_cookie_rotates_and_revokes_old(monkeypatch):
     session = object()
-    repo = SimpleNamespace(session=session)
-    redis = FakeRedis()
-    svc = AuthService(repo=repo, redis=redis)
-
     user_id = UUID("aaaaaaaa-aaaa-aaaa-aaaa-aaaaaaaaaaaa")
-    old_refresh = "old-rt"
+    repo = SimpleNamespace(
+        session=session, get_by_id=AsyncMock(return_value=SimpleNamespace(user_id=user_id))
+    )
+    redis = CountingRedis()
+    svc = AuthService(repo=repo, redis=redis)
 
-    async def fake_validate_refresh(_rt, _session, _redis, _svc):
-        return SimpleNamespace(user_id=user_id)
+    old_refresh = "old.refresh.jwt"
+    payload = {"sub": str(user_id), "jti": "old-jti", "type": "refresh", "exp": time.time() + 60}
+    new_refresh = _refresh_jwt("new-jti", time.time() + 3600)
 
-    async def fake_blacklist(_redis, token):
-        await _redis.sadd("blacklist", token)
+    async def fake_verify_refresh_claims(_rt):
+        return payload
 
-    def fake_issue_tokens(_user):
-        return SimpleNamespace(access_token="new-at", refresh_token="new-rt", token_type="bearer")
+    fake_issue_tokens = AsyncMock(
+        return_value=SimpleNamespace(
+            access_token="new.access.jwt", refresh_token=new_refresh, token_type="bearer"
+        )
+    )
 
-    monkeypatch.setattr(auth_mod, "validate_refresh", fake_validate_refresh)
-    monkeypatch.setattr(auth_mod, "blacklist_token", fake_blacklist)
+    monkeypatch.setattr(auth_mod, "verify_refresh_claims", fake_verify_refresh_claims)
     monkeypatch.setattr(auth_mod, "issue_tokens", fake_issue_tokens)
 
-    # pre-track old token
-    await redis.sadd(f"user_refresh:{user_id}", old_refresh)
+    # pre-index the old session, plus one that has already expired
+    index_key = f"user_sessions:{user_id}"
+    await redis.zadd(index_key, {"old-jti": payload["exp"], "expired-jti": time.time() - 1})
 
     tokens = await svc.refresh_by_cookie(old_refresh)
 
-    # old revoked
-    assert "old-rt" in await redis.smembers("blacklist")
-    assert old_refresh not in await redis.smembers(f"user_refresh:{user_id}")
+    # old revoked, in the same script call that swapped the indexed sessions
+    assert redis.scripts == 1
+    assert await redis.get("blacklist:old-jti") == "1"
 
-    # new tracked
-    assert "new-rt" in await redis.smembers(f"user_refresh:{user_id}")
-    assert tokens.refresh_token == "new-rt"
+    # only the new session is left: indexed by jti, scored by its expiry
+    assert await redis.zrange(index_key, 0, -1, withscores=True) == [
+        ("new-jti", helpers.session_member(new_refresh)[1])
+    ]
+    assert tokens.refresh_token == new_refresh
+
+    # replaying the old refresh token is rejected before the user is loaded or tokens signed
+    repo.get_by_id.reset_mock()
+    fake_issue_tokens.reset_mock()
+    with pytest.raises(HTTPException) as e:
+        await svc.refresh_by_cookie(old_refresh)
+    assert e.value.status_code == 401
+    repo.get_by_id.assert_not_awaited()
+    fake_issue_tokens.assert_not_awaited()
 
 
 @pytest.mark.asyncio
-async def test_logout_all_decodes_bytes(monkeypatch):
-    session = object()
-    repo = SimpleNamespace(session=session)
-    redis = FakeRedis()
+async def test_track_evicts_and_revokes_oldest_sessions(monkeypatch):
+    user_id = UUID("eeeeeeee-eeee-eeee-eeee-eeeeeeeeeeee")
+    redis = CountingRedis()
+    pubsub = await subscribe(redis, "blacklist:events")
+    monkeypatch.setattr(helpers.settings, "max_sessions_per_user", 2)
+
+    now = time.time()
+    for i in range(4):
+        await helpers.track_refresh_token(redis, user_id, _refresh_jwt(f"j{i}", now + 100 + i))
+
+    # the two sessions closest to expiry are gone from the index and blacklisted
+    assert await redis.zrange(f"user_sessions:{user_id}", 0, -1) == ["j2", "j3"]
+    assert await redis.mget("blacklist:j0", "blacklist:j1") == ["1", "1"]
+    assert await published(pubsub) == [("blacklist:events", "j0"), ("blacklist:events", "j1")]
+
+
+@pytest.mark.asyncio
+async def test_logout_all_is_one_write_however_many_sessions():
+    repo = SimpleNamespace(session=object())
+    redis = CountingRedis()
+    pubsub = await subscribe(redis, "user_epoch:events")
     svc = AuthService(repo=repo, redis=redis)
 
     user_id = UUID("bbbbbbbb-bbbb-bbbb-bbbb-bbbbbbbbbbbb")
-    await redis.sadd(f"user_refresh:{user_id}", b"t1")
-    await redis.sadd(f"user_refresh:{user_id}", "t2")
+    await redis.zadd(f"user_sessions:{user_id}", {f"j{i}": 9e9 for i in range(500)})
+    await redis.sadd(f"user_refresh:{user_id}", "legacy.refresh.jwt")
+    redis.pipelines = 0
 
-    async def fake_blacklist(_redis, token):
-        await _redis.sadd("blacklist", token)
+    before = time.time()
+    await svc.logout_all(user_id)
 
-    monkeypatch.setattr(auth_mod, "blacklist_token", fake_blacklist)
+    assert redis.pipelines == 1
+    assert redis.scripts == 0
+    assert await redis.exists(f"user_sessions:{user_id}", f"user_refresh:{user_id}") == 0
+    epoch = float(await redis.get(f"user_epoch:{user_id}"))
+    assert epoch >= round(before, 3)
+    assert await published(pubsub) == [("user_epoch:events", f"{user_id} {epoch}")]
+
+    # a refresh token issued before the epoch can no longer be rotated
+    async def old_claims(_rt):
+        return {"sub": str(user_id), "jti": "j", "type": "refresh", "iat": epoch - 1, "exp": 9e9}
+
+    fake_issue_tokens = AsyncMock()
+    repo.get_by_id = AsyncMock(return_value=SimpleNamespace(user_id=user_id))
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(auth_mod, "verify_refresh_claims", old_claims)
+        mp.setattr(auth_mod, "issue_tokens", fake_issue_tokens)
+        with pytest.raises(HTTPException) as e:
+            await svc.refresh_by_cookie("o.l.d")
+    assert e.value.status_code == 401
+    repo.get_by_id.assert_not_awaited()
+    fake_issue_tokens.assert_not_awaited()
 
-    await svc.logout_all(user_id)
 
-    bl = await redis.smembers("blacklist")
-    assert "t1" in bl
-    assert "t2" in bl
-    assert f"user_refresh:{user_id}" in redis.deleted
+@pytest.mark.asyncio
+async def test_authz_claims_embed_roles_and_version(monkeypatch):
+    user = SimpleNamespace(user_id=UUID("cccccccc-cccc-cccc-cccc-cccccccccccc"))
+
+    async def get_user_roles(_user_id):
+        return ["viewer", "admin"]
+
+    class VersionRedis:
+        async def get(self, key):
+            assert key == f"authz_ver:{user.user_id}"
+            return b"3"
+
+    svc = AuthService(repo=SimpleNamespace(get_user_roles=get_user_roles), redis=VersionRedis())
+
+    monkeypatch.setattr(auth_mod.settings, "jwt_embed_roles", False)
+    assert await svc.authz_claims(user) == {}
+
+    monkeypatch.setattr(auth_mod.settings, "jwt_embed_roles", True)
+    assert await svc.authz_claims(user) == {"roles": ["admin", "viewer"], "authz_ver": 3}
+
+
+@pytest.mark.asyncio
+async def test_authz_version_is_never_reused():
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    user_id = UUID("cccccccc-cccc-cccc-cccc-cccccccccccc")
+
+    await helpers.bump_authz_version(redis, user_id)
+    issued = await helpers.get_authz_version(redis, user_id)  # carried by an admin's token
+
+    # long after that token's issue (no TTL to run out), a role is revoked
+    assert await redis.ttl(f"authz_ver:{user_id}") == -1
+    await helpers.bump_authz_version(redis, user_id)
+
+    assert await helpers.get_authz_version(redis, user_id) != issued
+
+
+@pytest.mark.asyncio
+async def test_login_rehashes_outdated_password_hash(monkeypatch):
+    import utils.security as security
+
+    old = security.make_context(["bcrypt"], bcrypt_rounds=4)
+    new = security.make_context(["argon2", "bcrypt"], bcrypt_rounds=4, argon2_memory_cost=1024)
+    monkeypatch.setattr(security, "pwd_context", new)
+    inline = security.BoundedExecutor("t_pw_rehash", "inline")
+    monkeypatch.setattr(security, "password_executor", inline)
+    tokens = SimpleNamespace(refresh_token="r.e.f")
+    monkeypatch.setattr(auth_mod, "issue_tokens", AsyncMock(return_value=tokens))
+    monkeypatch.setattr(auth_mod, "track_refresh_token", AsyncMock())
+
+    user = SimpleNamespace(user_id="u1", hashed_password=old.hash("s3cret"))
+    session = SimpleNamespace(commit=AsyncMock())
+    repo = SimpleNamespace(session=session, get_by_username=AsyncMock(return_value=user))
+    svc = AuthService(repo=repo, redis=None)
+
+    assert await svc.authenticate_user("alice", "wrong") is None
+    assert user.hashed_password.startswith("$2b$04$")
+    session.commit.assert_not_awaited()
+
+    assert await svc.authenticate_user("alice", "s3cret") == {"user": user, "tokens": tokens}
+    assert user.hashed_password.startswith("$argon2id$")
+    session.commit.assert_awaited_once()
+
+    # already current: verified, not rewritten
+    await svc.authenticate_user("alice", "s3cret")
+    session.commit.assert_awaited_once()
+
+
+@pytest.mark.parametrize(("stored", "configured"), [(4, 5), (5, 4)], ids=["raised", "lowered"])
+def test_bcrypt_cost_changes_rehash_either_way(stored, configured):
+    import utils.security as security
+
+    stored_hash = security.make_context(["bcrypt"], bcrypt_rounds=stored).hash("s3cret")
+    context = security.make_context(["bcrypt"], bcrypt_rounds=configured)
+
+    assert context.needs_update(stored_hash)
+    assert not context.needs_update(context.hash("s3cret"))
+
+
+@pytest.mark.asyncio
+async def test_login_refuses_accounts_without_local_password(monkeypatch):
+    import utils.security as security
+
+    class NoExecutor:
+        async def run(self, *_a):
+            raise AssertionError("no hashing work for an unusable password")
+
+    monkeypatch.setattr(security, "password_executor", NoExecutor())
+    user = SimpleNamespace(user_id="u1", hashed_password=security.UNUSABLE_PASSWORD)
+    repo = SimpleNamespace(session=None, get_by_username=AsyncMock(return_value=user))
+
+    assert await AuthService(repo=repo, redis=None).authenticate_user("social", "!") is None
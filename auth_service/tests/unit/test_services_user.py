@@ -3,7 +3,9 @@ from types import SimpleNamespace
 import pytest
 from fastapi import HTTPException
 
+import services.user as user_mod
 from services.user import UserService
+from utils.security import UNUSABLE_PASSWORD
 
 
 class FakeResult:
@@ -86,6 +88,32 @@ async def test_create_user_rejects_duplicate_username():
     assert "Username already taken" in e.value.detail
 
 
+@pytest.mark.asyncio
+async def test_create_user_without_password_skips_hashing(monkeypatch):
+    session = FakeSession()
+
+    async def not_found(_value):
+        return None
+
+    async def no_hashing(_password):
+        raise AssertionError("no password, nothing to hash")
+
+    monkeypatch.setattr(user_mod, "hash_password_async", no_hashing)
+    repo = SimpleNamespace(session=session, get_by_email=not_found, get_by_username=not_found)
+    svc = UserService(repo=repo, redis=None)
+
+    user = await svc.create_user("social", "s@example.com", password=None)
+
+    assert user.hashed_password == UNUSABLE_PASSWORD
+    assert session.committed
+
+    # and it cannot be "changed" with a guessed old password either
+    update = SimpleNamespace(username=None, old_password="!", new_password="new-pass")
+    with pytest.raises(HTTPException) as e:
+        await svc.update_user(current_user=user, update=update)
+    assert e.value.detail == "Wrong password"
+
+
 @pytest.mark.asyncio
 async def test_update_user_rejects_when_no_changes():
     session = FakeSession(execute_value=None)
@@ -0,0 +1,179 @@
+import json
+import time
+from datetime import timedelta
+
+import pytest
+from fastapi import HTTPException
+from jwt.utils import base64url_decode, base64url_encode
+
+import utils.jwt as jwt_mod
+from core.keyring import KeyRing, generate_key_pem
+from utils.token_cache import RejectedTokenCache, VerifiedTokenCache
+
+
+@pytest.mark.unit
+def test_cache_hit_miss_and_lru_eviction():
+    cache = VerifiedTokenCache(max_size=2, name="t_lru")  # unique name -> fresh counters
+    exp = time.time() + 60
+
+    cache.put("a", {"sub": "a", "exp": exp})
+    cache.put("b", {"sub": "b", "exp": exp})
+    assert cache.get("a")["sub"] == "a"  # "a" becomes most recently used
+
+    cache.put("c", {"sub": "c", "exp": exp})
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.evictions.value == 1
+    assert cache.hits.value == 3
+    assert cache.misses.value == 1
+
+
+@pytest.mark.unit
+def test_cache_drops_expired_entries():
+    cache = VerifiedTokenCache(max_size=10, name="t_exp")
+    cache.put("past", {"exp": time.time() - 1})
+    cache.put("soon", {"exp": time.time() + 0.01})
+    assert len(cache) == 1
+
+    time.sleep(0.02)
+
+    assert cache.get("soon") is None
+    assert cache.expirations.value == 1
+    assert len(cache) == 0
+
+
+@pytest.mark.unit
+def test_cache_disabled_when_size_zero():
+    cache = VerifiedTokenCache(max_size=0, name="t_off")
+    cache.put("a", {"exp": time.time() + 60})
+    assert cache.get("a") is None
+
+
+@pytest.fixture
+def ring(tmp_path, monkeypatch):
+    private_pem, public_pem = generate_key_pem("RS256")
+    (tmp_path / "k.key").write_bytes(private_pem)
+    (tmp_path / "k.key.pub").write_bytes(public_pem)
+    ring = KeyRing(str(tmp_path / "k.key"), str(tmp_path / "k.key.pub"), "RS256", reload_interval_sec=0)
+    monkeypatch.setattr(jwt_mod, "keyring", ring)
+    monkeypatch.setattr(jwt_mod, "verified_tokens", VerifiedTokenCache(100, name="t_decode"))
+    monkeypatch.setattr(jwt_mod, "rejected_tokens", RejectedTokenCache(100, 60, name="t_reject"))
+    return ring
+
+
+@pytest.mark.asyncio
+async def test_decode_token_skips_crypto_on_hit_but_still_checks_revocation(ring, monkeypatch):
+    token = jwt_mod.create_access_token({"sub": "u1"})
+    assert (await jwt_mod.decode_token(token))["sub"] == "u1"
+
+    def no_crypto(*_a, **_kw):
+        raise AssertionError("signature must not be re-verified")
+
+    monkeypatch.setattr(jwt_mod, "_decode_with_key", no_crypto)
+    assert (await jwt_mod.decode_token(token))["sub"] == "u1"
+
+    class RevokedRedis:
+        async def mget(self, keys):
+            return ["1" for _ in keys]
+
+    with pytest.raises(HTTPException) as e:
+        await jwt_mod.decode_token(token, RevokedRedis())
+    assert e.value.detail == "Token revoked"
+
+
+@pytest.mark.asyncio
+async def test_cache_is_flushed_when_key_set_changes(ring):
+    token = jwt_mod.create_token({"sub": "u1"}, timedelta(minutes=1), "access")
+    await jwt_mod.decode_token(token)
+    assert len(jwt_mod.verified_tokens) == 1
+    misses = jwt_mod.verified_tokens.misses.value
+
+    ring.load()
+    await jwt_mod.verify(token)
+
+    # Counters live in the process-wide registry, so compare deltas.
+    assert jwt_mod.verified_tokens.misses.value == misses + 1
+
+
+@pytest.mark.unit
+def test_rejected_cache_expires_and_stays_bounded():
+    cache = RejectedTokenCache(max_size=2, ttl_sec=0.01, name="t_rej_lru")
+    cache.add("a")
+    cache.add("b")
+    cache.add("c")
+    assert len(cache) == 2
+    assert "a" not in cache
+    assert "c" in cache
+
+    time.sleep(0.02)
+
+    assert "c" not in cache
+    assert cache.hits.value == 1
+
+
+def _swap_alg(token: str, alg, **extra) -> str:
+    header, payload, signature = token.split(".")
+    claims = json.loads(base64url_decode(header))
+    claims.update(alg=alg, **extra)
+    return ".".join([base64url_encode(json.dumps(claims).encode()).decode(), payload, signature])
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "make_token",
+    [
+        lambda: "not-a-jwt",
+        lambda: "e30.e30.sig",  # empty header: no kid, no alg
+        lambda: jwt_mod.create_token({"sub": "u1"}, timedelta(seconds=-1), "access"),
+        lambda: jwt_mod.create_refresh_token({"sub": "u1"}),  # access expected
+        lambda: _swap_alg(jwt_mod.create_access_token({"sub": "u1"}), "HS256"),
+        lambda: _swap_alg(jwt_mod.create_access_token({"sub": "u1"}), "RS256", kid=["x"]),
+        lambda: _swap_alg(jwt_mod.create_access_token({"sub": "u1"}), {"x": 1}),
+    ],
+    ids=["malformed", "no-alg", "expired", "wrong-type", "alg-swap", "list-kid", "dict-alg"],
+)
+async def test_precheck_rejects_without_crypto(ring, monkeypatch, make_token):
+    token = make_token()
+
+    def no_crypto(*_a, **_kw):
+        raise AssertionError("signature must not be verified")
+
+    monkeypatch.setattr(jwt_mod, "_decode_with_key", no_crypto)
+    with pytest.raises(HTTPException) as e:
+        await jwt_mod.decode_token(token, token_type="access")
+    assert e.value.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_non_string_kid_is_inactive_in_a_batch(ring):
+    valid = jwt_mod.create_access_token({"sub": "u1"})
+    bad_kid = _swap_alg(valid, "RS256", kid=["x"])
+
+    results = await jwt_mod.introspect_tokens([bad_kid, valid])
+
+    assert results[0] is None
+    assert results[1]["sub"] == "u1"
+
+
+@pytest.mark.asyncio
+async def test_forged_signature_is_verified_once(ring, monkeypatch):
+    header, payload, signature = jwt_mod.create_access_token({"sub": "u1"}).split(".")
+    forged = f"{header}.{payload}.{signature[::-1]}"
+    calls = 0
+    real_decode = jwt_mod._decode_with_key
+
+    def counting_decode(*args):
+        nonlocal calls
+        calls += 1
+        return real_decode(*args)
+
+    monkeypatch.setattr(jwt_mod, "_decode_with_key", counting_decode)
+    for _ in range(3):
+        with pytest.raises(HTTPException) as e:
+            await jwt_mod.decode_token(forged)
+        assert e.value.detail == "Invalid token"
+
+    assert calls == 1
+    assert jwt_mod.rejected_tokens.hits.value == 2
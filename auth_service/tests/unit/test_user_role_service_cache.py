@@ -48,6 +48,22 @@ async def test_assign_role_to_user_updates_redis_cache(monkeypatch):
         async def sadd(self, key, *values):
             self.calls.append(("sadd", key, values))
 
+        def pipeline(self, transaction=True):
+            return FakePipeline(self.calls)
+
+    class FakePipeline:
+        def __init__(self, calls):
+            self.calls = calls
+
+        def incr(self, key):
+            self.calls.append(("incr", key))
+
+        def expire(self, key, ttl):
+            self.calls.append(("expire", key, ttl))
+
+        async def execute(self):
+            return []
+
     redis = FakeRedis()
     svc = UserRoleService(repo=repo, redis=redis)
 
@@ -58,6 +74,8 @@ async def test_assign_role_to_user_updates_redis_cache(monkeypatch):
     assert redis.calls[1][0] == "sadd"
     assert redis.calls[1][1] == f"user_roles:{user_id}"
     assert set(redis.calls[1][2]) == {"admin", "viewer"}
+    # stale role claims in issued access tokens are invalidated
+    assert redis.calls[2] == ("incr", f"authz_ver:{user_id}")
 
 
 @pytest.mark.asyncio